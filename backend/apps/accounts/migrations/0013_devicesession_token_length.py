@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 02:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0012_set_group_invites_off'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='devicesession',
+            name='token',
+            field=models.CharField(max_length=1024, unique=True),
+        ),
+    ]
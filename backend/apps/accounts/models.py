@@ -93,7 +93,8 @@ class DeviceSession(models.Model):
     device_type = models.CharField(max_length=20)
     device_name = models.CharField(max_length=100, blank=True)
     ip_address = models.GenericIPAddressField(blank=True, null=True)
-    token = models.CharField(max_length=255, unique=True)
+    # login access JWT; its sid and display-name claims run past 255 chars
+    token = models.CharField(max_length=1024, unique=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     last_active = models.DateTimeField(auto_now=True)
@@ -4,9 +4,11 @@
 # ===============================================================
 from django.contrib.auth import get_user_model
 from rest_framework import serializers
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.tokens import RefreshToken
 
-from .utils import record_device_session
+from .utils import record_device_session, session_revoked
 
 
 class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -31,6 +33,17 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
         # Password must still be required
         self.fields["password"].required = True
 
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        # lets WebSocket auth build its principal without a user lookup
+        token["username"] = user.username
+        token["name"] = user.get_full_name()
+        # copied into every access token refreshed from this one; revoking
+        # the session revokes them all
+        token["sid"] = token["jti"]
+        return token
+
     def validate(self, attrs):
         User = get_user_model()
         username_field = User.USERNAME_FIELD  # likely "email" in your project
@@ -77,3 +90,13 @@ class CustomTokenObtainPairSerializer(TokenObtainPairSerializer):
             "email": getattr(self.user, "email", ""),
         }
         return data
+
+
+class CustomTokenRefreshSerializer(TokenRefreshSerializer):
+    """Refuses to refresh a session revoked from the sessions list."""
+
+    def validate(self, attrs):
+        sid = RefreshToken(attrs["refresh"]).get("sid")
+        if session_revoked(sid):
+            raise InvalidToken("Session has been revoked.")
+        return super().validate(attrs)
@@ -1,6 +1,5 @@
 # backend/apps/accounts/urls.py
 from django.urls import path
-from rest_framework_simplejwt.views import TokenRefreshView
 from .views import (
     RegisterView,
     MeView,
@@ -20,7 +19,7 @@ from .twofa import (
     PasswordResetVerifyView,
     PasswordResetCompleteView,
 )
-from .views_jwt import CustomTokenObtainPairView
+from .views_jwt import CustomTokenObtainPairView, CustomTokenRefreshView
 
 urlpatterns = [
     # Auth
@@ -29,7 +28,7 @@ urlpatterns = [
     path("register/verify/", RegisterVerifyView.as_view(), name="register-verify"),
     path("register/complete/", RegisterCompleteView.as_view(), name="register-complete"),
     path("token/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("token/refresh/", CustomTokenRefreshView.as_view(), name="token_refresh"),
 
     # Profile
     path("me/", MeView.as_view(), name="me"),
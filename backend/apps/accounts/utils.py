@@ -3,8 +3,12 @@ from __future__ import annotations
 from typing import Optional, Tuple
 
 from django.utils import timezone
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.conf import settings
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings as jwt_settings
+from rest_framework_simplejwt.tokens import AccessToken
 
 from .models import DeviceSession
 
@@ -83,3 +87,68 @@ def record_device_session(user, request=None, token: Optional[str] = None) -> Tu
                 pass
 
     return session, created
+
+
+# ---------------------------------------------------------------
+# Access-token revocation
+# JWTs are stateless, so revoked tokens are remembered in the cache until
+# they would have expired anyway. Long-lived WebSocket sessions check this.
+# A login's refresh token and every access token minted from it share a
+# "sid" claim, so revoking a session covers tokens refreshed after login.
+# ---------------------------------------------------------------
+def _revoked_token_key(jti) -> str:
+    return f"auth:revoked:{jti}"
+
+
+def _revoked_session_key(sid) -> str:
+    return f"auth:revoked-session:{sid}"
+
+
+def _revoked_before_key(user_id) -> str:
+    return f"auth:revoked-before:{user_id}"
+
+
+def revoke_access_token(token) -> None:
+    """Revoke one issued access token (e.g. a DeviceSession's token)."""
+    try:
+        claims = AccessToken(str(token), verify=False)
+    except TokenError:
+        return
+    remaining = int(claims.get("exp", 0) - timezone.now().timestamp())
+    if claims.get("jti") and remaining > 0:
+        cache.set(_revoked_token_key(claims["jti"]), 1, remaining)
+
+
+def revoke_session(token) -> None:
+    """Revoke a DeviceSession's login: its token and every refresh of it."""
+    revoke_access_token(token)
+    try:
+        sid = AccessToken(str(token), verify=False).get("sid")
+    except TokenError:
+        return
+    if sid:
+        # no token of the login outlives its refresh token plus one access lifetime
+        lifetime = jwt_settings.REFRESH_TOKEN_LIFETIME + jwt_settings.ACCESS_TOKEN_LIFETIME
+        cache.set(_revoked_session_key(sid), 1, int(lifetime.total_seconds()))
+
+
+def session_revoked(sid) -> bool:
+    return bool(sid) and bool(cache.get(_revoked_session_key(sid)))
+
+
+def revoke_user_tokens(user_id) -> None:
+    """Revoke every access token issued to a user so far."""
+    lifetime = int(jwt_settings.ACCESS_TOKEN_LIFETIME.total_seconds())
+    cache.set(_revoked_before_key(user_id), int(timezone.now().timestamp()), lifetime)
+
+
+async def token_revoked(jti, user_id, issued_at, session_id=None) -> bool:
+    """True if the token, its session or all of the user's tokens were revoked."""
+    keys = [_revoked_token_key(jti), _revoked_before_key(user_id)]
+    if session_id:
+        keys.append(_revoked_session_key(session_id))
+    found = await cache.aget_many(keys)
+    if found.get(_revoked_token_key(jti)) or (session_id and found.get(_revoked_session_key(session_id))):
+        return True
+    cutoff = found.get(_revoked_before_key(user_id))
+    return cutoff is not None and (issued_at or 0) <= cutoff
@@ -15,6 +15,7 @@ from .serializers import (
     DeviceSessionSerializer,
 )
 from .models import DeviceSession
+from .utils import revoke_session
 
 User = get_user_model()
 
@@ -118,6 +119,7 @@ class SessionsView(APIView):
             return Response(status=status.HTTP_404_NOT_FOUND)
         sess.is_active = False
         sess.mark_offline()
+        revoke_session(sess.token)
         return Response(status=status.HTTP_204_NO_CONTENT)
 
 
@@ -126,7 +128,10 @@ class LogoutAllView(APIView):
 
     def post(self, request):
         current_token = (request.META.get("HTTP_AUTHORIZATION") or "")[7:]  # strip "Bearer "
-        DeviceSession.objects.filter(user=request.user, is_active=True).exclude(token=current_token).update(is_active=False)
+        others = DeviceSession.objects.filter(user=request.user, is_active=True).exclude(token=current_token)
+        for token in others.values_list("token", flat=True):
+            revoke_session(token)
+        others.update(is_active=False)
         return Response({"detail": "Logged out from all other devices."}, status=status.HTTP_200_OK)
 
 
@@ -1,10 +1,14 @@
 # ===============================================================
 # backend/apps/accounts/views_jwt.py
-# Custom JWT View using our flexible serializer
+# Custom JWT views: flexible login, refresh that honours revoked sessions
 # ===============================================================
-from rest_framework_simplejwt.views import TokenObtainPairView
-from .serializers_jwt import CustomTokenObtainPairSerializer
+from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
+from .serializers_jwt import CustomTokenObtainPairSerializer, CustomTokenRefreshSerializer
 
 
 class CustomTokenObtainPairView(TokenObtainPairView):
     serializer_class = CustomTokenObtainPairSerializer
+
+
+class CustomTokenRefreshView(TokenRefreshView):
+    serializer_class = CustomTokenRefreshSerializer
@@ -1,10 +1,13 @@
 from __future__ import annotations
 
+import hmac
 from typing import Iterable
 
+from django.conf import settings
 from rest_framework.permissions import BasePermission
 
 ADMIN_PERMISSION_HEADER = "X-Tuchati-Admin-Permission"
+METRICS_TOKEN_HEADER = "X-Metrics-Token"
 
 
 class AdminPermission:
@@ -76,3 +79,15 @@ class HasAdminPermission(BasePermission):
                 return request.user.is_authenticated and request.user.is_staff
             return user_has_permission(request.user, header_permission)
         return user_has_permission(request.user, permission)
+
+
+class HasMetricsToken(BasePermission):
+    """
+    Lets a scraper without a user session read metrics when
+    CHAT_METRICS_TOKEN is configured and sent in the X-Metrics-Token header.
+    """
+
+    def has_permission(self, request, view):
+        expected = getattr(settings, "CHAT_METRICS_TOKEN", "")
+        supplied = request.headers.get(METRICS_TOKEN_HEADER, "")
+        return bool(expected) and hmac.compare_digest(expected.encode(), supplied.encode())
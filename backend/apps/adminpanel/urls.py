@@ -6,6 +6,7 @@ from .views import (
     AuditEventViewSet,
     AdminUserViewSet,
     MetricsView,
+    ChatMetricsTextView,
 )
 
 router = DefaultRouter()
@@ -16,4 +17,5 @@ router.register(r"users", AdminUserViewSet, basename="admin-users")
 urlpatterns = [
     path("", include(router.urls)),
     path("metrics/", MetricsView.as_view(), name="admin-metrics"),
+    path("metrics/chat.txt", ChatMetricsTextView.as_view(), name="admin-metrics-chat"),
 ]
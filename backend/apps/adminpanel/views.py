@@ -1,5 +1,6 @@
 from django.contrib.auth import get_user_model
 from django.db.models import Count, Q
+from django.http import HttpResponse
 from django.utils import timezone
 from rest_framework import viewsets, mixins
 from rest_framework.decorators import action
@@ -11,8 +12,10 @@ from rest_framework.filters import OrderingFilter, SearchFilter
 from rest_framework.exceptions import PermissionDenied
 
 from apps.chat.models import ChatRoom
+from apps.chat.metrics import metrics_snapshot, render_text
+from apps.chat.outbound import outbound_stats
 from .models import Role, AuditEvent
-from .permissions import AdminPermission, HasAdminPermission
+from .permissions import AdminPermission, HasAdminPermission, HasMetricsToken
 from .serializers import (
     RoleSerializer,
     RoleUpdateSerializer,
@@ -200,5 +203,18 @@ class MetricsView(APIView):
                 "recent_events": recent_events,
                 "top_roles": top_roles,
                 "latest_users": latest_users,
+                # socket tier of the worker serving this request
+                "websocket": outbound_stats(),
+                "chat": metrics_snapshot(),
             }
         )
+
+
+class ChatMetricsTextView(APIView):
+    """Chat socket metrics of this worker in Prometheus text format."""
+
+    permission_classes = [HasMetricsToken | (IsAuthenticated & HasAdminPermission)]
+    permission_required = AdminPermission.VIEW_HEALTH
+
+    def get(self, request):
+        return HttpResponse(render_text(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,77 @@
+# ================================================================
+# backend/apps/chat/activity.py
+# Denormalized room-list columns on ChatRoom
+# - last_message / last_activity_at move forward on message create
+#   (post_save, plus ingest.py for bulk inserts)
+# - recomputed when the last message is deleted
+# - member_count follows ChatRoom.participants (signals.py)
+# - every change moves changed_at, and rooms leaving a user's list leave
+#   a RoomTombstone, for GET /api/chat/rooms/sync/?since=
+# ================================================================
+from django.db.models import F, Q
+from django.utils import timezone
+
+from apps.chat.models import ChatRoom, Message, RoomTombstone
+
+
+def record_messages(messages) -> None:
+    """Point each room at the newest of the given (saved) messages."""
+    newest = {}
+    for msg in messages:
+        current = newest.get(msg.room_id)
+        if current is None or (msg.created_at, str(msg.id)) > (current.created_at, str(current.id)):
+            newest[msg.room_id] = msg
+    for room_id, msg in newest.items():
+        # never move a room backwards if a later message got there first
+        ChatRoom.objects.filter(pk=room_id).filter(
+            Q(last_activity_at__isnull=True) | Q(last_activity_at__lte=msg.created_at)
+        ).update(last_message=msg, last_activity_at=msg.created_at, changed_at=timezone.now())
+
+
+def refresh_last_message(room_ids) -> None:
+    """Recompute last_message / last_activity_at for rooms that lost theirs."""
+    for room_id in set(room_ids):
+        rooms = ChatRoom.objects.filter(pk=room_id, last_message__isnull=True)
+        if not rooms.exists():
+            continue
+        latest = (
+            Message.objects.filter(room_id=room_id)
+            .order_by("-created_at", "-id")
+            .values_list("id", "created_at")
+            .first()
+        )
+        if latest:
+            rooms.update(last_message_id=latest[0], last_activity_at=latest[1], changed_at=timezone.now())
+        else:
+            rooms.update(last_activity_at=F("created_at"), changed_at=timezone.now())
+
+
+def refresh_member_count(room_ids) -> None:
+    """Recount participants for the given rooms."""
+    for room_id in set(room_ids):
+        count = ChatRoom.participants.through.objects.filter(chatroom_id=room_id).count()
+        ChatRoom.objects.filter(pk=room_id).update(member_count=count, changed_at=timezone.now())
+
+
+def touch_rooms(room_ids) -> None:
+    """Mark rooms changed for room-list sync (e.g. admins changed)."""
+    ChatRoom.objects.filter(pk__in=set(room_ids)).update(changed_at=timezone.now())
+
+
+def bury_rooms(pairs) -> None:
+    """Record (user_id, room_id) pairs that left a user's room list."""
+    RoomTombstone.objects.bulk_create(
+        [RoomTombstone(user_id=user_id, room_id=room_id) for user_id, room_id in pairs],
+        update_conflicts=True,
+        unique_fields=["user", "room_id"],
+        update_fields=["removed_at"],
+    )
+
+
+def unbury_rooms(pairs) -> None:
+    """Drop tombstones for (user_id, room_id) pairs that are back in the list."""
+    lookup = Q()
+    for user_id, room_id in pairs:
+        lookup |= Q(user_id=user_id, room_id=room_id)
+    if lookup:
+        RoomTombstone.objects.filter(lookup).delete()
@@ -0,0 +1,65 @@
+# ================================================================
+# backend/apps/chat/buffers.py
+# Per-room coalescing buffer shared by receipts and reactions
+# - frames for a room are merged in memory for `window` seconds, then
+#   written with one DB call and published once
+# - subclasses own the merge (add) and the batch shape
+# ================================================================
+import asyncio
+import logging
+
+from apps.chat.metrics import timed_db
+
+logger = logging.getLogger(__name__)
+
+
+class RoomBuffer:
+    """
+    Per-worker buffer keyed by room. `apply(room_id, batch)` is a sync DB
+    function (run through timed_db); `publish(channel_layer, room_id,
+    batch, result)` sends whatever it wrote.
+    """
+
+    label = "batch"  # for log messages
+
+    def __init__(self, window: float, apply, publish):
+        self.window = window
+        self._apply = apply
+        self._publish = publish
+        self._pending: dict[str, dict] = {}
+        self._layers: dict[str, object] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+
+    def _batch(self, channel_layer, room_id) -> dict:
+        """The room's pending batch to merge into; schedules its flush."""
+        self._layers[room_id] = channel_layer
+        if room_id not in self._tasks:
+            self._tasks[room_id] = asyncio.create_task(self._flush_later(room_id))
+        return self._pending.setdefault(room_id, {})
+
+    async def _flush_later(self, room_id):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._tasks.pop(room_id, None)
+        await self.flush(room_id)
+
+    async def flush(self, room_id):
+        batch = self._pending.pop(room_id, None)
+        channel_layer = self._layers.pop(room_id, None)
+        if not batch:
+            return
+        try:
+            result = await timed_db(self._apply)(room_id, batch)
+        except Exception:
+            logger.exception("Failed to persist %s for room %s", self.label, room_id)
+            return
+        await self._publish(channel_layer, room_id, batch, result)
+
+    async def flush_all(self):
+        """Write everything still buffered now (shutdown, bench teardown)."""
+        for room_id in list(self._pending):
+            task = self._tasks.pop(room_id, None)
+            if task:
+                task.cancel()
+            await self.flush(room_id)
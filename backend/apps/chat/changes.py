@@ -0,0 +1,31 @@
+# ================================================================
+# backend/apps/chat/changes.py
+# Per-room message change log for GET /api/chat/rooms/<id>/changes/?since=
+# - RoomChange.id is the sequence clients resume from
+# - compacted: one row per (message, user), so a message that changes
+#   a hundred times costs one row; a delete-for-all leaves one tombstone
+# - covers edits, pins, reactions, deletes and the caller's own meta
+#   (star, note, deleted-for-me); new messages come from ?after= paging
+# ================================================================
+from django.db import transaction
+
+from apps.chat.models import RoomChange
+
+
+def log_changes(room_id, message_ids, *, user_id=None, deleted=False) -> None:
+    """Move the given messages to the head of the room's change log."""
+    message_ids = list(set(message_ids))
+    if not message_ids:
+        return
+    with transaction.atomic():
+        stale = RoomChange.objects.filter(room_id=room_id, message_id__in=message_ids)
+        if not (deleted and user_id is None):
+            # per-user rows and room-wide rows are compacted separately
+            stale = stale.filter(user_id=user_id)
+        stale.delete()
+        RoomChange.objects.bulk_create(
+            [
+                RoomChange(room_id=room_id, message_id=message_id, user_id=user_id, deleted=deleted)
+                for message_id in message_ids
+            ]
+        )
@@ -1,24 +1,43 @@
 # ================================================================
 # backend/apps/chat/consumers.py
 # Stable WebSocket consumer
-# - history (safe-serialized)
-# - text messages
-# - typing / presence / delivery
-# - reaction passthrough (no DB persistence)
+# - history (safe-serialized, cursor-paginated)
+# - text messages (write-behind batched inserts, see ingest.py)
+# - typing / presence / delivery (per-member read cursors)
+# - reactions (batched writes, counts from Message.reaction_summary)
+# - JSON text frames, or msgpack when the client negotiates it
+# - resumable: durable room events carry event_id; reconnect with
+#   ?resume_from=<event_id> to replay only what was missed
+# - large rooms send room_activity hints; open rooms "pull" the bodies
 # ================================================================
 import json
+import time
+import uuid
 import asyncio
-from collections import defaultdict
+import logging
+from urllib.parse import parse_qs
 from channels.generic.websocket import AsyncWebsocketConsumer
-from channels.db import database_sync_to_async
+from django.conf import settings
 from django.utils import timezone
 from django.contrib.auth import get_user_model
 from django.db.models import Prefetch
 
-from apps.chat.models import ChatRoom, Message, SystemMessage, MessageUserMeta
-from apps.accounts.models import DeviceSession
+from apps.chat.models import Message, MessageReaction, RoomReadState, SystemMessage, MessageUserMeta
+from apps.accounts.utils import token_revoked
+from apps.chat.frames import MSGPACK_ENABLED, MSGPACK_SUBPROTOCOL, decode_msgpack, encode_msgpack, frame_event
+from apps.chat.membership import ais_member
+from apps.chat.metrics import inc, observe, timed, timed_db, timed_frames
+from apps.chat.outbound import OutboundQueue, record_slow_close
+from apps.chat.ingest import PendingMessage, message_ingestor
+from apps.chat.cursors import InvalidCursor, decode_cursor, encode_cursor, keyset_q, sort_key
+from apps.chat.ratelimit import check_rate
+from apps.chat.reactions import reaction_buffer, reaction_payload
+from apps.chat.presence import broadcast_presence, get_presence_registry, presence_snapshot, schedule_offline
+from apps.chat.receipts import aadvance_read_state, load_read_states, receipt_buffer, receipt_lists
+from apps.chat.replay import get_replay_log
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
 
 
 def _user_display(u: User) -> str:
@@ -26,20 +45,18 @@ def _user_display(u: User) -> str:
     return full or u.username
 
 
-def _reactions_to_dict(message: Message) -> dict:
-    """Represent reactions as {emoji: [userIds]} for JSON serialization."""
-    cache = getattr(message, "_prefetched_objects_cache", {}) or {}
-    reactions = cache.get("reactions")
-    if reactions is None:
-        manager = getattr(message, "reactions", None)
-        if manager is None:
-            return {}
-        reactions = list(manager.all())
-
-    grouped = defaultdict(list)
-    for reaction in reactions:
-        grouped[reaction.emoji].append(str(reaction.user_id))
-    return dict(grouped)
+def _reactions_to_dict(message: Message, current_user_id=None) -> tuple[dict, dict]:
+    """
+    Reactions as ({emoji: [userIds]}, {emoji: count}) from the message's
+    denormalized summary; the viewer's own rows come from `my_reactions`.
+    """
+    own = ()
+    if current_user_id is not None:
+        rows = getattr(message, "my_reactions", None)
+        if rows is None and message.reaction_summary:
+            rows = MessageReaction.objects.filter(message=message, user_id=current_user_id)
+        own = [r.emoji for r in rows or ()]
+    return reaction_payload(message, current_user_id, own)
 
 
 def _reply_stub(msg: Message | None):
@@ -76,8 +93,12 @@ def _attachment_info(message: Message) -> dict:
     return info
 
 
-def _msg_to_dict(m: Message, *, current_user_id: str | None = None) -> dict:
-    """Return a JSON-serializable message dict the frontend expects."""
+def _msg_to_dict(m: Message, *, current_user_id: str | None = None, read_states=None) -> dict:
+    """
+    Return a JSON-serializable message dict the frontend expects.
+    Pass the room's read_states when serializing many messages so the
+    receipt cursors are loaded once instead of per message.
+    """
     meta = None
     include_meta = current_user_id is not None
     if include_meta:
@@ -92,8 +113,10 @@ def _msg_to_dict(m: Message, *, current_user_id: str | None = None) -> dict:
             "name": _user_display(m.pinned_by),
         }
 
-    delivered_to = list(getattr(m, "delivered_to", []).all() if hasattr(m, "delivered_to") else [])
-    read_by = list(getattr(m, "read_by", []).all() if hasattr(m, "read_by") else [])
+    if read_states is None:
+        read_states = load_read_states(m.room_id)
+    delivered_to, read_by = receipt_lists(m, read_states)
+    reactions, reaction_counts = _reactions_to_dict(m, current_user_id)
 
     payload = {
         "type": "message",
@@ -114,11 +137,12 @@ def _msg_to_dict(m: Message, *, current_user_id: str | None = None) -> dict:
         "pinned": bool(getattr(m, "pinned", False)),
         "pinned_by": pinned_by_payload,
         "created_at": m.created_at.isoformat(),
-        "reactions": _reactions_to_dict(m),
+        "reactions": reactions,
+        "reaction_counts": reaction_counts,
         "duration": getattr(m, "duration", None),
-        "delivered_to": [str(u.id) for u in delivered_to],
+        "delivered_to": delivered_to,
         "delivered_at": getattr(m, "delivered_at", None).isoformat() if getattr(m, "delivered_at", None) else None,
-        "read_by": [str(u.id) for u in read_by],
+        "read_by": read_by,
         "read_at": getattr(m, "read_at", None).isoformat() if getattr(m, "read_at", None) else None,
     }
     if include_meta:
@@ -132,6 +156,21 @@ def _msg_to_dict(m: Message, *, current_user_id: str | None = None) -> dict:
     return payload
 
 
+def _normalize_room_id(raw) -> str | None:
+    try:
+        return str(uuid.UUID(str(raw)))
+    except ValueError:
+        return None
+
+
+def _parse_event_id(raw) -> int | None:
+    try:
+        event_id = int(raw)
+    except (TypeError, ValueError):
+        return None
+    return event_id if event_id >= 0 else None
+
+
 def _sys_to_dict(s: SystemMessage) -> dict:
     return {
         "type": "system_message",
@@ -149,51 +188,113 @@ def _sys_to_dict(s: SystemMessage) -> dict:
 
 class ChatConsumer(AsyncWebsocketConsumer):
     HEARTBEAT_INTERVAL = 30  # seconds
+    HISTORY_WINDOW = getattr(settings, "CHAT_HISTORY_WINDOW", 20)
+    HISTORY_PAGE_MAX = getattr(settings, "CHAT_HISTORY_PAGE_MAX", 100)
+    # client fell too far behind; reconnect with resume_from to catch up
+    SLOW_CONSUMER_CLOSE_CODE = 4008
+    METRICS_NAME = "room"  # consumer label on socket counters
+    binary = False  # set by _negotiate_subprotocol()
+    outbound = None  # OutboundQueue, started once accepted
+    _closing = False
 
     async def connect(self):
         """Authenticate, join room, mark online, start heartbeat."""
         self.room_id = self.scope["url_route"]["kwargs"]["room_id"]
         self.user = self.scope.get("user")
+        self.token_claims = self.scope.get("token_claims") or {}
         self.group_name = f"room_{self.room_id}"
         self._heartbeat_task = None
+        self._rate_limited = set()
 
         if not getattr(self.user, "is_authenticated", False):
             await self.close(code=4003)
             return
 
-        await self.accept()
+        await self.accept(subprotocol=self._negotiate_subprotocol())
+        self._start_outbound()
+        inc("chat_socket_connects_total", consumer=self.METRICS_NAME)
         await self.channel_layer.group_add(f"user_{self.user.id}", self.channel_name)
 
         if not await self._is_participant(self.user.id, self.room_id):
-            await self.send(text_data=json.dumps({
-                "type": "error", "message": "Not a participant of this room"
-            }))
+            await self.send_frame({"type": "error", "message": "Not a participant of this room"})
             await self.close(code=4003)
             return
 
-        await self.channel_layer.group_add(self.group_name, self.channel_name)
-        await self._update_presence(self.user.id, True)
-        await self._auto_mark_delivered(self.room_id, self.user.id)
+        self.presence = get_presence_registry(self.channel_layer)
+        if await self.presence.touch(self.user.id, self.channel_name):
+            await self._announce_presence("online")
+        query = parse_qs(self.scope.get("query_string", b"").decode())
+        await self._join_room(self.room_id, _parse_event_id(query.get("resume_from", [None])[0]))
 
-        # Send history safely (no FieldFile objects)
-        messages = await self._get_last_messages(self.room_id, self.user.id)
-        await self.send(text_data=json.dumps({"type": "history", "messages": messages}))
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
 
-        # announce online
-        await self.channel_layer.group_send(
-            self.group_name,
-            {
-                "type": "presence_update",
-                "user": self.user.username,
-                "status": "online",
-                "device": getattr(self.user, "device_type", "web"),
-                "last_seen": None,
-            },
-        )
+    def _negotiate_subprotocol(self):
+        """Use msgpack only when the client offers it; JSON stays the default."""
+        offered = self.scope.get("subprotocols") or []
+        self.binary = MSGPACK_ENABLED and MSGPACK_SUBPROTOCOL in offered
+        return MSGPACK_SUBPROTOCOL if self.binary else None
 
-        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+    def _start_outbound(self):
+        self.outbound = OutboundQueue(self._send_raw)
+        self.outbound.start()
+
+    def _decode_binary(self, bytes_data):
+        """Inbound msgpack frame with long keys, or None if not negotiated / malformed."""
+        if not self.binary:
+            return None
+        try:
+            return decode_msgpack(bytes_data)
+        except (ValueError, TypeError):
+            return None
+
+    async def _join_room(self, room_id, resume_from=None):
+        """
+        Join the room group, then replay the events missed since resume_from
+        (has_more: pull the rest), or send the history snapshot when there is
+        nothing to resume from (or the gap is older than the replay log).
+        Presence always follows.
+        """
+        await self.channel_layer.group_add(f"room_{room_id}", self.channel_name)
+        await self._auto_mark_delivered(room_id, self.user.id)
+        scope = {"room_id": str(room_id)}
+        replay = get_replay_log(self.channel_layer)
+
+        # events published after group_add may also arrive live; clients drop
+        # duplicates by event_id
+        missed = await replay.since(room_id, resume_from) if resume_from is not None else None
+        if missed is not None:
+            # the outbound queue cannot drain while we fill it, so a long gap
+            # is replayed up to half its budget and the rest pulled (has_more)
+            budget = max(1, self.outbound.max_frames // 2)
+            for frame in missed[:budget]:
+                await self.forward_frame({"frame": frame})
+            await self.send_frame(
+                {
+                    "type": "resumed",
+                    "resume_from": resume_from,
+                    "replayed": min(budget, len(missed)),
+                    "has_more": len(missed) > budget,
+                },
+                scope,
+            )
+        else:
+            await self._send_snapshot(room_id)
+
+        # everyone's state in one frame instead of waiting for heartbeats
+        snapshot = await presence_snapshot(self.presence, room_id)
+        await self.send_frame({"type": "presence_snapshot", "users": snapshot}, scope)
+
+    async def _send_snapshot(self, room_id):
+        # anything after last_event_id reaches us through the group
+        last_event_id = await get_replay_log(self.channel_layer).last_id(room_id)
+        # Send a small history window; older pages are pulled via history_before
+        page = await self._get_history_page(room_id, self.user.id, limit=self.HISTORY_WINDOW)
+        await self.send_frame({"type": "history", "last_event_id": last_event_id, **page}, {"room_id": str(room_id)})
 
     async def disconnect(self, code):
+        inc("chat_socket_disconnects_total", consumer=self.METRICS_NAME, code=code)
+        if self.outbound:
+            await self.outbound.stop()
         if self._heartbeat_task:
             self._heartbeat_task.cancel()
             try:
@@ -206,95 +307,81 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if getattr(self.user, "id", None):
             await self.channel_layer.group_discard(f"user_{self.user.id}", self.channel_name)
 
-        if getattr(self, "user", None) and getattr(self.user, "id", None):
-            last_seen = await self._update_presence(self.user.id, False)
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "presence_update",
-                    "user": self.user.username,
-                    "status": "offline",
-                    "device": getattr(self.user, "device_type", "web"),
-                    "last_seen": last_seen,
-                },
-            )
+        if getattr(self, "presence", None):
+            if await self.presence.drop(self.user.id, self.channel_name):
+                schedule_offline(
+                    self.channel_layer, self.presence, self.user.id, self.user.username,
+                    getattr(self.user, "device_type", "web"),
+                )
 
     async def receive(self, text_data=None, bytes_data=None):
-        try:
-            data = json.loads(text_data or "{}")
-        except json.JSONDecodeError:
-            data = {"type": "message", "content": text_data or ""}
+        if bytes_data is not None:
+            data = self._decode_binary(bytes_data)
+            if data is None:
+                return
+        else:
+            try:
+                data = json.loads(text_data or "{}")
+            except json.JSONDecodeError:
+                data = {"type": "message", "content": text_data or ""}
 
+        await self.handle_room_frame(self.room_id, data)
+
+    @timed_frames
+    async def handle_room_frame(self, room_id, data):
+        """Act on one client frame scoped to room_id (shared with UserConsumer)."""
         msg_type = data.get("type", "message")
+        group_name = f"room_{room_id}"
+
+        if not await self._within_rate(msg_type, room_id, data):
+            return
 
         # typing indicator
         if msg_type in ["typing", "stopped_typing"]:
             await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "user_typing_to_you",
-                    "from_user": _user_display(self.user),
-                    "typing": (msg_type == "typing"),
-                },
+                group_name,
+                frame_event(
+                    {
+                        "type": "typing",
+                        "room_id": str(room_id),
+                        "from_user": _user_display(self.user),
+                        "typing": (msg_type == "typing"),
+                        "timestamp": timezone.now().isoformat(),
+                    },
+                    exclude_user=self.user.id,
+                    coalesce=f"typing:{room_id}:{self.user.id}",
+                ),
             )
             return
 
-        # reaction passthrough
-        if msg_type == "reaction":
-            op = data.get("op", "toggle")
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "reaction_event",
-                    "message_id": data.get("message_id"),
-                    "emoji": data.get("emoji"),
-                    "user_id": self.user.id,
-                    "op": op,
-                },
-            )
+        # explicit away / back from the client (e.g. tab hidden)
+        if msg_type == "presence":
+            status = data.get("status")
+            if status in ("online", "away"):
+                await self._announce_presence(status)
             return
 
-        if msg_type == "focus":
-            await self._auto_mark_read(self.room_id, self.user.id)
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message_delivery",
-                    "status": "read",
-                    "user": self.user.username,
-                    "user_id": self.user.id,
-                    "ids": [],
-                },
+        # reactions are coalesced per room and persisted in one transaction;
+        # only real changes are broadcast, with the new count
+        if msg_type == "reaction":
+            await reaction_buffer.add(
+                self.channel_layer, room_id, self.user.id,
+                data.get("message_id"), data.get("emoji"), data.get("op", "toggle"),
             )
             return
 
-        if msg_type == "delivered":
-            ids = data.get("ids", [])
-            await self._mark_delivered(ids, self.user.id)
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message_delivery",
-                    "status": "delivered",
-                    "user": self.user.username,
-                    "user_id": self.user.id,
-                    "ids": ids,
-                },
+        # receipts are coalesced per room and flushed as one write + one event
+        if msg_type == "focus":
+            await receipt_buffer.add(
+                self.channel_layer, room_id, self.user.id, self.user.username,
+                "read", upto=timezone.now(),
             )
             return
 
-        if msg_type == "read":
-            ids = data.get("ids", [])
-            await self._mark_read(ids, self.user.id)
-            await self.channel_layer.group_send(
-                self.group_name,
-                {
-                    "type": "message_delivery",
-                    "status": "read",
-                    "user": self.user.username,
-                    "user_id": self.user.id,
-                    "ids": ids,
-                },
+        if msg_type in ("delivered", "read"):
+            await receipt_buffer.add(
+                self.channel_layer, room_id, self.user.id, self.user.username,
+                msg_type, ids=data.get("ids", []),
             )
             return
 
@@ -304,110 +391,284 @@ class ChatConsumer(AsyncWebsocketConsumer):
             if not content and not data.get("reply_to_id") and not data.get("forwarded_from_id"):
                 return
             client_id = data.get("_client_id")
-            payload = await self._save_message(
-                self.room_id,
-                self.user.id,
-                content,
-                reply_to_id=data.get("reply_to_id"),
-                forwarded_from_id=data.get("forwarded_from_id"),
-                starred=bool(data.get("starred")),
-                note=data.get("note") or "",
-                client_id=client_id,
-            )
-            await self.channel_layer.group_send(
-                self.group_name,
-                {"type": "chat_message", "payload": payload},
-            )
+            try:
+                # batched with other sockets' messages; returns once committed and published
+                payload, broadcast = await message_ingestor.submit(
+                    self.channel_layer,
+                    PendingMessage(
+                        room_id=room_id,
+                        sender_id=self.user.id,
+                        content=content,
+                        reply_to_id=data.get("reply_to_id"),
+                        forwarded_from_id=data.get("forwarded_from_id"),
+                        starred=bool(data.get("starred")),
+                        note=data.get("note") or "",
+                        client_id=client_id,
+                    ),
+                )
+            except Exception:
+                logger.warning("Could not save message from user %s in room %s", self.user.id, room_id, exc_info=True)
+                frame = {"type": "error", "message": "Message could not be saved", "frame_type": "message"}
+                if client_id:
+                    frame["_client_id"] = client_id
+                await self.send_frame(frame, {"room_id": str(room_id)})
+                return
+            if not broadcast:
+                # a retry of a send that already went out, or a lazy fan-out
+                # room that only got a room_activity hint; ack this socket only
+                await self.send_frame({**payload, "room_id": str(room_id)}, {"room_id": str(room_id)})
+            return
+
+        if msg_type in ("history_before", "history_after"):
+            await self._send_history_page(room_id, msg_type, data)
+            return
+
+        # bodies behind room_activity hints, straight from the replay log
+        if msg_type == "pull":
+            await self._pull_events(room_id, data)
             return
 
         if msg_type == "ping":
-            await self.send(text_data=json.dumps({"type": "pong", "ts": timezone.now().isoformat()}))
+            await self.send_frame({"type": "pong", "ts": timezone.now().isoformat()})
             return
 
+    async def _within_rate(self, msg_type, room_id=None, data=None) -> bool:
+        """
+        Per-user token bucket, shared by all of the user's sockets.
+        Over-limit frames are dropped before any DB work; the client gets a
+        backoff error once per limited kind, or per message carrying a _client_id.
+        """
+        kind, retry_after = await check_rate(self.channel_layer, self.user.id, msg_type)
+        if not retry_after:
+            self._rate_limited.discard(kind)
+            return True
+        inc("chat_rate_limited_total", kind=kind)
+        client_id = (data or {}).get("_client_id")
+        if kind not in self._rate_limited or client_id:
+            self._rate_limited.add(kind)
+            frame = {
+                "type": "error",
+                "message": "Rate limit exceeded",
+                "frame_type": msg_type,
+                "retry_after": round(retry_after, 2),
+            }
+            if room_id:
+                frame["room_id"] = str(room_id)
+            if client_id:
+                frame["_client_id"] = client_id
+            await self.send_frame(frame)
+        return False
+
+    def _page_limit(self, data) -> int:
+        try:
+            limit = int(data.get("limit") or self.HISTORY_WINDOW)
+        except (TypeError, ValueError):
+            limit = self.HISTORY_WINDOW
+        return max(1, min(limit, self.HISTORY_PAGE_MAX))
+
+    async def _send_history_page(self, room_id, frame_type, data):
+        direction = "before" if frame_type == "history_before" else "after"
+        limit = self._page_limit(data)
+        try:
+            page = await self._get_history_page(
+                room_id,
+                self.user.id,
+                cursor=data.get("cursor"),
+                direction=direction,
+                limit=limit,
+            )
+        except InvalidCursor:
+            await self.send_frame({"type": "error", "message": "Invalid cursor"}, {"room_id": str(room_id)})
+            return
+        await self.send_frame({"type": frame_type, **page}, {"room_id": str(room_id)})
+
+    async def _pull_events(self, room_id, data):
+        """
+        Send up to `limit` room events after data["after"], then a "pulled"
+        frame (has_more asks for another pull). A gap older than the replay
+        log gets a fresh history snapshot instead.
+        """
+        after = _parse_event_id(data.get("after"))
+        missed = await get_replay_log(self.channel_layer).since(room_id, after) if after is not None else None
+        if missed is None:
+            await self._send_snapshot(room_id)
+            return
+        limit = self._page_limit(data)
+        for frame in missed[:limit]:
+            await self.forward_frame({"frame": frame})
+        await self.send_frame(
+            {"type": "pulled", "after": after, "count": min(limit, len(missed)), "has_more": len(missed) > limit},
+            {"room_id": str(room_id)},
+        )
+
     # ---------------- heartbeat ----------------
     async def _heartbeat_loop(self):
         try:
             while True:
-                await asyncio.sleep(self.HEARTBEAT_INTERVAL)
-                await self._update_presence(self.user.id, True)
-                await self.channel_layer.group_send(
-                    self.group_name,
-                    {
-                        "type": "presence_update",
-                        "user": self.user.username,
-                        "status": "online",
-                        "device": getattr(self.user, "device_type", "web"),
-                        "last_seen": None,
-                    },
-                )
+                await asyncio.sleep(self._next_heartbeat())
+                if await self._token_lapsed():
+                    await self.send_frame({"type": "error", "message": "Session expired"})
+                    await self.close(code=4001)
+                    return
+                # only a lapsed-then-revived connection is a transition
+                if await self.presence.touch(self.user.id, self.channel_name):
+                    await self._announce_presence("online")
         except asyncio.CancelledError:
             pass
 
+    def _next_heartbeat(self) -> float:
+        """Sleep until the next heartbeat, or until the access token expires if sooner."""
+        exp = self.token_claims.get("exp")
+        if not exp:
+            return self.HEARTBEAT_INTERVAL
+        return max(0, min(self.HEARTBEAT_INTERVAL, exp - timezone.now().timestamp()))
+
+    async def _token_lapsed(self) -> bool:
+        """The socket outlived its token: expired, revoked, or the user was deactivated."""
+        claims = self.token_claims
+        if not claims:
+            return False
+        if claims.get("exp") and claims["exp"] <= timezone.now().timestamp():
+            return True
+        return await token_revoked(claims.get("jti"), self.user.id, claims.get("iat"), claims.get("sid"))
+
+    async def _announce_presence(self, status):
+        await broadcast_presence(
+            self.channel_layer,
+            self.presence,
+            self.user.id,
+            self.user.username,
+            status,
+            device=getattr(self.user, "device_type", "web"),
+        )
+
     # ---------------- event handlers ----------------
+    async def send_frame(self, frame, event=None):
+        """Deliver one outbound frame; subclasses may decorate it per event."""
+        await self._write(encode_msgpack(frame) if self.binary else json.dumps(frame))
+
+    async def forward_frame(self, event):
+        """Send a frame_event() payload as encoded by the sender, in this socket's codec."""
+        if not self.binary:
+            data = event["frame"]
+        else:
+            data = event.get("frame_mp")
+            if data is None:
+                # encoded by a worker running without msgpack
+                data = encode_msgpack(json.loads(event["frame"]))
+        if "sent_at" in event:
+            observe("chat_fanout_seconds", time.time() - event["sent_at"])
+        await self._write(data, event.get("coalesce"))
+
+    async def _write(self, data, coalesce=None):
+        """Queue one encoded frame; a client that cannot keep up is closed for resync."""
+        if self._closing:
+            return
+        if self.outbound is None:
+            await self._send_raw(data)
+            return
+        if not self.outbound.put(data, coalesce):
+            await self._close_slow_consumer()
+
+    async def _send_raw(self, data):
+        codec = "msgpack" if isinstance(data, bytes) else "json"
+        inc("chat_frames_out_total", codec=codec)
+        inc("chat_bytes_out_total", len(data), codec=codec)
+        if isinstance(data, bytes):
+            await self.send(bytes_data=data)
+        else:
+            await self.send(text_data=data)
+
+    async def close(self, code=None, reason=None):
+        """Write queued frames (e.g. the error explaining the close) before closing."""
+        if self.outbound is not None and not self._closing:
+            self._closing = True
+            await self.outbound.flush()
+        await super().close(code=code, reason=reason)
+
+    async def _close_slow_consumer(self):
+        self._closing = True
+        record_slow_close()
+        logger.info(
+            "Closing slow WebSocket client user=%s (%s frames / %s bytes queued)",
+            getattr(self.user, "id", None), self.outbound.depth, self.outbound.size,
+        )
+        await self.outbound.stop()
+        await self.close(code=self.SLOW_CONSUMER_CLOSE_CODE)
+
+    async def chat_frame(self, event):
+        """Forward a frame the sender encoded once for the whole group."""
+        if event.get("exclude_user") == self.user.id:
+            return
+        await self.forward_frame(event)
+
+    # dict events below are still produced by older workers during a deploy
     async def chat_message(self, event):
         payload = event.get("payload", {})
         if "type" not in payload:
             payload["type"] = "message"
-        await self.send(text_data=json.dumps(payload))
+        await self.send_frame(payload, event)
 
     async def user_typing_to_you(self, event):
         if event["from_user"] != _user_display(self.user):
-            await self.send(text_data=json.dumps({
+            await self.send_frame({
                 "type": "typing",
                 "from_user": event["from_user"],
                 "typing": event["typing"],
                 "timestamp": timezone.now().isoformat(),
-            }))
+            }, event)
 
     async def reaction_event(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "reaction",
             "message_id": event.get("message_id"),
             "emoji": event.get("emoji"),
             "user_id": event.get("user_id"),
             "op": event.get("op", "toggle"),
-        }))
+            "count": event.get("count"),
+        }, event)
 
     async def message_delivery(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "delivery",
-            "status": event["status"],
-            "user": event["user"],
-            "user_id": event.get("user_id"),
-            "ids": event["ids"],
-        }))
+            "receipts": event.get("receipts", []),
+        }, event)
 
     async def presence_update(self, event):
-        await self.send(text_data=json.dumps({
+        if "frame" in event:
+            await self.forward_frame(event)
+            return
+        await self.send_frame({
             "type": "presence",
             "user": event["user"],
+            "user_id": event.get("user_id"),
             "status": event["status"],
             "device": event.get("device", "web"),
             "last_seen": event["last_seen"],
-        }))
+        }, event)
 
     async def chat_system_message(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "system_message",
             "event": event.get("event"),
             "message": event.get("message"),
             "room_id": event.get("room_id"),
             "invited_users": event.get("invited_users", []),
             "timestamp": str(timezone.now()),
-        }))
+        }, event)
 
     async def chat_invitation(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "invitation",
             "room_id": event.get("room_id"),
             "room_name": event.get("room_name"),
             "invited_by": event.get("invited_by"),
             "message": event.get("message"),
             "timestamp": str(timezone.now()),
-        }))
+        }, event)
 
     async def chat_group_invite(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "group_invite",
             "invite_id": event.get("invite_id"),
             "room_id": event.get("room_id"),
@@ -416,76 +677,61 @@ class ChatConsumer(AsyncWebsocketConsumer):
             "message": event.get("message"),
             "status": event.get("status"),
             "timestamp": str(timezone.now()),
-        }))
+        }, event)
 
     async def message_update(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "message_update",
             "payload": event.get("payload", {}),
-        }))
+        }, event)
 
     async def message_remove(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "message_remove",
             "message_id": event.get("message_id"),
-        }))
+        }, event)
 
     async def message_remove_bulk(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "message_remove_bulk",
             "message_ids": event.get("message_ids", []),
-        }))
+        }, event)
 
     async def message_meta(self, event):
-        await self.send(text_data=json.dumps({
+        await self.send_frame({
             "type": "message_meta",
             "payload": event.get("payload", {}),
-        }))
+        }, event)
 
     # ---------------- DB helpers ----------------
-    @database_sync_to_async
-    def _is_participant(self, user_id, room_id):
-        try:
-            room = ChatRoom.objects.get(id=room_id)
-            return room.participants.filter(id=user_id).exists()
-        except ChatRoom.DoesNotExist:
-            return False
-
-    @database_sync_to_async
-    def _save_message(self, room_id, user_id, content, *, reply_to_id=None, forwarded_from_id=None, starred=False, note="", client_id=None):
-        msg = Message.objects.create(
-            room_id=room_id,
-            sender_id=user_id,
-            content=content,
-            reply_to_id=reply_to_id,
-            forwarded_from_id=forwarded_from_id,
-        )
-
-        meta = None
-        if starred or note:
-            meta, _ = MessageUserMeta.objects.update_or_create(
-                message=msg,
-                user_id=user_id,
-                defaults={
-                    "starred": starred,
-                    "note": note,
-                    "deleted_for_me": False,
-                },
-            )
-        if meta:
-            msg.meta_for_user = [meta]
-        else:
-            msg.meta_for_user = []
-
-        payload = _msg_to_dict(msg, current_user_id=user_id)
-        if client_id:
-            payload["_client_id"] = client_id
-        return payload
-
-    @database_sync_to_async
-    def _get_last_messages(self, room_id, user_id, limit=50):
-        msgs = list(
+    # Single-query reads and writes use the async ORM / async cache directly.
+    # Work that needs a transaction, select_for_update or several dependent
+    # queries (history pages, the batched ingest/receipt/reaction writes)
+    # stays a plain function behind one timed_db thread hop: the async ORM
+    # cannot open transactions, and each async query is its own hop anyway.
+    @timed_db
+    async def _is_participant(self, user_id, room_id):
+        return await ais_member(room_id, user_id)
+
+    @timed_db
+    def _get_history_page(self, room_id, user_id, *, cursor=None, direction="before", limit=20):
+        """
+        One page of merged user + system messages around an opaque cursor.
+        Without a cursor this is the newest `limit` items. Messages are
+        always returned oldest-first; before_cursor/after_cursor bound the page.
+        """
+        position = decode_cursor(cursor) if cursor else None
+        newest_first = direction == "before"
+        ordering = ("-created_at", "-id") if newest_first else ("created_at", "id")
+
+        deleted_for_me = MessageUserMeta.objects.filter(
+            user_id=user_id,
+            deleted_for_me=True,
+            message__room_id=room_id,
+        ).values("message_id")
+        msg_qs = (
             Message.objects.filter(room_id=room_id)
+            .exclude(id__in=deleted_for_me)
             .select_related(
                 "sender",
                 "reply_to",
@@ -495,82 +741,199 @@ class ChatConsumer(AsyncWebsocketConsumer):
                 "pinned_by",
             )
             .prefetch_related(
-                "reactions",
+                Prefetch(
+                    "reactions",
+                    queryset=MessageReaction.objects.filter(user_id=user_id),
+                    to_attr="my_reactions",
+                ),
                 Prefetch(
                     "user_meta",
                     queryset=MessageUserMeta.objects.filter(user_id=user_id),
                     to_attr="meta_for_user",
                 ),
             )
-            .order_by("-created_at")[:limit]
         )
-        sys = list(SystemMessage.objects.filter(room_id=room_id).order_by("-created_at")[:limit])
-
-        # serialize and sort by created_at
-        payload = []
-        for m in msgs:
-            meta_list = getattr(m, "meta_for_user", None) or []
-            if meta_list and getattr(meta_list[0], "deleted_for_me", False):
-                continue
-            payload.append(_msg_to_dict(m, current_user_id=user_id))
-        payload.extend([_sys_to_dict(s) for s in sys])
-        payload.sort(key=lambda x: x["created_at"])
-        return payload[-limit:]
-
-    @database_sync_to_async
-    def _mark_delivered(self, message_ids, user_id):
-        if not message_ids:
+        sys_qs = SystemMessage.objects.filter(room_id=room_id)
+        if position:
+            msg_qs = msg_qs.filter(keyset_q(*position, direction=direction))
+            sys_qs = sys_qs.filter(keyset_q(*position, direction=direction))
+
+        # fetch one extra row from each source so we know whether more exist
+        rows = list(msg_qs.order_by(*ordering)[: limit + 1])
+        rows.extend(sys_qs.order_by(*ordering)[: limit + 1])
+        rows.sort(key=sort_key, reverse=newest_first)
+        has_more = len(rows) > limit
+        rows = sorted(rows[:limit], key=sort_key)
+        read_states = load_read_states(room_id)
+
+        return {
+            "messages": [
+                _sys_to_dict(r)
+                if isinstance(r, SystemMessage)
+                else _msg_to_dict(r, current_user_id=user_id, read_states=read_states)
+                for r in rows
+            ],
+            "before_cursor": encode_cursor(rows[0].created_at, rows[0].id) if rows else cursor,
+            "after_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if rows else cursor,
+            "has_more": has_more,
+        }
+
+    @timed_db
+    async def _auto_mark_delivered(self, room_id, user_id):
+        # cursor up to the newest message, and only when it moves: a write
+        # bumps updated_at, which makes rooms/sync report the room again
+        latest = await (
+            Message.objects.filter(room_id=room_id).order_by("-created_at").values_list("created_at", flat=True).afirst()
+        )
+        if latest is None:
             return
-        msgs = Message.objects.filter(id__in=message_ids)
-        now = timezone.now()
-        for msg in msgs:
-            msg.delivered_to.add(user_id)
-            msg.delivered_at = now
-            msg.save(update_fields=["delivered_at"])
-
-    @database_sync_to_async
-    def _mark_read(self, message_ids, user_id):
-        if not message_ids:
+        state = RoomReadState.objects.filter(room_id=room_id, user_id=user_id, last_delivered_at__gte=latest)
+        if await state.aexists():
             return
-        msgs = Message.objects.filter(id__in=message_ids)
-        now = timezone.now()
-        for msg in msgs:
-            msg.is_read = True
-            msg.read_by.add(user_id)
-            msg.read_at = now
-            msg.save(update_fields=["is_read", "read_at"])
-
-    @database_sync_to_async
-    def _auto_mark_delivered(self, room_id, user_id):
-        msgs = Message.objects.filter(room_id=room_id).exclude(delivered_to=user_id)
-        now = timezone.now()
-        for msg in msgs:
-            msg.delivered_to.add(user_id)
-            msg.delivered_at = now
-            msg.save(update_fields=["delivered_at"])
-
-    @database_sync_to_async
-    def _auto_mark_read(self, room_id, user_id):
-        msgs = Message.objects.filter(room_id=room_id).exclude(read_by=user_id)
-        now = timezone.now()
-        for msg in msgs:
-            msg.is_read = True
-            msg.read_by.add(user_id)
-            msg.read_at = now
-            msg.save(update_fields=["is_read", "read_at"])
-
-    @database_sync_to_async
-    def _update_presence(self, user_id, is_online):
-        try:
-            user = User.objects.get(id=user_id)
-            if is_online:
-                user.mark_online()
+        await aadvance_read_state(room_id, user_id, delivered_upto=latest)
+
+
+class UserConsumer(ChatConsumer):
+    """
+    One socket per user across all rooms (ws/user/).
+    Clients subscribe/unsubscribe to rooms; room-scoped frames in both
+    directions carry a room_id, and user-level events arrive once.
+    """
+
+    MAX_ROOMS = getattr(settings, "CHAT_USER_SOCKET_MAX_ROOMS", 200)
+    METRICS_NAME = "user"
+
+    async def connect(self):
+        self.user = self.scope.get("user")
+        self.token_claims = self.scope.get("token_claims") or {}
+        self.rooms = set()
+        self._heartbeat_task = None
+        self._rate_limited = set()
+        self._presence_seen = {}
+
+        if not getattr(self.user, "is_authenticated", False):
+            await self.close(code=4003)
+            return
+
+        await self.accept(subprotocol=self._negotiate_subprotocol())
+        self._start_outbound()
+        inc("chat_socket_connects_total", consumer=self.METRICS_NAME)
+        await self.channel_layer.group_add(f"user_{self.user.id}", self.channel_name)
+
+        self.presence = get_presence_registry(self.channel_layer)
+        if await self.presence.touch(self.user.id, self.channel_name):
+            await self._announce_presence("online")
+
+        self._heartbeat_task = asyncio.create_task(self._heartbeat_loop())
+
+    async def disconnect(self, code):
+        inc("chat_socket_disconnects_total", consumer=self.METRICS_NAME, code=code)
+        if self.outbound:
+            await self.outbound.stop()
+        if self._heartbeat_task:
+            self._heartbeat_task.cancel()
+            try:
+                await self._heartbeat_task
+            except asyncio.CancelledError:
+                pass
+
+        for room_id in getattr(self, "rooms", ()):
+            await self.channel_layer.group_discard(f"room_{room_id}", self.channel_name)
+        if getattr(self.user, "id", None):
+            await self.channel_layer.group_discard(f"user_{self.user.id}", self.channel_name)
+
+        if getattr(self, "presence", None):
+            if await self.presence.drop(self.user.id, self.channel_name):
+                schedule_offline(
+                    self.channel_layer, self.presence, self.user.id, self.user.username,
+                    getattr(self.user, "device_type", "web"),
+                )
+
+    async def receive(self, text_data=None, bytes_data=None):
+        if bytes_data is not None:
+            data = self._decode_binary(bytes_data)
+            if data is None:
+                await self.send_frame({"type": "error", "message": "Invalid frame"})
+                return
+        else:
+            try:
+                data = json.loads(text_data or "{}")
+            except json.JSONDecodeError:
+                await self.send_frame({"type": "error", "message": "Invalid JSON"})
+                return
+
+        msg_type = data.get("type")
+        if msg_type in ("subscribe", "unsubscribe"):
+            inc("chat_frames_in_total", type=msg_type)
+            with timed("chat_handler_seconds", frame=msg_type):
+                await self._handle_subscriptions(msg_type, data)
+            return
+
+        if msg_type in ("ping", "presence"):
+            await self.handle_room_frame(None, data)
+            return
+
+        room_id = _normalize_room_id(data.get("room_id"))
+        if room_id not in self.rooms:
+            await self.send_frame({"type": "error", "message": "Not subscribed to this room", "room_id": room_id})
+            return
+        await self.handle_room_frame(room_id, data)
+
+    async def _handle_subscriptions(self, msg_type, data):
+        if not await self._within_rate(msg_type, data=data):
+            return
+        room_ids = data.get("room_ids") or [data.get("room_id")]
+        # resume positions: {"room_id": .., "resume_from": n} or {"room_ids": [..], "resume": {room_id: n}}
+        resume = data.get("resume") if isinstance(data.get("resume"), dict) else {}
+        for room_id in room_ids if isinstance(room_ids, list) else []:
+            if msg_type == "subscribe":
+                await self._subscribe(room_id, _parse_event_id(resume.get(room_id, data.get("resume_from"))))
             else:
-                user.mark_offline()
-            DeviceSession.objects.filter(user_id=user_id, is_active=True).update(
-                last_active=timezone.now(),
-                connection_status="online" if is_online else "offline",
-            )
-            return user.last_seen.isoformat() if not is_online else None
-        except User.DoesNotExist:
-            return None
+                await self._unsubscribe(room_id)
+
+    async def _subscribe(self, raw_room_id, resume_from=None):
+        room_id = _normalize_room_id(raw_room_id)
+        if room_id in self.rooms:
+            return
+        if room_id is None or not await self._is_participant(self.user.id, room_id):
+            await self.send_frame({"type": "error", "message": "Not a participant of this room", "room_id": room_id})
+            return
+        if len(self.rooms) >= self.MAX_ROOMS:
+            await self.send_frame({"type": "error", "message": "Too many subscriptions", "room_id": room_id})
+            return
+        self.rooms.add(room_id)
+        await self._join_room(room_id, resume_from)
+        await self.send_frame({"type": "subscribed", "room_id": room_id})
+
+    async def _unsubscribe(self, raw_room_id):
+        room_id = _normalize_room_id(raw_room_id)
+        if room_id not in self.rooms:
+            return
+        self.rooms.discard(room_id)
+        await self.channel_layer.group_discard(f"room_{room_id}", self.channel_name)
+        await self.send_frame({"type": "unsubscribed", "room_id": room_id})
+
+    async def send_frame(self, frame, event=None):
+        room_id = (event or {}).get("room_id")
+        if room_id and "room_id" not in frame:
+            frame = {**frame, "room_id": room_id}
+        await super().send_frame(frame, event)
+
+    async def presence_update(self, event):
+        # transitions are fanned out per room; a multiplexed socket wants one copy
+        key = (event.get("user_id"), event.get("status"))
+        if self._presence_seen.get(key[0]) == key[1]:
+            return
+        self._presence_seen[key[0]] = key[1]
+        if "frame" in event:
+            await self.forward_frame(event)
+            return
+        frame = {
+            "type": "presence",
+            "user": event["user"],
+            "user_id": event.get("user_id"),
+            "status": event["status"],
+            "device": event.get("device", "web"),
+            "last_seen": event["last_seen"],
+        }
+        await super().send_frame(frame)
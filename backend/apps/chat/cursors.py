@@ -0,0 +1,69 @@
+# ================================================================
+# backend/apps/chat/cursors.py
+# Opaque keyset cursors over (created_at, id)
+# - plus the timestamp tokens of the room-list sync endpoint
+# ================================================================
+import base64
+import binascii
+import uuid
+from datetime import datetime, timezone
+
+from django.db.models import Q
+
+
+class InvalidCursor(ValueError):
+    """Raised when a client sends a cursor we did not issue."""
+
+
+def encode_cursor(created_at: datetime, pk) -> str:
+    """Pack a (created_at, id) position into an url-safe opaque token."""
+    raw = f"{created_at.isoformat()}|{pk}".encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[datetime, uuid.UUID]:
+    """Inverse of encode_cursor; raises InvalidCursor on anything malformed."""
+    if not cursor or not isinstance(cursor, str):
+        raise InvalidCursor("Empty cursor")
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        raw = base64.urlsafe_b64decode(padded.encode()).decode()
+        ts, pk = raw.split("|", 1)
+        return datetime.fromisoformat(ts), uuid.UUID(pk)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor("Malformed cursor") from exc
+
+
+def keyset_q(created_at: datetime, pk, *, direction: str) -> Q:
+    """
+    Rows strictly before/after the (created_at, id) position.
+    Pair with order_by("-created_at", "-id") for "before" and
+    order_by("created_at", "id") for "after".
+    """
+    if direction == "before":
+        return Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+    if direction == "after":
+        return Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+    raise ValueError(f"Unknown direction: {direction}")
+
+
+def sort_key(obj) -> tuple:
+    """Python-side ordering that matches the (created_at, id) keyset."""
+    return (obj.created_at, str(obj.id))
+
+
+def encode_sync_token(ts: datetime) -> str:
+    """Opaque token for a room-list sync position."""
+    return base64.urlsafe_b64encode(ts.isoformat().encode()).decode().rstrip("=")
+
+
+def decode_sync_token(token: str) -> datetime:
+    """Inverse of encode_sync_token; raises InvalidCursor on anything malformed."""
+    if not token or not isinstance(token, str):
+        raise InvalidCursor("Empty token")
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        ts = datetime.fromisoformat(base64.urlsafe_b64decode(padded.encode()).decode())
+    except (binascii.Error, UnicodeDecodeError, ValueError) as exc:
+        raise InvalidCursor("Malformed token") from exc
+    return ts if ts.tzinfo else ts.replace(tzinfo=timezone.utc)
@@ -0,0 +1,150 @@
+# ================================================================
+# backend/apps/chat/frames.py
+# Serialize-once fan-out: frames are encoded by the sender and
+# forwarded verbatim by every receiving consumer
+# - JSON text frames (default)
+# - compact MessagePack frames for clients negotiating MSGPACK_SUBPROTOCOL
+# ================================================================
+import json
+import time
+
+from django.conf import settings
+
+from apps.chat.metrics import inc
+
+try:
+    import msgpack
+except ImportError:  # optional: sockets stay on JSON without it
+    msgpack = None
+
+MSGPACK_SUBPROTOCOL = "tuchati.msgpack.v1"
+MSGPACK_ENABLED = msgpack is not None and getattr(settings, "CHAT_WS_MSGPACK", True)
+
+# Wire keys for the msgpack protocol. Append only: clients ship this table,
+# so renaming or reusing a short key is a protocol version bump.
+SHORT_KEYS = {
+    "type": "t",
+    "id": "i",
+    "room_id": "r",
+    "sender_id": "s",
+    "sender_name": "sn",
+    "content": "c",
+    "attachment": "a",
+    "audio": "au",
+    "attachment_info": "ai",
+    "name": "n",
+    "size": "sz",
+    "content_type": "ct",
+    "thumbnail": "th",
+    "reply_to": "rt",
+    "forwarded_from": "ff",
+    "pinned": "p",
+    "pinned_by": "pb",
+    "created_at": "ca",
+    "reactions": "re",
+    "duration": "du",
+    "delivered_to": "dt",
+    "delivered_at": "da",
+    "read_by": "rb",
+    "read_at": "ra",
+    "starred": "st",
+    "note": "no",
+    "deleted_for_me": "dm",
+    "messages": "m",
+    "before_cursor": "bc",
+    "after_cursor": "ac",
+    "has_more": "hm",
+    "cursor": "cu",
+    "limit": "l",
+    "receipts": "rc",
+    "ids": "is",
+    "status": "ss",
+    "user": "un",
+    "user_id": "u",
+    "users": "us",
+    "device": "dv",
+    "last_seen": "ls",
+    "from_user": "fu",
+    "typing": "ty",
+    "timestamp": "ts",
+    "message": "mg",
+    "message_id": "mi",
+    "message_ids": "ms",
+    "emoji": "e",
+    "op": "o",
+    "payload": "pl",
+    "_client_id": "ci",
+    "event_id": "ev",
+    "last_event_id": "le",
+    "resume_from": "rf",
+    "replayed": "rp",
+    "frame_type": "ft",
+    "retry_after": "ry",
+    "reaction_counts": "rx",
+    "count": "k",
+    "unread_delta": "ud",
+    "after": "af",
+}
+LONG_KEYS = {short: long for long, short in SHORT_KEYS.items()}
+
+
+def _is_default(item) -> bool:
+    return item is None or item is False or (isinstance(item, (str, list, tuple, dict)) and not item)
+
+
+def encode_frame(frame: dict) -> str:
+    return json.dumps(frame, separators=(",", ":"))
+
+
+def compact(value):
+    """
+    Shorten keys and drop default values (None, False, "", [], {}) recursively.
+    "text" is dropped where it only repeats "content".
+    """
+    if isinstance(value, dict):
+        out = {}
+        for key, item in value.items():
+            if key == "text" and item == value.get("content"):
+                continue
+            item = compact(item)
+            if not _is_default(item):
+                out[SHORT_KEYS.get(key, key)] = item
+        return out
+    if isinstance(value, (list, tuple)):
+        return [compact(item) for item in value]
+    return value
+
+
+def expand(value):
+    """Inverse key mapping for inbound msgpack frames; omitted keys stay omitted."""
+    if isinstance(value, dict):
+        return {LONG_KEYS.get(key, key): expand(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [expand(item) for item in value]
+    return value
+
+
+def encode_msgpack(frame: dict) -> bytes:
+    return msgpack.packb(compact(frame), use_bin_type=True)
+
+
+def decode_msgpack(data: bytes) -> dict:
+    """Decode one client frame; raises ValueError on anything but a msgpack map."""
+    frame = msgpack.unpackb(data, raw=False, strict_map_key=False)
+    if not isinstance(frame, dict):
+        raise ValueError("Frame must be a map")
+    return expand(frame)
+
+
+def frame_event(frame: dict, *, handler: str = "chat_frame", **extra) -> dict:
+    """
+    Channel-layer event carrying `frame` already encoded for the wire.
+    extra keys stay visible to receivers for per-recipient decisions
+    (e.g. exclude_user to drop a sender's own typing echo).
+    sent_at lets receivers measure fan-out latency.
+    """
+    inc("chat_group_sends_total", type=frame.get("type", "unknown"))
+    event = {"type": handler, "frame": encode_frame(frame), "sent_at": time.time(), **extra}
+    if MSGPACK_ENABLED:
+        event["frame_mp"] = encode_msgpack(frame)
+    return event
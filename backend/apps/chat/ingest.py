@@ -0,0 +1,295 @@
+# ================================================================
+# backend/apps/chat/ingest.py
+# Write-behind ingestion for socket messages
+# - messages from every consumer on a worker are collected for a few ms
+#   and inserted with bulk_create in one transaction
+# - room events go out (and senders are acked) only after the commit
+# - sends are idempotent on (sender, _client_id): a retry gets the
+#   original payload back and nothing is fanned out again
+# - rooms over CHAT_LAZY_FANOUT_MEMBERS get a room_activity hint instead
+#   of the body (see replay.publish_message)
+# - members' unread counters are bumped in the same transaction and
+#   pushed to their user groups; lazy rooms push at most once per
+#   CHAT_LAZY_UNREAD_PUSH_MS, since the hint only reaches open sockets
+# ================================================================
+import asyncio
+import logging
+from typing import NamedTuple
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, IntegrityError, transaction
+
+from apps.chat.activity import record_messages
+from apps.chat.membership import aget_membership
+from apps.chat.metrics import timed_db
+from apps.chat.models import Message, MessageUserMeta
+from apps.chat.replay import lazy_fanout, publish_message
+from apps.chat.unread import aunread_counts, bump_unread, publish_unread
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+CLIENT_ID_TTL = getattr(settings, "CHAT_CLIENT_ID_TTL", 600)
+MAX_CLIENT_ID_LENGTH = Message._meta.get_field("client_id").max_length
+
+
+def storable_client_id(client_id) -> str | None:
+    """The _client_id to dedupe on, or None if it cannot be stored."""
+    if isinstance(client_id, str) and 0 < len(client_id) <= MAX_CLIENT_ID_LENGTH:
+        return client_id
+    return None
+
+
+def sent_cache_key(sender_id, client_id) -> str:
+    return f"chat:sent:{sender_id}:{client_id}"
+
+
+class PendingMessage(NamedTuple):
+    room_id: str
+    sender_id: int
+    content: str
+    reply_to_id: str | None = None
+    forwarded_from_id: str | None = None
+    starred: bool = False
+    note: str = ""
+    client_id: str | None = None
+
+
+def _insert(items: list[PendingMessage]) -> tuple[list[Message], dict]:
+    messages = Message.objects.bulk_create(
+        [
+            Message(
+                room_id=item.room_id,
+                sender_id=item.sender_id,
+                content=item.content,
+                reply_to_id=item.reply_to_id,
+                forwarded_from_id=item.forwarded_from_id,
+                client_id=storable_client_id(item.client_id),
+            )
+            for item in items
+        ]
+    )
+    metas = MessageUserMeta.objects.bulk_create(
+        [
+            MessageUserMeta(message=msg, user_id=item.sender_id, starred=item.starred, note=item.note)
+            for item, msg in zip(items, messages)
+            if item.starred or item.note
+        ]
+    )
+    # bulk_create skips post_save, so do the room bookkeeping here
+    record_messages(messages)
+    bump_unread(messages)
+    return messages, {meta.message_id: meta for meta in metas}
+
+
+def _payloads(items: list[PendingMessage], messages: list[Message], metas: dict) -> list[dict]:
+    """Serialize a committed batch with one query for senders and one for quoted messages."""
+    from apps.chat.consumers import _msg_to_dict
+
+    senders = User.objects.in_bulk({item.sender_id for item in items})
+    ref_ids = {ref for item in items for ref in (item.reply_to_id, item.forwarded_from_id) if ref}
+    refs = {
+        str(pk): msg
+        for pk, msg in Message.objects.select_related("sender").in_bulk(ref_ids).items()
+    } if ref_ids else {}
+
+    payloads = []
+    for item, msg in zip(items, messages):
+        msg.sender = senders[item.sender_id]
+        msg.reply_to = refs.get(str(item.reply_to_id)) if item.reply_to_id else None
+        msg.forwarded_from = refs.get(str(item.forwarded_from_id)) if item.forwarded_from_id else None
+        meta = metas.get(msg.id)
+        msg.meta_for_user = [meta] if meta else []
+        msg.my_reactions = []
+        payload = _msg_to_dict(msg, current_user_id=item.sender_id, read_states=())
+        if item.client_id:
+            payload["_client_id"] = item.client_id
+        payloads.append(payload)
+    return payloads
+
+
+def _original_payload(item: PendingMessage) -> dict | None:
+    """Payload of the message an earlier send with the same _client_id created."""
+    client_id = storable_client_id(item.client_id)
+    if client_id is None:
+        return None
+    payload = cache.get(sent_cache_key(item.sender_id, client_id))
+    if payload is not None:
+        return payload
+    from apps.chat.consumers import _msg_to_dict
+
+    msg = (
+        Message.objects.filter(sender_id=item.sender_id, client_id=client_id)
+        .select_related("sender", "reply_to", "reply_to__sender", "forwarded_from", "forwarded_from__sender", "pinned_by")
+        .first()
+    )
+    if msg is None:
+        return None
+    msg.meta_for_user = list(MessageUserMeta.objects.filter(message=msg, user_id=item.sender_id))
+    payload = _msg_to_dict(msg, current_user_id=item.sender_id)
+    payload["_client_id"] = item.client_id
+    return payload
+
+
+def write_messages(items: list[PendingMessage]) -> list:
+    """
+    Insert a batch in one transaction and return (payload, created) per item.
+    Retries of an earlier send come back with created=False. If the batch
+    fails (e.g. a bad reply_to id or a retry racing its original), items
+    are retried one by one so a single bad message does not reject its
+    neighbours; failed items get their exception in place of a result.
+    """
+    results = [None] * len(items)
+    if any(storable_client_id(item.client_id) for item in items):
+        cached = cache.get_many(
+            [sent_cache_key(item.sender_id, item.client_id) for item in items if storable_client_id(item.client_id)]
+        )
+        for index, item in enumerate(items):
+            payload = cached.get(sent_cache_key(item.sender_id, item.client_id))
+            if payload is not None:
+                results[index] = (payload, False)
+    fresh = [index for index, result in enumerate(results) if result is None]
+    if not fresh:
+        return results
+    batch = [items[index] for index in fresh]
+
+    try:
+        with transaction.atomic():
+            messages, metas = _insert(batch)
+    except (DatabaseError, ValidationError) as exc:
+        if len(batch) > 1:
+            logger.warning("Message batch of %d failed, retrying one by one", len(batch))
+            for index in fresh:
+                results[index] = write_messages([items[index]])[0]
+            return results
+        original = _original_payload(batch[0]) if isinstance(exc, IntegrityError) else None
+        results[fresh[0]] = (original, False) if original is not None else exc
+        return results
+
+    payloads = _payloads(batch, messages, metas)
+    cache.set_many(
+        {
+            sent_cache_key(item.sender_id, item.client_id): payload
+            for item, payload in zip(batch, payloads)
+            if storable_client_id(item.client_id)
+        },
+        CLIENT_ID_TTL,
+    )
+    for index, payload in zip(fresh, payloads):
+        results[index] = (payload, True)
+    return results
+
+
+class MessageIngestor:
+    """
+    Per-worker write-behind stage for socket messages.
+    submit() parks the caller until its message is committed and published,
+    and returns (payload, broadcast). broadcast is False when the room did
+    not get the payload itself (a retried send, or a lazy fan-out room), so
+    the caller must ack its own socket. Batches are written one at a time, so room events leave in insert order.
+    """
+
+    def __init__(self, window: float, max_batch: int, lazy_unread_window: float = 1.0):
+        self.window = window
+        self.max_batch = max_batch
+        self.lazy_unread_window = lazy_unread_window
+        self._unread_pushes: dict[str, asyncio.Task] = {}
+        self._pending: list[tuple[PendingMessage, object, asyncio.Future]] = []
+        self._task = None
+        self._lock = asyncio.Lock()
+        # the loop only keeps weak references to tasks; hold flushes here
+        self._flushes: set = set()
+
+    async def submit(self, channel_layer, item: PendingMessage) -> tuple[dict, bool]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((item, channel_layer, future))
+        if len(self._pending) >= self.max_batch:
+            self._spawn(self.flush())
+        elif self._task is None:
+            self._task = self._spawn(self._flush_later())
+        return await future
+
+    def _spawn(self, coro) -> asyncio.Task:
+        task = asyncio.create_task(coro)
+        self._flushes.add(task)
+        task.add_done_callback(self._flushes.discard)
+        return task
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._task = None
+        await self.flush()
+
+    async def flush(self):
+        batch, self._pending = self._pending, []
+        # an empty flush still waits for a batch already being written
+        async with self._lock:
+            if not batch:
+                return
+            try:
+                results = await timed_db(write_messages)([item for item, _, _ in batch])
+            except Exception as exc:
+                logger.exception("Failed to write message batch")
+                results = [exc] * len(batch)
+
+            lazy, touched = {}, {}
+            for (item, channel_layer, future), result in zip(batch, results):
+                if isinstance(result, Exception):
+                    if not future.done():
+                        future.set_exception(result)
+                    continue
+                payload, created = result
+                broadcast = False
+                if created:
+                    touched.setdefault(item.room_id, (channel_layer, set()))[1].add(item.sender_id)
+                    try:
+                        if item.room_id not in lazy:
+                            lazy[item.room_id] = lazy_fanout(await aget_membership(item.room_id))
+                        event_id = await publish_message(
+                            channel_layer, item.room_id, payload, lazy=lazy[item.room_id]
+                        )
+                        broadcast = not lazy[item.room_id]
+                        if not broadcast:
+                            payload = {**payload, "event_id": event_id}
+                    except Exception:
+                        logger.exception("Failed to publish message %s", payload["id"])
+                if not future.done():
+                    future.set_result((payload, broadcast))
+
+            for room_id, (channel_layer, senders) in touched.items():
+                if lazy.get(room_id):
+                    if room_id not in self._unread_pushes:
+                        self._unread_pushes[room_id] = self._spawn(self._push_unread_later(channel_layer, room_id))
+                    continue
+                try:
+                    counts = await timed_db(aunread_counts)(room_id)
+                    if len(senders) == 1:
+                        # a lone sender's own counter did not move
+                        counts = [(user_id, count) for user_id, count in counts if user_id not in senders]
+                    await publish_unread(channel_layer, room_id, counts)
+                except Exception:
+                    logger.exception("Failed to push unread counts for room %s", room_id)
+
+    async def _push_unread_later(self, channel_layer, room_id):
+        """One batched unread push for a lazy room's members (badges in other rooms)."""
+        try:
+            await asyncio.sleep(self.lazy_unread_window)
+        finally:
+            self._unread_pushes.pop(room_id, None)
+        try:
+            counts = await timed_db(aunread_counts)(room_id)
+            await publish_unread(channel_layer, room_id, counts)
+        except Exception:
+            logger.exception("Failed to push unread counts for room %s", room_id)
+
+
+message_ingestor = MessageIngestor(
+    window=getattr(settings, "CHAT_INGEST_FLUSH_MS", 5) / 1000,
+    max_batch=getattr(settings, "CHAT_INGEST_MAX_BATCH", 200),
+    lazy_unread_window=getattr(settings, "CHAT_LAZY_UNREAD_PUSH_MS", 1000) / 1000,
+)
@@ -0,0 +1,33 @@
+# ================================================================
+# backend/apps/chat/layerstore.py
+# Per-channel-layer shared state: Redis or in-process
+# - replay logs, rate-limit buckets and presence live next to the
+#   channel layer, in its Redis when it has one (channels_redis) and in
+#   this process for the in-memory layer
+# - one place decides which, so the three stores cannot drift apart
+# ================================================================
+
+
+def uses_redis(channel_layer) -> bool:
+    """True for a channels_redis layer, whose connection() reaches Redis."""
+    return hasattr(channel_layer, "connection") and hasattr(channel_layer, "ring_size")
+
+
+class LayerStore:
+    """
+    Lazily built store per channel layer. `redis(channel_layer)` builds
+    the shared version, `local()` the single-worker one.
+    """
+
+    def __init__(self, redis, local):
+        self._redis = redis
+        self._local = local
+        self._stores: dict[int, object] = {}
+
+    def get(self, channel_layer):
+        key = id(channel_layer)
+        store = self._stores.get(key)
+        if store is None:
+            store = self._redis(channel_layer) if uses_redis(channel_layer) else self._local()
+            self._stores[key] = store
+        return store
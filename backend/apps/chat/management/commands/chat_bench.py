@@ -0,0 +1,427 @@
+# ================================================================
+# backend/apps/chat/management/commands/chat_bench.py
+# WebSocket load generator + fan-out benchmark for ChatConsumer
+# - synthetic users/rooms in 1:1, 50-member or 5k-member topologies
+# - message / typing / receipt / reconnect workloads
+# - in-process (WebsocketCommunicator against the ASGI app) or over the
+#   network against a running ASGI server (--url, needs `websockets`)
+# ================================================================
+import asyncio
+import json
+import random
+import time
+import uuid
+from datetime import datetime
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+from apps.accounts.serializers_jwt import CustomTokenObtainPairSerializer
+from apps.chat.frames import MSGPACK_SUBPROTOCOL, decode_msgpack, encode_msgpack
+from apps.chat.ingest import message_ingestor
+from apps.chat.metrics import Histogram
+from apps.chat.models import ChatRoom
+from apps.chat.reactions import reaction_buffer
+from apps.chat.receipts import receipt_buffer
+
+User = get_user_model()
+
+# topology: (members per room, default rooms, default senders per room)
+TOPOLOGIES = {
+    "direct": (2, 100, 2),
+    "group": (50, 4, 5),
+    "broadcast": (5000, 1, 1),
+}
+WORKLOADS = ("message", "typing", "receipt", "reconnect")
+BENCH_PREFIX = "bench:"
+
+
+class CommunicatorTransport:
+    """In-process socket: the ASGI app driven through channels.testing."""
+
+    def __init__(self, path, subprotocols):
+        from channels.testing import WebsocketCommunicator
+
+        application = import_string(settings.ASGI_APPLICATION)
+        self.communicator = WebsocketCommunicator(application, path, subprotocols=subprotocols)
+
+    async def connect(self, timeout):
+        connected, _ = await self.communicator.connect(timeout=timeout)
+        return connected
+
+    async def send(self, data):
+        if isinstance(data, bytes):
+            await self.communicator.send_to(bytes_data=data)
+        else:
+            await self.communicator.send_to(text_data=data)
+
+    async def recv(self):
+        message = await self.communicator.receive_output(timeout=None)
+        if message["type"] == "websocket.close":
+            raise ConnectionError(message.get("code"))
+        return message.get("bytes") or message.get("text")
+
+    async def close(self):
+        await self.communicator.disconnect()
+
+
+class NetworkTransport:
+    """Real socket against a running ASGI server (daphne/uvicorn)."""
+
+    def __init__(self, url, subprotocols):
+        self.url = url
+        self.subprotocols = subprotocols
+        self.ws = None
+
+    async def connect(self, timeout):
+        import websockets
+
+        self.ws = await websockets.connect(
+            self.url, subprotocols=self.subprotocols or None, open_timeout=timeout, max_size=None,
+        )
+        return True
+
+    async def send(self, data):
+        await self.ws.send(data)
+
+    async def recv(self):
+        try:
+            return await self.ws.recv()
+        except Exception as exc:
+            raise ConnectionError(str(exc)) from exc
+
+    async def close(self):
+        await self.ws.close()
+
+
+class Stats:
+    def __init__(self):
+        self.histograms = {name: Histogram() for name in ("connect", "ack", "fanout", "typing", "receipt", "reconnect")}
+        self.counts = {
+            name: 0
+            for name in ("sent", "expected", "delivered", "hints", "pulls", "typing", "receipts", "rate_limited", "errors", "reconnects")
+        }
+
+    def observe(self, name, seconds):
+        self.histograms[name].record(seconds)
+
+
+class BenchClient:
+    """One synthetic user connected to one room socket."""
+
+    def __init__(self, bench, user_id, token, room_id):
+        self.bench = bench
+        self.user_id = user_id
+        self.token = token
+        self.room_id = room_id
+        self.transport = None
+        self.reader = None
+        self.joined = None
+        self.last_event_id = None
+        self.pending_receipts: dict[str, float] = {}
+        # lazy fan-out rooms send room_activity hints; bodies come from pull
+        self.pulling = False
+        self.pull_again = False
+        self.seen_ids: set = set()
+
+    def _path(self):
+        path = f"/ws/chat/{self.room_id}/?token={self.token}"
+        if self.last_event_id is not None:
+            path += f"&resume_from={self.last_event_id}"
+        return path
+
+    async def connect(self):
+        bench = self.bench
+        subprotocols = [MSGPACK_SUBPROTOCOL] if bench.msgpack else []
+        if bench.url:
+            self.transport = NetworkTransport(bench.url.rstrip("/") + self._path(), subprotocols)
+        else:
+            self.transport = CommunicatorTransport(self._path(), subprotocols)
+        self.joined = asyncio.get_running_loop().create_future()
+        self.pulling = self.pull_again = False
+        start = time.perf_counter()
+        if not await self.transport.connect(bench.timeout):
+            raise ConnectionError("handshake rejected")
+        self.reader = asyncio.create_task(self._read())
+        # the join is done once history (or the resume replay) arrives
+        await asyncio.wait_for(self.joined, bench.timeout)
+        return time.perf_counter() - start
+
+    async def close(self):
+        if self.reader:
+            self.reader.cancel()
+        if self.transport:
+            try:
+                await self.transport.close()
+            except Exception:
+                pass
+
+    async def send(self, frame):
+        await self.transport.send(encode_msgpack(frame) if self.bench.msgpack else json.dumps(frame))
+
+    async def _pull(self):
+        if self.pulling:
+            self.pull_again = True
+            return
+        self.pulling, self.pull_again = True, False
+        self.bench.stats.counts["pulls"] += 1
+        await self.send({"type": "pull", "after": self.last_event_id or 0})
+
+    async def _read(self):
+        stats = self.bench.stats
+        while True:
+            try:
+                raw = await self.transport.recv()
+            except (ConnectionError, asyncio.CancelledError):
+                return
+            now = time.perf_counter()
+            frame = decode_msgpack(raw) if isinstance(raw, bytes) else json.loads(raw)
+            kind = frame.get("type")
+            # a hint's event_id is what the pull has to fetch, and in a lazy
+            # room the sender's own ack can overtake earlier events
+            if frame.get("event_id") and kind != "room_activity" and frame.get("sender_id") != self.user_id:
+                self.last_event_id = frame["event_id"]
+            if kind in ("history", "resumed"):
+                if kind == "history":
+                    self.last_event_id = frame.get("last_event_id", self.last_event_id)
+                if not self.joined.done():
+                    self.joined.set_result(True)
+            elif kind == "room_activity":
+                stats.counts["hints"] += 1
+                await self._pull()
+            elif kind == "pulled":
+                self.pulling = False
+                if frame.get("has_more") or self.pull_again:
+                    await self._pull()
+            elif kind == "message" and (frame.get("content") or "").startswith(BENCH_PREFIX):
+                if frame["id"] in self.seen_ids:
+                    continue  # a pull also returns the sender's own, already-acked message
+                self.seen_ids.add(frame["id"])
+                sent_at = float(frame["content"][len(BENCH_PREFIX):].split(":")[0])
+                if frame.get("sender_id") == self.user_id:
+                    stats.observe("ack", now - sent_at)
+                else:
+                    stats.counts["delivered"] += 1
+                    stats.observe("fanout", now - sent_at)
+                    if self.bench.workload == "receipt":
+                        self.pending_receipts[frame["id"]] = time.perf_counter()
+                        await self.send({"type": "read", "ids": [frame["id"]]})
+            elif kind == "typing":
+                stats.counts["typing"] += 1
+                sent = datetime.fromisoformat(frame["timestamp"]).timestamp()
+                stats.observe("typing", max(0.0, time.time() - sent))
+            elif kind == "delivery":
+                for receipt in frame.get("receipts", []):
+                    if receipt.get("user_id") != self.user_id:
+                        continue
+                    for message_id in receipt.get("ids", []):
+                        started = self.pending_receipts.pop(message_id, None)
+                        if started is not None:
+                            stats.counts["receipts"] += 1
+                            stats.observe("receipt", now - started)
+            elif kind == "error":
+                if frame.get("retry_after") is not None:
+                    stats.counts["rate_limited"] += 1
+                else:
+                    stats.counts["errors"] += 1
+
+
+class Bench:
+    def __init__(self, *, workload, url, msgpack, timeout, rate, duration, reconnect_every, connect_concurrency):
+        self.workload = workload
+        self.url = url
+        self.msgpack = msgpack
+        self.timeout = timeout
+        self.rate = rate
+        self.duration = duration
+        self.reconnect_every = reconnect_every
+        self.connect_concurrency = connect_concurrency
+        self.stats = Stats()
+        self.receivers: dict[str, int] = {}  # room id -> connected clients
+
+    async def run(self, clients, senders):
+        gate = asyncio.Semaphore(self.connect_concurrency)
+
+        async def open_one(client):
+            async with gate:
+                try:
+                    self.stats.observe("connect", await client.connect())
+                except Exception:
+                    self.stats.counts["errors"] += 1
+                    return False
+                return True
+
+        started = time.perf_counter()
+        opened = await asyncio.gather(*(open_one(c) for c in clients))
+        connect_time = time.perf_counter() - started
+        live_senders = [c for c, ok in zip(clients, opened) if ok and c in senders]
+        for client in (c for c, ok in zip(clients, opened) if ok):
+            self.receivers[client.room_id] = self.receivers.get(client.room_id, 0) + 1
+
+        # rates use the wall clock: a saturated loop overruns --duration
+        load_started = time.perf_counter()
+        tasks = [asyncio.create_task(self._drive(c)) for c in live_senders]
+        if self.workload == "reconnect":
+            receivers = [c for c, ok in zip(clients, opened) if ok and c not in senders]
+            tasks += [asyncio.create_task(self._reconnect_loop(c)) for c in receivers]
+        await asyncio.sleep(self.duration)
+        for task in tasks:
+            task.cancel()
+        load_time = time.perf_counter() - load_started
+        # let in-flight fan-out drain before closing
+        await asyncio.sleep(min(2.0, self.timeout))
+        if not self.url:
+            # in-process buffers die with this loop; write them before teardown
+            await message_ingestor.flush()
+            await receipt_buffer.flush_all()
+            await reaction_buffer.flush_all()
+        drained_time = time.perf_counter() - load_started
+
+        await asyncio.gather(*(c.close() for c in clients), return_exceptions=True)
+        return sum(opened), connect_time, load_time, drained_time
+
+    async def _drive(self, client):
+        interval = 1 / self.rate
+        # spread senders so they do not fire in lockstep
+        await asyncio.sleep(random.random() * interval)
+        seq = 0
+        while True:
+            if self.workload == "typing":
+                await client.send({"type": "typing"})
+            else:
+                seq += 1
+                await client.send({"type": "message", "content": f"{BENCH_PREFIX}{time.perf_counter()}:{seq}"})
+                # every other connected member of the room should get it
+                self.stats.counts["expected"] += self.receivers[client.room_id] - 1
+            self.stats.counts["sent"] += 1
+            await asyncio.sleep(interval)
+
+    async def _reconnect_loop(self, client):
+        while True:
+            await asyncio.sleep(self.reconnect_every * (0.5 + random.random()))
+            await client.close()
+            try:
+                self.stats.observe("reconnect", await client.connect())
+                self.stats.counts["reconnects"] += 1
+            except Exception:
+                self.stats.counts["errors"] += 1
+
+
+class Command(BaseCommand):
+    help = (
+        "Load-test ChatConsumer with synthetic clients and report throughput "
+        "and fan-out latency. Creates throwaway bench users/rooms and removes "
+        "them afterwards unless --keep is given. Per-user rate limits apply "
+        "(CHAT_WS_RATE_LIMITS); raise them for stress runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--topology", choices=sorted(TOPOLOGIES), default="group")
+        parser.add_argument("--rooms", type=int, help="rooms to create (default depends on topology)")
+        parser.add_argument("--members", type=int, help="members per room (default depends on topology)")
+        parser.add_argument("--senders", type=int, help="active senders per room")
+        parser.add_argument("--workload", choices=WORKLOADS, default="message")
+        parser.add_argument("--rate", type=float, default=1.0, help="frames per second per sender")
+        parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+        parser.add_argument("--reconnect-every", type=float, default=5.0, help="mean seconds between reconnects")
+        parser.add_argument("--connect-concurrency", type=int, default=100)
+        parser.add_argument("--timeout", type=float, default=10.0)
+        parser.add_argument("--msgpack", action="store_true", help="negotiate the msgpack subprotocol")
+        parser.add_argument("--url", help="ws://host:port of a running ASGI server; in-process if omitted")
+        parser.add_argument("--keep", action="store_true", help="keep the bench users and rooms")
+
+    def handle(self, *args, **options):
+        if options["url"]:
+            try:
+                import websockets  # noqa: F401
+            except ImportError as exc:
+                raise CommandError("--url needs the `websockets` package (requirements/dev.txt)") from exc
+
+        members, rooms, senders = TOPOLOGIES[options["topology"]]
+        members = options["members"] or members
+        rooms = options["rooms"] or rooms
+        if options["workload"] == "reconnect" and not options["senders"]:
+            # everyone else in the room is a reconnecting receiver
+            senders = 1
+        senders = min(options["senders"] or senders, members)
+        if members < 2 or rooms < 1:
+            raise CommandError("Need at least one room with two members")
+
+        tag = uuid.uuid4().hex[:8]
+        self.stdout.write(f"Creating {rooms} room(s) x {members} members (bench {tag})...")
+        room_ids, clients_spec = self._create_fixtures(tag, rooms, members)
+
+        bench = Bench(
+            workload=options["workload"],
+            url=options["url"],
+            msgpack=options["msgpack"],
+            timeout=options["timeout"],
+            rate=options["rate"],
+            duration=options["duration"],
+            reconnect_every=options["reconnect_every"],
+            connect_concurrency=options["connect_concurrency"],
+        )
+        clients, active = [], set()
+        for room_index, room_members in enumerate(clients_spec):
+            for member_index, (user_id, token) in enumerate(room_members):
+                client = BenchClient(bench, user_id, token, room_ids[room_index])
+                clients.append(client)
+                if member_index < senders:
+                    active.add(client)
+
+        try:
+            opened, connect_time, load_time, drained_time = asyncio.run(bench.run(clients, active))
+            self._report(bench, options, len(clients), opened, connect_time, load_time, drained_time)
+        finally:
+            if not options["keep"]:
+                ChatRoom.objects.filter(id__in=room_ids).delete()
+                User.objects.filter(username__startswith=f"bench_{tag}_").delete()
+
+    def _create_fixtures(self, tag, rooms, members):
+        User.objects.bulk_create(
+            [
+                User(username=f"bench_{tag}_{n}", email=f"bench_{tag}_{n}@bench.invalid", password="!")
+                for n in range(rooms * members)
+            ],
+            batch_size=1000,
+        )
+        users = list(User.objects.filter(username__startswith=f"bench_{tag}_").order_by("id"))
+        room_objs = ChatRoom.objects.bulk_create(
+            [ChatRoom(name=f"bench {tag} #{n}", is_group=members > 2) for n in range(rooms)]
+        )
+        spec = []
+        for index, room in enumerate(room_objs):
+            room_users = users[index * members:(index + 1) * members]
+            # through add() so member_count, read states and the membership
+            # cache are set up by the signals, as for real rooms
+            room.participants.add(*room_users)
+            spec.append([(u.id, str(CustomTokenObtainPairSerializer.get_token(u).access_token)) for u in room_users])
+        return [str(room.id) for room in room_objs], spec
+
+    def _report(self, bench, options, total, opened, connect_time, load_time, drained_time):
+        stats = bench.stats
+        counts = stats.counts
+        w = self.stdout.write
+        w("")
+        w(f"topology={options['topology']} workload={bench.workload} "
+          f"transport={'network' if bench.url else 'in-process'} codec={'msgpack' if bench.msgpack else 'json'}")
+        w(f"clients: {opened}/{total} connected in {connect_time:.2f}s")
+        # sends over the measured load phase, deliveries until the drain ended
+        w(f"load: {load_time:.2f}s wall ({options['duration']:g}s requested)  "
+          f"sent={counts['sent']} ({counts['sent'] / load_time:.1f}/s)  "
+          f"delivered={counts['delivered']} ({counts['delivered'] / drained_time:.1f}/s over {drained_time:.2f}s)")
+        if counts["expected"]:
+            lost = counts["expected"] - counts["delivered"]
+            w(f"deliveries: {counts['delivered']}/{counts['expected']} expected, "
+              f"lost={lost} ({lost / counts['expected']:.1%})")
+        w(f"hints={counts['hints']} pulls={counts['pulls']} typing={counts['typing']} receipts={counts['receipts']} reconnects={counts['reconnects']} "
+          f"rate_limited={counts['rate_limited']} errors={counts['errors']}")
+        w(f"{'latency (ms)':<14}{'count':>9}{'p50':>10}{'p90':>10}{'p99':>10}{'max':>10}")
+        for name, histogram in stats.histograms.items():
+            if not histogram.count:
+                continue
+            snap = histogram.snapshot()
+            w(f"{name:<14}{snap['count']:>9}{snap['p50_ms']:>10.2f}{snap['p90_ms']:>10.2f}"
+              f"{snap['p99_ms']:>10.2f}{snap['max_ms']:>10.2f}")
@@ -0,0 +1,39 @@
+# ================================================================
+# backend/apps/chat/management/commands/chat_reconcile_unread.py
+# Recount RoomReadState.unread_count from the read cursors
+# - run periodically (cron) to repair counters that drifted, e.g. after
+#   bulk deletes that bypass signals
+# - gives participants without a read-state row one first
+# ================================================================
+from django.core.management.base import BaseCommand
+from django.db.models import Exists, OuterRef
+
+from apps.chat.models import ChatRoom, RoomReadState
+from apps.chat.unread import recount_unread
+
+
+class Command(BaseCommand):
+    help = "Recompute per-member unread counters, one room at a time."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--room", action="append", dest="rooms", help="room id (repeatable); all rooms if omitted")
+
+    def handle(self, *args, **options):
+        participants = ChatRoom.participants.through.objects.all()
+        if options["rooms"]:
+            participants = participants.filter(chatroom_id__in=options["rooms"])
+        missing = participants.exclude(
+            Exists(RoomReadState.objects.filter(room_id=OuterRef("chatroom_id"), user_id=OuterRef("user_id")))
+        ).values_list("chatroom_id", "user_id")
+        created = RoomReadState.objects.bulk_create(
+            [RoomReadState(room_id=room_id, user_id=user_id) for room_id, user_id in missing.iterator(chunk_size=5000)],
+            batch_size=1000,
+            ignore_conflicts=True,
+        )
+
+        room_ids = options["rooms"] or ChatRoom.objects.values_list("id", flat=True).iterator(chunk_size=1000)
+        rooms = rows = 0
+        for room_id in room_ids:
+            rows += recount_unread(room_id)
+            rooms += 1
+        self.stdout.write(f"Corrected {rows} counters in {rooms} rooms ({len(created)} rows added)")
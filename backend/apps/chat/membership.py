@@ -0,0 +1,134 @@
+# ================================================================
+# backend/apps/chat/membership.py
+# Versioned room membership cache (room -> member ids / admin ids)
+# - one lookup API for WS connect, REST viewsets and invites
+# - invalidated from m2m_changed on ChatRoom.participants / admins
+# - a* variants use the async cache / ORM APIs for socket consumers
+# ================================================================
+import uuid
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+from apps.chat.models import ChatRoom
+
+MEMBERSHIP_TTL = getattr(settings, "CHAT_MEMBERSHIP_CACHE_TTL", 300)
+
+
+class Membership(NamedTuple):
+    members: frozenset
+    admins: frozenset
+
+
+def _version_key(room_id) -> str:
+    return f"chat:membership:ver:{room_id}"
+
+
+def _entry_key(room_id, version) -> str:
+    return f"chat:membership:{room_id}:v{version}"
+
+
+def _load(room_id) -> Membership | None:
+    room = ChatRoom.objects.filter(id=room_id).only("id").first()
+    if room is None:
+        return None
+    return Membership(
+        members=frozenset(room.participants.values_list("id", flat=True)),
+        admins=frozenset(room.admins.values_list("id", flat=True)),
+    )
+
+
+async def _aload(room_id) -> Membership | None:
+    room = await ChatRoom.objects.filter(id=room_id).only("id").afirst()
+    if room is None:
+        return None
+    return Membership(
+        members=frozenset([pk async for pk in room.participants.values_list("id", flat=True)]),
+        admins=frozenset([pk async for pk in room.admins.values_list("id", flat=True)]),
+    )
+
+
+def _parse_room_id(room_id) -> uuid.UUID | None:
+    try:
+        return uuid.UUID(str(room_id))
+    except ValueError:
+        return None
+
+
+def _from_cache(cached) -> Membership | None:
+    return Membership(frozenset(cached[0]), frozenset(cached[1])) if cached else None
+
+
+def _to_cache(membership: Membership | None):
+    # an empty tuple remembers a missing room until the TTL lapses
+    return (list(membership.members), list(membership.admins)) if membership else ()
+
+
+def get_membership(room_id) -> Membership | None:
+    """Member and admin ids of a room, or None when the room does not exist."""
+    room_id = _parse_room_id(room_id)
+    if room_id is None:
+        return None
+
+    version = cache.get(_version_key(room_id), 0)
+    key = _entry_key(room_id, version)
+    cached = cache.get(key)
+    if cached is not None:
+        return _from_cache(cached)
+
+    membership = _load(room_id)
+    cache.set(key, _to_cache(membership), MEMBERSHIP_TTL)
+    return membership
+
+
+async def aget_membership(room_id) -> Membership | None:
+    """get_membership() for async callers, without a database_sync_to_async hop."""
+    room_id = _parse_room_id(room_id)
+    if room_id is None:
+        return None
+
+    version = await cache.aget(_version_key(room_id), 0)
+    key = _entry_key(room_id, version)
+    cached = await cache.aget(key)
+    if cached is not None:
+        return _from_cache(cached)
+
+    membership = await _aload(room_id)
+    await cache.aset(key, _to_cache(membership), MEMBERSHIP_TTL)
+    return membership
+
+
+def is_member(room_id, user_id) -> bool:
+    membership = get_membership(room_id)
+    return membership is not None and user_id in membership.members
+
+
+def is_admin(room_id, user_id) -> bool:
+    membership = get_membership(room_id)
+    return membership is not None and user_id in membership.admins
+
+
+async def ais_member(room_id, user_id) -> bool:
+    membership = await aget_membership(room_id)
+    return membership is not None and user_id in membership.members
+
+
+def _bump(room_id) -> None:
+    key = _version_key(room_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+def invalidate_membership(room_id) -> None:
+    """
+    Retire the cached entry by moving the room to a new version.
+    Bumped again on commit so a reader that re-cached the pre-commit
+    rows inside the transaction window cannot keep them.
+    """
+    _bump(room_id)
+    transaction.on_commit(lambda: _bump(room_id))
@@ -0,0 +1,222 @@
+# ================================================================
+# backend/apps/chat/metrics.py
+# In-process instrumentation for the chat socket tier
+# - counters and log-linear (HDR-style) latency histograms, aggregated
+#   per worker with plain dict updates on the event loop
+# - exposed through the admin MetricsView and a text scrape endpoint
+# ================================================================
+import functools
+import inspect
+import time
+from collections import defaultdict
+
+from channels.db import database_sync_to_async
+
+from apps.chat.outbound import outbound_stats
+
+# client frame types worth their own label; anything else is "other"
+FRAME_TYPES = frozenset({
+    "message", "typing", "stopped_typing", "presence", "reaction",
+    "focus", "delivered", "read", "history_before", "history_after",
+    "pull", "ping", "subscribe", "unsubscribe",
+})
+
+HELP = {
+    "chat_socket_connects_total": "WebSocket connections accepted",
+    "chat_socket_disconnects_total": "WebSocket disconnects by close code",
+    "chat_frames_in_total": "Client frames received by type",
+    "chat_frames_out_total": "Frames written to sockets by codec",
+    "chat_bytes_out_total": "Bytes written to sockets by codec",
+    "chat_rate_limited_total": "Client frames dropped by the rate limiter",
+    "chat_group_sends_total": "Channel-layer group events by frame type",
+    "chat_handler_seconds": "Time to handle one client frame",
+    "chat_db_seconds": "Time awaiting a DB helper (async ORM or database_sync_to_async)",
+    "chat_fanout_seconds": "Time from group event creation to the receiving socket",
+}
+
+
+def frame_label(msg_type) -> str:
+    # "type" comes from the client and may be any JSON value
+    return msg_type if isinstance(msg_type, str) and msg_type in FRAME_TYPES else "other"
+
+
+class Histogram:
+    """
+    Log-linear histogram over microseconds: exact below 32us, then 16
+    linear sub-buckets per power of two (about 6% relative error).
+    Buckets are sparse, so an idle label costs a few dict entries.
+    """
+
+    SUB_BITS = 5
+    SUB = 1 << SUB_BITS
+    HALF = SUB >> 1
+
+    def __init__(self):
+        self.buckets: dict[int, int] = defaultdict(int)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def index(cls, micros: int) -> int:
+        if micros < cls.SUB:
+            return micros
+        shift = micros.bit_length() - cls.SUB_BITS
+        return cls.SUB + (shift - 1) * cls.HALF + (micros >> shift) - cls.HALF
+
+    @classmethod
+    def upper_bound(cls, index: int) -> int:
+        if index < cls.SUB:
+            return index
+        shift = (index - cls.SUB) // cls.HALF + 1
+        top = (index - cls.SUB) % cls.HALF + cls.HALF
+        return ((top + 1) << shift) - 1
+
+    def record(self, seconds: float):
+        seconds = max(0.0, seconds)
+        self.buckets[self.index(int(seconds * 1_000_000))] += 1
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound (seconds) of the bucket holding the q-th value."""
+        if not self.count:
+            return 0.0
+        rank = max(1, round(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                return min(self.upper_bound(index) / 1_000_000, self.max)
+        return self.max
+
+    def snapshot(self) -> dict:
+        ms = lambda seconds: round(seconds * 1000, 3)
+        return {
+            "count": self.count,
+            "mean_ms": ms(self.total / self.count) if self.count else 0.0,
+            "p50_ms": ms(self.quantile(0.5)),
+            "p90_ms": ms(self.quantile(0.9)),
+            "p99_ms": ms(self.quantile(0.99)),
+            "max_ms": ms(self.max),
+        }
+
+
+_counters: dict[tuple, int] = defaultdict(int)
+_histograms: dict[tuple, Histogram] = {}
+
+
+def _key(name, labels) -> tuple:
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name: str, amount: int = 1, **labels):
+    _counters[_key(name, labels)] += amount
+
+
+def observe(name: str, seconds: float, **labels):
+    key = _key(name, labels)
+    histogram = _histograms.get(key)
+    if histogram is None:
+        histogram = _histograms[key] = Histogram()
+    histogram.record(seconds)
+
+
+class timed:
+    """Context manager recording wall time into a histogram (fine around awaits)."""
+
+    __slots__ = ("name", "labels", "start")
+
+    def __init__(self, name: str, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        observe(self.name, time.perf_counter() - self.start, **self.labels)
+
+
+def timed_db(func):
+    """
+    Record chat_db_seconds for a DB helper. Plain functions are run through
+    database_sync_to_async (thread-pool wait included, since that is what
+    the socket experiences); async ORM coroutines are awaited as they are.
+    """
+    run = func if inspect.iscoroutinefunction(func) else database_sync_to_async(func)
+    helper = func.__name__
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        with timed("chat_db_seconds", helper=helper):
+            return await run(*args, **kwargs)
+
+    return wrapper
+
+
+def timed_frames(handler):
+    """Count and time a (self, room_id, data) client frame handler by frame type."""
+
+    @functools.wraps(handler)
+    async def wrapper(self, room_id, data):
+        frame = frame_label(data.get("type", "message"))
+        inc("chat_frames_in_total", type=frame)
+        with timed("chat_handler_seconds", frame=frame):
+            return await handler(self, room_id, data)
+
+    return wrapper
+
+
+def metrics_snapshot() -> dict:
+    """Counters and histogram summaries for this worker, keyed by label string."""
+
+    def label_str(name, labels):
+        return name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else "")
+
+    return {
+        "counters": {label_str(*key): value for key, value in sorted(_counters.items())},
+        "histograms": {label_str(*key): h.snapshot() for key, h in sorted(_histograms.items())},
+    }
+
+
+def _labels_text(labels, extra=()) -> str:
+    pairs = list(labels) + list(extra)
+    if not pairs:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in pairs)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + "}"
+
+
+def render_text() -> str:
+    """Prometheus text exposition (histograms as summaries with quantiles)."""
+    lines = []
+    by_name = defaultdict(list)
+    for (name, labels), value in sorted(_counters.items()):
+        by_name[name].append((labels, value))
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} counter")
+        lines.extend(f"{name}{_labels_text(labels)} {value}" for labels, value in series)
+
+    by_name = defaultdict(list)
+    for (name, labels), histogram in sorted(_histograms.items()):
+        by_name[name].append((labels, histogram))
+    for name, series in by_name.items():
+        lines.append(f"# HELP {name} {HELP.get(name, name)}")
+        lines.append(f"# TYPE {name} summary")
+        for labels, histogram in series:
+            for q in (0.5, 0.9, 0.99):
+                lines.append(f"{name}{_labels_text(labels, [('quantile', q)])} {histogram.quantile(q):.6f}")
+            lines.append(f"{name}_sum{_labels_text(labels)} {histogram.total:.6f}")
+            lines.append(f"{name}_count{_labels_text(labels)} {histogram.count}")
+
+    for key, value in outbound_stats().items():
+        counter = key in ("dropped_frames", "slow_consumer_closes")
+        name = f"chat_outbound_{key}" + ("_total" if counter else "")
+        lines.append(f"# TYPE {name} {'counter' if counter else 'gauge'}")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
@@ -1,25 +1,75 @@
 #backend/apps/chat/middleware.py
 # ===========================================================
 # Custom TokenAuthMiddleware for JWT-based WebSocket auth
+# - principal built from signed claims + a short-TTL cache,
+#   so handshakes do not query the users table
 # ===========================================================
-import jwt
+import logging
+from urllib.parse import parse_qs
+
 from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
 from channels.db import database_sync_to_async
-#from channels.middleware.base import BaseMiddleware
 from channels.middleware import BaseMiddleware
-
-from urllib.parse import parse_qs
+from rest_framework_simplejwt.exceptions import TokenError
 from rest_framework_simplejwt.tokens import AccessToken
-from rest_framework_simplejwt.exceptions import InvalidToken
+
+from apps.accounts.utils import token_revoked
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+PRINCIPAL_TTL = getattr(settings, "CHAT_WS_PRINCIPAL_TTL", 300)
+
+
+def principal_cache_key(user_id) -> str:
+    return f"chat:principal:{user_id}"
+
+
+def principal_fields(user) -> dict:
+    """What sockets need to know about a user, in cacheable form."""
+    return {
+        "username": user.username,
+        "full_name": user.get_full_name(),
+        "device_type": getattr(user, "device_type", "web") or "web",
+    }
+
+
+class SocketUser:
+    """
+    Authenticated socket principal. Carries only what consumers read
+    (id, username, display name, device) and never touches the DB.
+    """
+
+    is_authenticated = True
+    is_anonymous = False
+    is_active = True
+
+    def __init__(self, id, username, full_name="", device_type="web"):
+        self.id = id
+        self.username = username
+        self.full_name = full_name
+        self.device_type = device_type
+
+    @property
+    def pk(self):
+        return self.id
+
+    def get_full_name(self):
+        return self.full_name
+
+    def __str__(self):
+        return self.username
 
 
 class TokenAuthMiddleware(BaseMiddleware):
     """
     Custom middleware for authenticating users via JWT token in WebSocket connections.
     Expected usage: ws://.../ws/chat/<room_id>/?token=<JWT access token>
+    On success scope["user"] is a SocketUser and scope["token_claims"]
+    holds jti/iat/exp/sid so consumers can enforce expiry and revocation.
     """
 
     async def __call__(self, scope, receive, send):
@@ -27,26 +77,43 @@ class TokenAuthMiddleware(BaseMiddleware):
         token = query_string.get("token", [None])[0]
 
         if token:
-            user = await self.get_user(token)
+            try:
+                # verifies signature, token type and expiry
+                claims = AccessToken(token)
+            except TokenError as exc:
+                logger.debug("Rejected WebSocket token: %s", exc)
+                claims = None
+            user = await self.get_user(claims) if claims else None
             if user:
-                # ✅ Properly attach the user
                 scope["user"] = user
-                print(f"[WS-MW] ✅ Authenticated user: {user.username}")
-            else:
-                print(f"[WS-MW] ❌ Invalid token or user not found")
-        else:
-            print("[WS-MW] ⚠️ No token in query string")
+                scope["token_claims"] = {key: claims.get(key) for key in ("jti", "iat", "exp", "sid")}
 
         return await super().__call__(scope, receive, send)
 
-    @database_sync_to_async
-    def get_user(self, token):
+    async def get_user(self, claims):
         try:
-            # AccessToken automatically verifies and decodes the JWT
-            access_token = AccessToken(token)
-            user_id = access_token["user_id"]
-            return User.objects.get(id=user_id)
-        except (InvalidToken, User.DoesNotExist) as e:
-            print(f"[WS-MW] ❌ Token validation failed: {e}")
+            # the claim is a string; consumers compare ids against model pks
+            user_id = User._meta.pk.to_python(claims.get("user_id"))
+        except ValidationError:
+            return None
+        if user_id is None:
+            return None
+        if await token_revoked(claims.get("jti"), user_id, claims.get("iat"), claims.get("sid")):
             return None
 
+        fields = await cache.aget(principal_cache_key(user_id))
+        if fields is None and "username" in claims:
+            fields = {"username": claims["username"], "full_name": claims.get("name", "")}
+        if fields is None:
+            # tokens issued before the username/name claims were added
+            fields = await self._load_principal(user_id)
+        return SocketUser(user_id, **fields) if fields else None
+
+    @database_sync_to_async
+    def _load_principal(self, user_id):
+        user = User.objects.filter(id=user_id, is_active=True).first()
+        if user is None:
+            return None
+        fields = principal_fields(user)
+        cache.set(principal_cache_key(user_id), fields, PRINCIPAL_TTL)
+        return fields
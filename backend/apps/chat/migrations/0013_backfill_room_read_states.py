@@ -0,0 +1,41 @@
+from django.db import migrations
+from django.db.models import Max
+
+
+def backfill(apps, schema_editor):
+    """Collapse legacy per-message read_by/delivered_to rows into room cursors."""
+    Message = apps.get_model('chat', 'Message')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+
+    cursors = {}
+    for relation, field in (('delivered_to', 'last_delivered_at'), ('read_by', 'last_read_at')):
+        through = getattr(Message, relation).through
+        rows = (
+            through.objects.values('message__room_id', 'user_id')
+            .annotate(upto=Max('message__created_at'))
+        )
+        for row in rows:
+            key = (row['message__room_id'], row['user_id'])
+            cursors.setdefault(key, {})[field] = row['upto']
+
+    states = []
+    for (room_id, user_id), marks in cursors.items():
+        read = marks.get('last_read_at')
+        delivered = marks.get('last_delivered_at')
+        if read and (delivered is None or read > delivered):
+            delivered = read
+        states.append(
+            RoomReadState(room_id=room_id, user_id=user_id, last_delivered_at=delivered, last_read_at=read)
+        )
+    RoomReadState.objects.bulk_create(states, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0012_roomreadstate'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
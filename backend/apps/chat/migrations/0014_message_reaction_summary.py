@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0013_backfill_room_read_states'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='reaction_summary',
+            field=models.JSONField(blank=True, default=dict),
+        ),
+    ]
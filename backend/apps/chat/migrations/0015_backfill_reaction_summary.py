@@ -0,0 +1,41 @@
+from django.db import migrations
+
+SAMPLE_SIZE = 8
+
+
+def backfill(apps, schema_editor):
+    """Build Message.reaction_summary from the existing MessageReaction rows."""
+    Message = apps.get_model('chat', 'Message')
+    MessageReaction = apps.get_model('chat', 'MessageReaction')
+
+    summaries = {}
+    rows = (
+        MessageReaction.objects.order_by('message_id', 'emoji', 'created_at')
+        .values_list('message_id', 'emoji', 'user_id')
+        .iterator(chunk_size=5000)
+    )
+    for message_id, emoji, user_id in rows:
+        entry = summaries.setdefault(message_id, {}).setdefault(emoji, {'count': 0, 'sample': []})
+        entry['count'] += 1
+        if len(entry['sample']) < SAMPLE_SIZE:
+            entry['sample'].append(str(user_id))
+
+    batch = []
+    for message_id, summary in summaries.items():
+        batch.append(Message(id=message_id, reaction_summary=summary))
+        if len(batch) >= 1000:
+            Message.objects.bulk_update(batch, ['reaction_summary'])
+            batch = []
+    if batch:
+        Message.objects.bulk_update(batch, ['reaction_summary'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0014_message_reaction_summary'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
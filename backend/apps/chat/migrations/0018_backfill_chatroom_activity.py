@@ -0,0 +1,45 @@
+from django.db import migrations
+
+
+def backfill(apps, schema_editor):
+    """Fill ChatRoom.last_message / last_activity_at / member_count from existing rows."""
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    Participant = ChatRoom.participants.through
+
+    counts = {}
+    for room_id in Participant.objects.values_list('chatroom_id', flat=True).iterator(chunk_size=5000):
+        counts[room_id] = counts.get(room_id, 0) + 1
+
+    latest = {}
+    rows = (
+        Message.objects.order_by('room_id', 'created_at', 'id')
+        .values_list('room_id', 'id', 'created_at')
+        .iterator(chunk_size=5000)
+    )
+    for room_id, message_id, created_at in rows:
+        latest[room_id] = (message_id, created_at)
+
+    batch = []
+    for room in ChatRoom.objects.only('id', 'created_at').iterator(chunk_size=1000):
+        message_id, activity = latest.get(room.id, (None, room.created_at))
+        room.last_message_id = message_id
+        room.last_activity_at = activity
+        room.member_count = counts.get(room.id, 0)
+        batch.append(room)
+        if len(batch) >= 1000:
+            ChatRoom.objects.bulk_update(batch, ['last_message', 'last_activity_at', 'member_count'])
+            batch = []
+    if batch:
+        ChatRoom.objects.bulk_update(batch, ['last_message', 'last_activity_at', 'member_count'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0017_chatroom_activity'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
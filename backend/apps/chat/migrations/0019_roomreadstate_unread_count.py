@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 01:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0018_backfill_chatroom_activity'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='roomreadstate',
+            name='unread_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,47 @@
+from datetime import datetime, timezone
+
+from django.db import migrations
+from django.db.models import Count, DateTimeField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+def backfill(apps, schema_editor):
+    """Give every participant a RoomReadState row and count what they have not read."""
+    ChatRoom = apps.get_model('chat', 'ChatRoom')
+    Message = apps.get_model('chat', 'Message')
+    RoomReadState = apps.get_model('chat', 'RoomReadState')
+    Participant = ChatRoom.participants.through
+
+    existing = set(RoomReadState.objects.values_list('room_id', 'user_id'))
+    missing = [
+        RoomReadState(room_id=room_id, user_id=user_id)
+        for room_id, user_id in Participant.objects.values_list('chatroom_id', 'user_id').iterator(chunk_size=5000)
+        if (room_id, user_id) not in existing
+    ]
+    RoomReadState.objects.bulk_create(missing, batch_size=1000, ignore_conflicts=True)
+
+    unread = (
+        Message.objects.filter(
+            room_id=OuterRef('room_id'),
+            created_at__gt=Coalesce(OuterRef('last_read_at'), Value(EPOCH, output_field=DateTimeField())),
+        )
+        .exclude(sender_id=OuterRef('user_id'))
+        .order_by()
+        .values('room_id')
+        .annotate(n=Count('id'))
+        .values('n')
+    )
+    RoomReadState.objects.update(unread_count=Coalesce(Subquery(unread), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('chat', '0019_roomreadstate_unread_count'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill, migrations.RunPython.noop),
+    ]
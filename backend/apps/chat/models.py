@@ -34,6 +34,20 @@ class ChatRoom(models.Model):
 
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # denormalized for the room list; maintained by apps.chat.activity
+    last_message = models.ForeignKey(
+        "Message",
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name="+",
+    )
+    last_activity_at = models.DateTimeField(null=True, blank=True)
+    member_count = models.PositiveIntegerField(default=0)
+    # anything shown in the room list changed (metadata, members, last
+    # message); drives GET /api/chat/rooms/sync/?since=
+    changed_at = models.DateTimeField(auto_now=True)
+
     class Meta:
         ordering = ("-created_at",)
 
@@ -77,10 +91,16 @@ class Message(models.Model):
     is_read = models.BooleanField(default=False)
     is_edited = models.BooleanField(default=False)
     deleted_for = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="deleted_messages", blank=True)
+    # Legacy per-message receipts; no longer written, see RoomReadState
     delivered_to = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="delivered_messages", blank=True)
     read_by = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="read_messages", blank=True)
     delivered_at = models.DateTimeField(blank=True, null=True)
     read_at = models.DateTimeField(blank=True, null=True)
+    # Denormalized {emoji: {"count": n, "sample": [user ids]}}, kept in step
+    # with MessageReaction rows by apps.chat.reactions
+    reaction_summary = models.JSONField(default=dict, blank=True)
+    # Sender-generated id (_client_id) so retried sends map to the same row
+    client_id = models.CharField(max_length=64, null=True, blank=True)
 
     # Timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -88,6 +108,11 @@ class Message(models.Model):
 
     class Meta:
         ordering = ("created_at",)
+        unique_together = ("sender", "client_id")
+        indexes = [
+            # keyset pagination over (created_at, id) within a room
+            models.Index(fields=("room", "created_at", "id")),
+        ]
 
     def __str__(self):
         preview = self.content[:20] + "..." if self.content else "[Attachment]"
@@ -127,6 +152,87 @@ class MessageReaction(models.Model):
         return f"{self.user} reacted {self.emoji} to {self.message.id}"
 
 
+# ================================================================
+# RoomReadState model
+# ================================================================
+class RoomReadState(models.Model):
+    """
+    Per-member delivery/read high-water marks for a room.
+    A message counts as delivered to / read by a member when its
+    created_at is at or below the matching cursor.
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="read_states")
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="room_read_states",
+    )
+    last_delivered_at = models.DateTimeField(blank=True, null=True)
+    last_read_at = models.DateTimeField(blank=True, null=True)
+    # messages from others after last_read_at; maintained by apps.chat.unread
+    unread_count = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("room", "user")
+
+    def __str__(self) -> str:
+        return f"ReadState<{self.user_id}:{self.room_id}>"
+
+
+class RoomTombstone(models.Model):
+    """A room that left a user's room list (user removed or room deleted)."""
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        related_name="room_tombstones",
+    )
+    # no FK: the room may be gone
+    room_id = models.UUIDField()
+    removed_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        unique_together = ("user", "room_id")
+        indexes = [models.Index(fields=("user", "removed_at"))]
+
+    def __str__(self) -> str:
+        return f"Tombstone<{self.user_id}:{self.room_id}>"
+
+
+class RoomChange(models.Model):
+    """
+    Compacted per-room change log: the latest change per (message, user).
+    id is the sequence clients sync from (monotonic, shared by all rooms).
+    """
+
+    id = models.BigAutoField(primary_key=True)
+    room = models.ForeignKey(ChatRoom, on_delete=models.CASCADE, related_name="changes")
+    message_id = models.UUIDField()
+    # set for per-user changes (star, note, deleted-for-me); null for everyone
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        blank=True,
+        on_delete=models.CASCADE,
+        related_name="+",
+    )
+    deleted = models.BooleanField(default=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=("room", "id")),
+            models.Index(fields=("room", "message_id")),
+        ]
+
+    def __str__(self) -> str:
+        return f"Change<{self.room_id}:{self.id}>"
+
+
 class MessageUserMeta(models.Model):
     """Per-user metadata for a message (star, notes, deleted-for-me)."""
 
@@ -0,0 +1,152 @@
+# ================================================================
+# backend/apps/chat/outbound.py
+# Bounded per-connection outbound queue with a slow-consumer policy
+# - one writer task per socket drains frames in order; flush() lets a
+#   closing socket write what it queued (e.g. an error) before the close
+# - on overflow, coalescable frames (typing / presence) go first;
+#   if that is not enough the consumer closes with a resync code
+# ================================================================
+import asyncio
+import logging
+import weakref
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+MAX_FRAMES = getattr(settings, "CHAT_WS_OUTBOUND_MAX_FRAMES", 256)
+MAX_BYTES = getattr(settings, "CHAT_WS_OUTBOUND_MAX_BYTES", 1024 * 1024)
+# "coalesce": shed typing/presence before closing; "close": close right away
+POLICY = getattr(settings, "CHAT_WS_OUTBOUND_POLICY", "coalesce")
+
+_queues = weakref.WeakSet()
+_counters = {"dropped_frames": 0, "slow_consumer_closes": 0}
+
+
+class OutboundQueue:
+    """
+    Frames already encoded for the wire, waiting for one socket.
+    put() never blocks; it returns False when the client cannot keep up
+    and the caller should close the connection.
+    """
+
+    def __init__(self, send, *, max_frames=MAX_FRAMES, max_bytes=MAX_BYTES, policy=POLICY):
+        self._send = send
+        self.max_frames = max_frames
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._items = deque()  # (data, size, coalesce_key)
+        self._bytes = 0
+        self._ready = asyncio.Event()
+        self._idle = asyncio.Event()  # set while nothing is queued or being written
+        self._idle.set()
+        self._task = None
+        _queues.add(self)
+
+    @property
+    def depth(self) -> int:
+        return len(self._items)
+
+    @property
+    def size(self) -> int:
+        return self._bytes
+
+    def start(self):
+        self._task = asyncio.create_task(self._drain())
+
+    async def flush(self, timeout=1.0):
+        """Wait (bounded) until queued frames are written, then stop."""
+        if self._task and not self._task.done():
+            try:
+                await asyncio.wait_for(self._idle.wait(), timeout)
+            except asyncio.TimeoutError:
+                logger.debug("Outbound flush timed out with %s frames queued", len(self._items))
+        await self.stop()
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        self._items.clear()
+        self._bytes = 0
+
+    def put(self, data, coalesce=None) -> bool:
+        size = len(data)
+        if coalesce is not None and self._replace(coalesce, data, size):
+            return True
+        if not self._fits(size):
+            if self.policy != "coalesce":
+                return False
+            self._shed(size)
+            if not self._fits(size):
+                if coalesce is not None:
+                    # an ephemeral frame is not worth a disconnect
+                    _counters["dropped_frames"] += 1
+                    return True
+                return False
+        self._items.append((data, size, coalesce))
+        self._bytes += size
+        self._idle.clear()
+        self._ready.set()
+        return True
+
+    def _fits(self, size) -> bool:
+        return len(self._items) < self.max_frames and self._bytes + size <= self.max_bytes
+
+    def _replace(self, key, data, size) -> bool:
+        """A newer typing/presence frame supersedes the queued one for the same key."""
+        for index, (_, old_size, old_key) in enumerate(self._items):
+            if old_key == key:
+                self._items[index] = (data, size, key)
+                self._bytes += size - old_size
+                _counters["dropped_frames"] += 1
+                return True
+        return False
+
+    def _shed(self, size):
+        """Drop queued coalescable frames, oldest first, until `size` fits."""
+        for item in list(self._items):
+            if self._fits(size):
+                return
+            if item[2] is not None:
+                self._items.remove(item)
+                self._bytes -= item[1]
+                _counters["dropped_frames"] += 1
+
+    async def _drain(self):
+        while True:
+            if not self._items:
+                self._idle.set()
+                self._ready.clear()
+                await self._ready.wait()
+                continue
+            data, size, _ = self._items.popleft()
+            self._bytes -= size
+            try:
+                await self._send(data)
+            except Exception:
+                logger.debug("Outbound send failed; dropping queue", exc_info=True)
+                self._items.clear()
+                self._bytes = 0
+                self._idle.set()
+                return
+
+
+def record_slow_close():
+    _counters["slow_consumer_closes"] += 1
+
+
+def outbound_stats() -> dict:
+    """Per-worker gauges and counters for the outbound queues."""
+    queues = list(_queues)
+    return {
+        "connections": len(queues),
+        "queued_frames": sum(q.depth for q in queues),
+        "queued_bytes": sum(q.size for q in queues),
+        "max_queue_depth": max((q.depth for q in queues), default=0),
+        **_counters,
+    }
@@ -0,0 +1,369 @@
+# ================================================================
+# backend/apps/chat/presence.py
+# Presence registry (source of truth for online/offline)
+# - Redis sorted sets with TTL when the channel layer is Redis-backed
+# - in-process fallback for the in-memory channel layer
+# - batched write-back of User / DeviceSession presence columns
+# - transition-only fan-out (debounced) + per-room snapshots
+# ================================================================
+import asyncio
+import logging
+import time
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db.models import Case, DateTimeField, Value, When
+from django.utils import timezone
+
+from apps.accounts.models import DeviceSession
+from apps.chat.frames import frame_event
+from apps.chat.layerstore import LayerStore
+from apps.chat.metrics import timed_db
+from apps.chat.models import ChatRoom
+
+logger = logging.getLogger(__name__)
+
+User = get_user_model()
+
+PRESENCE_TTL = getattr(settings, "CHAT_PRESENCE_TTL", 75)  # seconds without a heartbeat
+FLUSH_INTERVAL = getattr(settings, "CHAT_PRESENCE_FLUSH_SECONDS", 60)
+FLUSH_CHUNK = 500
+# Offline is only announced if the user has not reconnected within this window
+OFFLINE_GRACE = getattr(settings, "CHAT_PRESENCE_GRACE_SECONDS", 5)
+ANNOUNCEABLE = ("online", "away", "offline")
+
+
+def _to_datetime(ts: float) -> datetime:
+    return datetime.fromtimestamp(ts, tz=dt_timezone.utc)
+
+
+class LocalPresenceRegistry:
+    """Single-process registry; matches the reach of InMemoryChannelLayer."""
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._conns: dict[int, dict[str, float]] = {}
+        self._last_seen: dict[int, float] = {}
+        self._dirty: set[int] = set()
+        self._announced: dict[int, str] = {}
+
+    def _live(self, user_id, now: float) -> dict[str, float]:
+        conns = self._conns.get(user_id, {})
+        for channel in [c for c, expires in conns.items() if expires <= now]:
+            del conns[channel]
+        if not conns:
+            self._conns.pop(user_id, None)
+        return conns
+
+    async def touch(self, user_id, channel_name) -> bool:
+        """Refresh a connection; True when the user just came online."""
+        now = time.time()
+        was_online = bool(self._live(user_id, now))
+        self._conns.setdefault(user_id, {})[channel_name] = now + self.ttl
+        self._last_seen[user_id] = now
+        self._dirty.add(user_id)
+        return not was_online
+
+    async def drop(self, user_id, channel_name) -> bool:
+        """Forget a connection; True when it was the user's last one."""
+        now = time.time()
+        self._conns.get(user_id, {}).pop(channel_name, None)
+        self._last_seen[user_id] = now
+        self._dirty.add(user_id)
+        return not self._live(user_id, now)
+
+    async def online_users(self, user_ids) -> set:
+        now = time.time()
+        return {uid for uid in user_ids if self._live(uid, now)}
+
+    async def announce(self, user_id, status) -> bool:
+        """Record the status peers were told about; False if unchanged."""
+        previous = self._announced.get(user_id, "offline")
+        self._announced[user_id] = status
+        return previous != status
+
+    async def announced(self, user_ids) -> dict:
+        return {uid: self._announced.get(uid, "offline") for uid in user_ids}
+
+    async def sweep(self) -> None:
+        """Mark users whose every connection expired as changed."""
+        now = time.time()
+        for user_id in list(self._conns):
+            if not self._live(user_id, now):
+                self._dirty.add(user_id)
+
+    async def drain(self) -> dict:
+        """Pop changed users as {user_id: (is_online, last_seen)}."""
+        await self.sweep()
+        dirty, self._dirty = self._dirty, set()
+        online = await self.online_users(dirty)
+        return {uid: (uid in online, _to_datetime(self._last_seen.get(uid, time.time()))) for uid in dirty}
+
+
+class RedisPresenceRegistry:
+    """
+    Shared registry stored next to the channel layer.
+    Each user has a sorted set of channel names scored by expiry time.
+    """
+
+    PREFIX = "tuchati:presence"
+
+    def __init__(self, channel_layer, ttl: int):
+        self.channel_layer = channel_layer
+        self.ttl = ttl
+
+    def _redis(self):
+        return self.channel_layer.connection(0)
+
+    def _key(self, user_id) -> str:
+        return f"{self.PREFIX}:conns:{user_id}"
+
+    async def touch(self, user_id, channel_name) -> bool:
+        now = time.time()
+        key = self._key(user_id)
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zcard(key)
+        pipe.zadd(key, {channel_name: now + self.ttl})
+        pipe.expire(key, self.ttl)
+        pipe.hset(f"{self.PREFIX}:last_seen", str(user_id), now)
+        pipe.sadd(f"{self.PREFIX}:dirty", str(user_id))
+        results = await pipe.execute()
+        return results[1] == 0
+
+    async def drop(self, user_id, channel_name) -> bool:
+        now = time.time()
+        key = self._key(user_id)
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.zrem(key, channel_name)
+        pipe.zremrangebyscore(key, "-inf", now)
+        pipe.zcard(key)
+        pipe.hset(f"{self.PREFIX}:last_seen", str(user_id), now)
+        pipe.sadd(f"{self.PREFIX}:dirty", str(user_id))
+        results = await pipe.execute()
+        return results[2] == 0
+
+    async def online_users(self, user_ids) -> set:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return set()
+        now = time.time()
+        pipe = self._redis().pipeline(transaction=False)
+        for uid in user_ids:
+            pipe.zcount(self._key(uid), now, "+inf")
+        counts = await pipe.execute()
+        return {uid for uid, count in zip(user_ids, counts) if count}
+
+    async def announce(self, user_id, status) -> bool:
+        previous = await self._redis().set(
+            f"{self.PREFIX}:announced:{user_id}", status, ex=86400, get=True
+        )
+        if isinstance(previous, bytes):
+            previous = previous.decode()
+        return (previous or "offline") != status
+
+    async def announced(self, user_ids) -> dict:
+        user_ids = list(user_ids)
+        if not user_ids:
+            return {}
+        values = await self._redis().mget([f"{self.PREFIX}:announced:{uid}" for uid in user_ids])
+        return {
+            uid: (value.decode() if isinstance(value, bytes) else value) or "offline"
+            for uid, value in zip(user_ids, values)
+        }
+
+    async def drain(self) -> dict:
+        redis = self._redis()
+        raw = await redis.spop(f"{self.PREFIX}:dirty", FLUSH_CHUNK * 10) or []
+        user_ids = [int(uid) for uid in raw]
+        if not user_ids:
+            return {}
+        stamps = await redis.hmget(f"{self.PREFIX}:last_seen", [str(uid) for uid in user_ids])
+        online = await self.online_users(user_ids)
+        now = time.time()
+        return {
+            uid: (uid in online, _to_datetime(float(stamp) if stamp else now))
+            for uid, stamp in zip(user_ids, stamps)
+        }
+
+
+def _chunks(items, size=FLUSH_CHUNK):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def flush_presence(changes: dict, stale=()) -> None:
+    """
+    Write drained presence back in a handful of UPDATEs.
+    stale lists users the DB still marks online but the registry does not
+    (e.g. their worker died before disconnect ran); they go offline too.
+    """
+    now = timezone.now()
+    online = [uid for uid, (is_online, _) in changes.items() if is_online]
+    offline = {uid: seen for uid, (is_online, seen) in changes.items() if not is_online}
+    for uid in stale:
+        offline.setdefault(uid, now)
+
+    for chunk in _chunks(online):
+        User.objects.filter(id__in=chunk).update(is_online=True, current_status="online", last_seen=now)
+        DeviceSession.objects.filter(user_id__in=chunk, is_active=True).update(
+            last_active=now,
+            connection_status="online",
+        )
+
+    for chunk in _chunks(list(offline)):
+        last_seen = Case(
+            *[When(id=uid, then=Value(offline[uid])) for uid in chunk],
+            output_field=DateTimeField(),
+        )
+        User.objects.filter(id__in=chunk).update(is_online=False, current_status="offline", last_seen=last_seen)
+        DeviceSession.objects.filter(user_id__in=chunk, is_active=True).update(
+            last_active=now,
+            connection_status="offline",
+        )
+
+
+async def _db_online_ids() -> list:
+    return [pk async for pk in User.objects.filter(is_online=True).values_list("id", flat=True)]
+
+
+async def _room_ids_for(user_id) -> list:
+    return [pk async for pk in ChatRoom.objects.filter(participants=user_id).values_list("id", flat=True)]
+
+
+async def _room_members(room_id) -> list:
+    return [
+        row
+        async for row in ChatRoom.participants.through.objects.filter(chatroom_id=room_id).values_list(
+            "user_id", "user__username", "user__device_type", "user__last_seen", "user__share_last_seen"
+        )
+    ]
+
+
+async def _usernames(user_ids) -> dict:
+    return {pk: name async for pk, name in User.objects.filter(id__in=user_ids).values_list("id", "username")}
+
+
+async def broadcast_presence(channel_layer, registry, user_id, username, status, *, device="web", last_seen=None):
+    """
+    Fan a presence transition out to every room of the user, once.
+    Repeats of the status peers already saw are dropped.
+    """
+    if not await registry.announce(user_id, status):
+        return
+    # encoded once, reused for every room of the user
+    event = frame_event(
+        {
+            "type": "presence",
+            "user": username,
+            "user_id": user_id,
+            "status": status,
+            "device": device,
+            "last_seen": last_seen,
+        },
+        handler="presence_update",
+        user_id=user_id,
+        status=status,
+        coalesce=f"presence:{user_id}",
+    )
+    for room_id in await timed_db(_room_ids_for)(user_id):
+        await channel_layer.group_send(f"room_{room_id}", event)
+
+
+# the loop only keeps weak references to tasks; hold pending ones here
+_offline_tasks: set = set()
+
+
+async def _announce_offline_later(channel_layer, registry, user_id, username, device):
+    await asyncio.sleep(OFFLINE_GRACE)
+    if await registry.online_users([user_id]):
+        return  # reconnected within the grace window
+    await broadcast_presence(
+        channel_layer, registry, user_id, username, "offline",
+        device=device, last_seen=timezone.now().isoformat(),
+    )
+
+
+def schedule_offline(channel_layer, registry, user_id, username, device="web"):
+    """Debounced offline announcement for a user whose last socket closed."""
+    task = asyncio.create_task(_announce_offline_later(channel_layer, registry, user_id, username, device))
+    _offline_tasks.add(task)
+    task.add_done_callback(_offline_tasks.discard)
+    return task
+
+
+async def presence_snapshot(registry, room_id) -> list:
+    """Compact state of every room member for a freshly joined client."""
+    members = await timed_db(_room_members)(room_id)
+    user_ids = [m[0] for m in members]
+    online = await registry.online_users(user_ids)
+    announced = await registry.announced(online)
+    snapshot = []
+    for user_id, username, device, last_seen, share_last_seen in members:
+        if user_id in online:
+            status = "away" if announced.get(user_id) == "away" else "online"
+        else:
+            status = "offline"
+        snapshot.append({
+            "user_id": user_id,
+            "user": username,
+            "status": status,
+            "device": device,
+            "last_seen": last_seen.isoformat() if status == "offline" and last_seen and share_last_seen else None,
+        })
+    return snapshot
+
+
+class PresenceFlusher:
+    """
+    Per-worker loop that drains the registry into the database and
+    announces users whose connections expired without a clean disconnect.
+    """
+
+    def __init__(self, registry, channel_layer, interval: int):
+        self.registry = registry
+        self.channel_layer = channel_layer
+        self.interval = interval
+        self._task = None
+
+    def ensure_running(self):
+        loop = asyncio.get_running_loop()
+        if self._task is None or self._task.done() or self._task.get_loop() is not loop:
+            self._task = asyncio.create_task(self._run())
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.flush_once()
+            except Exception:
+                logger.exception("Presence flush failed")
+
+    async def flush_once(self):
+        changes = await self.registry.drain()
+        marked_online = await timed_db(_db_online_ids)()
+        live = await self.registry.online_users(marked_online)
+        stale = [uid for uid in marked_online if uid not in live and uid not in changes]
+        await timed_db(flush_presence)(changes, stale)
+        if stale:
+            names = await timed_db(_usernames)(stale)
+            for uid in stale:
+                await broadcast_presence(self.channel_layer, self.registry, uid, names.get(uid, ""), "offline")
+
+
+_registries = LayerStore(
+    redis=lambda channel_layer: RedisPresenceRegistry(channel_layer, PRESENCE_TTL),
+    local=lambda: LocalPresenceRegistry(PRESENCE_TTL),
+)
+_flushers: dict[int, PresenceFlusher] = {}
+
+
+def get_presence_registry(channel_layer):
+    """Registry bound to the given channel layer (Redis when available)."""
+    registry = _registries.get(channel_layer)
+    flusher = _flushers.get(id(channel_layer))
+    if flusher is None:
+        flusher = _flushers[id(channel_layer)] = PresenceFlusher(registry, channel_layer, FLUSH_INTERVAL)
+    flusher.ensure_running()
+    return registry
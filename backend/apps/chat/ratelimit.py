@@ -0,0 +1,127 @@
+# ================================================================
+# backend/apps/chat/ratelimit.py
+# Token-bucket flood control for inbound socket frames
+# - one bucket per (user, frame kind), shared by all of a user's sockets
+#   through the channel layer's Redis (in-process for the memory layer)
+# ================================================================
+import time
+
+from django.conf import settings
+
+from apps.chat.layerstore import LayerStore
+
+DEFAULT_LIMITS = {
+    # frame kind: (tokens per second, burst)
+    "message": (5, 10),
+    "typing": (2, 6),
+    "reaction": (5, 15),
+    "receipt": (10, 30),
+    "history": (2, 10),
+    "presence": (1, 5),
+    "subscribe": (5, 50),
+    "ping": (1, 5),
+    "*": (10, 30),
+}
+RATE_LIMITS = {**DEFAULT_LIMITS, **getattr(settings, "CHAT_WS_RATE_LIMITS", {})}
+
+# frame types that share one bucket
+FRAME_KINDS = {
+    "stopped_typing": "typing",
+    "delivered": "receipt",
+    "read": "receipt",
+    "focus": "receipt",
+    "history_before": "history",
+    "history_after": "history",
+    "pull": "history",
+    "unsubscribe": "subscribe",
+}
+
+
+def frame_kind(msg_type) -> str:
+    """Bucket for a client frame type; anything unknown (or not a string) shares "*"."""
+    if not isinstance(msg_type, str):
+        return "*"
+    kind = FRAME_KINDS.get(msg_type, msg_type)
+    return kind if kind in RATE_LIMITS else "*"
+
+
+class LocalRateLimiter:
+    """In-process buckets for the in-memory channel layer (single worker)."""
+
+    SWEEP_INTERVAL = 60.0
+
+    def __init__(self):
+        # (user, kind) -> (tokens, last hit, seconds until full again)
+        self._buckets: dict[tuple, tuple[float, float, float]] = {}
+        self._swept = time.monotonic()
+
+    async def hit(self, user_id, kind, rate, burst) -> float:
+        now = time.monotonic()
+        if now - self._swept >= self.SWEEP_INTERVAL:
+            self._sweep(now)
+        tokens, stamp, _ = self._buckets.get((user_id, kind), (burst, now, 0))
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        # like the Redis key's EXPIRE: once refilled, a bucket is the default
+        idle = burst / rate + 1
+        if tokens >= 1:
+            self._buckets[(user_id, kind)] = (tokens - 1, now, idle)
+            return 0.0
+        self._buckets[(user_id, kind)] = (tokens, now, idle)
+        return (1 - tokens) / rate
+
+    def _sweep(self, now):
+        """Drop buckets that have been idle long enough to be full again."""
+        self._swept = now
+        for key, (_, stamp, idle) in list(self._buckets.items()):
+            if now - stamp >= idle:
+                del self._buckets[key]
+
+
+class RedisRateLimiter:
+    """Buckets stored next to the channel layer, refilled atomically in Lua."""
+
+    PREFIX = "tuchati:ratelimit"
+    SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local state = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(state[1]) or burst
+local stamp = tonumber(state[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - stamp) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+    def __init__(self, channel_layer):
+        self.channel_layer = channel_layer
+
+    async def hit(self, user_id, kind, rate, burst) -> float:
+        key = f"{self.PREFIX}:{user_id}:{kind}"
+        wait = await self.channel_layer.connection(0).eval(self.SCRIPT, 1, key, rate, burst, time.time())
+        return float(wait)
+
+
+_limiters = LayerStore(redis=RedisRateLimiter, local=LocalRateLimiter)
+
+
+def get_rate_limiter(channel_layer):
+    """Limiter bound to the given channel layer (Redis when available)."""
+    return _limiters.get(channel_layer)
+
+
+async def check_rate(channel_layer, user_id, msg_type) -> tuple[str, float]:
+    """
+    Take one token for this frame. Returns (kind, retry_after); a
+    retry_after of 0 means the frame is allowed.
+    """
+    kind = frame_kind(msg_type)
+    rate, burst = RATE_LIMITS[kind]
+    return kind, await get_rate_limiter(channel_layer).hit(user_id, kind, rate, burst)
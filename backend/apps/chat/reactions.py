@@ -0,0 +1,174 @@
+# ================================================================
+# backend/apps/chat/reactions.py
+# Persisted emoji reactions
+# - socket add/remove/toggle ops coalesced per room and written in one
+#   transaction (idempotent insert/delete)
+# - Message.reaction_summary keeps {emoji: {count, sample}} so payloads
+#   never need the full reaction rows
+# - bulk_update skips signals, so touched messages are logged to the
+#   room change log here
+# ================================================================
+import uuid
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+
+from apps.chat.buffers import RoomBuffer
+from apps.chat.changes import log_changes
+from apps.chat.models import Message, MessageReaction
+from apps.chat.replay import publish_room_event
+
+SAMPLE_SIZE = 8
+MAX_EMOJI_LENGTH = MessageReaction._meta.get_field("emoji").max_length
+
+
+def reaction_payload(message: Message, user_id=None, own_emojis=()) -> tuple[dict, dict]:
+    """
+    ({emoji: [user ids]}, {emoji: count}) for a message payload.
+    The id lists are the stored sample; the viewer's own reactions are
+    merged in so clients can always tell what they reacted with.
+    """
+    reactions, counts = {}, {}
+    for emoji, entry in (message.reaction_summary or {}).items():
+        if entry.get("count"):
+            reactions[emoji] = list(entry.get("sample", []))
+            counts[emoji] = entry["count"]
+    if user_id is not None:
+        for emoji in own_emojis:
+            ids = reactions.setdefault(emoji, [])
+            counts.setdefault(emoji, 1)
+            if str(user_id) not in ids:
+                ids.append(str(user_id))
+    return reactions, counts
+
+
+def _adjust(summary: dict, emoji: str, user_id: str, delta: int) -> bool:
+    """Apply one insert/delete to a summary; True if the sample needs a refill."""
+    entry = summary.setdefault(emoji, {"count": 0, "sample": []})
+    entry["count"] = max(0, entry["count"] + delta)
+    if delta > 0:
+        if len(entry["sample"]) < SAMPLE_SIZE and user_id not in entry["sample"]:
+            entry["sample"].append(user_id)
+        return False
+    if user_id in entry["sample"]:
+        entry["sample"].remove(user_id)
+    if not entry["count"]:
+        del summary[emoji]
+        return False
+    return len(entry["sample"]) < min(entry["count"], SAMPLE_SIZE)
+
+
+def apply_reactions(room_id, ops: dict) -> list[dict]:
+    """
+    Persist a coalesced window of reaction ops for one room.
+    ops maps (message_id, user_id, emoji) -> "add" | "remove" | "toggle".
+    Returns the changes that actually happened, with the new emoji counts.
+    """
+    keys = [key for key in ops if len(key[2]) <= MAX_EMOJI_LENGTH]
+    if not keys:
+        return []
+
+    with transaction.atomic():
+        messages = {
+            str(m.id): m
+            for m in Message.objects.select_for_update()
+            .filter(room_id=room_id, id__in={k[0] for k in keys})
+            .only("id", "reaction_summary")
+        }
+        keys = [k for k in keys if k[0] in messages]
+        if not keys:
+            return []
+
+        lookup = Q()
+        for message_id, user_id, emoji in keys:
+            lookup |= Q(message_id=message_id, user_id=user_id, emoji=emoji)
+        existing = {
+            (str(mid), uid, emoji)
+            for mid, uid, emoji in MessageReaction.objects.filter(lookup).values_list("message_id", "user_id", "emoji")
+        }
+
+        adds, removes = [], []
+        for key in keys:
+            op = ops[key]
+            present = key in existing
+            if op == "toggle":
+                op = "remove" if present else "add"
+            if op == "add" and not present:
+                adds.append(key)
+            elif op == "remove" and present:
+                removes.append(key)
+
+        MessageReaction.objects.bulk_create(
+            [MessageReaction(message_id=m, user_id=u, emoji=e) for m, u, e in adds],
+            ignore_conflicts=True,
+        )
+        if removes:
+            lookup = Q()
+            for message_id, user_id, emoji in removes:
+                lookup |= Q(message_id=message_id, user_id=user_id, emoji=emoji)
+            MessageReaction.objects.filter(lookup).delete()
+
+        refill, touched = set(), set()
+        for delta, changed in ((1, adds), (-1, removes)):
+            for message_id, user_id, emoji in changed:
+                summary = messages[message_id].reaction_summary
+                if _adjust(summary, emoji, str(user_id), delta):
+                    refill.add((message_id, emoji))
+                touched.add(message_id)
+
+        for message_id, emoji in refill:
+            sample = MessageReaction.objects.filter(message_id=message_id, emoji=emoji).order_by("created_at")
+            messages[message_id].reaction_summary[emoji]["sample"] = [
+                str(uid) for uid in sample.values_list("user_id", flat=True)[:SAMPLE_SIZE]
+            ]
+        Message.objects.bulk_update([messages[mid] for mid in touched], ["reaction_summary"])
+        log_changes(room_id, touched)
+
+    changes = []
+    for op, changed in (("add", adds), ("remove", removes)):
+        for message_id, user_id, emoji in changed:
+            entry = messages[message_id].reaction_summary.get(emoji) or {}
+            changes.append(
+                {"message_id": message_id, "user_id": user_id, "emoji": emoji, "op": op, "count": entry.get("count", 0)}
+            )
+    return changes
+
+
+async def _publish_reactions(channel_layer, room_id, ops, changes):
+    for change in changes:
+        await publish_room_event(channel_layer, room_id, {"type": "reaction", "room_id": room_id, **change})
+
+
+class ReactionBuffer(RoomBuffer):
+    """
+    Per-worker coalescing buffer for reaction frames, like ReceiptBuffer.
+    Ops for a room are held for `window` seconds; repeated toggles of the
+    same (message, user, emoji) collapse before anything is written.
+    """
+
+    label = "reactions"
+
+    def __init__(self, window: float):
+        super().__init__(window, apply_reactions, _publish_reactions)
+
+    async def add(self, channel_layer, room_id, user_id, message_id, emoji, op="toggle"):
+        try:
+            message_id = str(uuid.UUID(str(message_id)))
+        except ValueError:
+            return
+        if not isinstance(emoji, str) or not emoji or op not in ("add", "remove", "toggle"):
+            return
+        ops = self._batch(channel_layer, str(room_id))
+        key = (message_id, user_id, emoji)
+        previous = ops.get(key)
+        if op == "toggle" and previous in ("add", "remove"):
+            op = "remove" if previous == "add" else "add"
+        elif op == "toggle" and previous == "toggle":
+            # two toggles cancel out
+            del ops[key]
+            return
+        ops[key] = op
+
+
+reaction_buffer = ReactionBuffer(window=getattr(settings, "CHAT_REACTION_FLUSH_MS", 200) / 1000)
@@ -0,0 +1,196 @@
+# ================================================================
+# backend/apps/chat/receipts.py
+# Delivery / read receipts backed by per-member room cursors
+# - coalescing buffer: one write + one broadcast per room window
+# - readers' unread counters are recounted from the new cursor and
+#   pushed to their user groups
+# ================================================================
+import uuid
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import DateTimeField, F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.chat.buffers import RoomBuffer
+from apps.chat.metrics import timed_db
+from apps.chat.models import Message, RoomReadState
+from apps.chat.replay import publish_room_event
+from apps.chat.unread import aunread_counts, publish_unread, recount_unread
+
+
+def _advance(field: str, ts):
+    value = Value(ts, output_field=DateTimeField())
+    # Greatest() yields NULL on some backends when any argument is NULL
+    return Greatest(Coalesce(F(field), value), value)
+
+
+def _read_state_changes(delivered_upto, read_upto):
+    """(delivered_upto, UPDATE kwargs) for advancing cursors, or None if nothing moves."""
+    if read_upto and (delivered_upto is None or read_upto > delivered_upto):
+        delivered_upto = read_upto
+    if delivered_upto is None:
+        return None
+
+    changes = {"last_delivered_at": _advance("last_delivered_at", delivered_upto), "updated_at": timezone.now()}
+    if read_upto:
+        changes["last_read_at"] = _advance("last_read_at", read_upto)
+    return delivered_upto, changes
+
+
+def advance_read_state(room_id, user_id, *, delivered_upto=None, read_upto=None) -> None:
+    """
+    Move a member's cursors forward (never backwards) in a single UPDATE.
+    Reading implies delivery, so read_upto also advances the delivered cursor.
+    """
+    advance = _read_state_changes(delivered_upto, read_upto)
+    if advance is None:
+        return
+    delivered_upto, changes = advance
+
+    qs = RoomReadState.objects.filter(room_id=room_id, user_id=user_id)
+    if qs.update(**changes):
+        return
+    try:
+        with transaction.atomic():
+            RoomReadState.objects.create(
+                room_id=room_id,
+                user_id=user_id,
+                last_delivered_at=delivered_upto,
+                last_read_at=read_upto,
+            )
+    except IntegrityError:
+        # created concurrently by another socket of the same user
+        qs.update(**changes)
+
+
+async def aadvance_read_state(room_id, user_id, *, delivered_upto=None, read_upto=None) -> None:
+    """
+    advance_read_state() on the async ORM, for callers outside a transaction
+    (the async ORM cannot open one; autocommit keeps the fallback safe).
+    """
+    advance = _read_state_changes(delivered_upto, read_upto)
+    if advance is None:
+        return
+    delivered_upto, changes = advance
+
+    qs = RoomReadState.objects.filter(room_id=room_id, user_id=user_id)
+    if await qs.aupdate(**changes):
+        return
+    try:
+        await RoomReadState.objects.acreate(
+            room_id=room_id,
+            user_id=user_id,
+            last_delivered_at=delivered_upto,
+            last_read_at=read_upto,
+        )
+    except IntegrityError:
+        await qs.aupdate(**changes)
+
+
+def load_read_states(room_id) -> list[tuple]:
+    """All members' cursors for a room as (user_id, last_delivered_at, last_read_at)."""
+    return list(
+        RoomReadState.objects.filter(room_id=room_id).values_list(
+            "user_id", "last_delivered_at", "last_read_at"
+        )
+    )
+
+
+def receipt_lists(message: Message, read_states) -> tuple[list[str], list[str]]:
+    """(delivered_to, read_by) user ids for a message, derived from room cursors."""
+    delivered, read = [], []
+    created_at = message.created_at
+    for user_id, delivered_at, read_at in read_states:
+        if user_id == message.sender_id:
+            continue
+        if read_at and read_at >= created_at:
+            read.append(str(user_id))
+            delivered.append(str(user_id))
+        elif delivered_at and delivered_at >= created_at:
+            delivered.append(str(user_id))
+    return delivered, read
+
+
+def _valid_ids(ids) -> list[str]:
+    """Keep well-formed message ids only, de-duplicated in arrival order."""
+    if not isinstance(ids, (list, tuple)):
+        return []
+    clean = {}
+    for raw in ids:
+        try:
+            clean[str(uuid.UUID(str(raw)))] = None
+        except ValueError:
+            continue
+    return list(clean)
+
+
+def apply_receipts(room_id, entries: dict) -> list:
+    """
+    Persist a coalesced window of receipts for one room.
+    entries maps (user_id, status) -> {"ids": [...], "upto": datetime | None}.
+    Returns the users whose read cursor was advanced.
+    """
+    all_ids = {i for entry in entries.values() for i in entry["ids"]}
+    created = {}
+    if all_ids:
+        created = {
+            str(pk): ts
+            for pk, ts in Message.objects.filter(room_id=room_id, id__in=all_ids).values_list("id", "created_at")
+        }
+
+    marks = {}
+    for (user_id, status), entry in entries.items():
+        stamps = [created[i] for i in entry["ids"] if i in created]
+        if entry["upto"]:
+            stamps.append(entry["upto"])
+        if not stamps:
+            continue
+        key = "read_upto" if status == "read" else "delivered_upto"
+        user_marks = marks.setdefault(user_id, {})
+        user_marks[key] = max([user_marks[key], *stamps]) if key in user_marks else max(stamps)
+
+    readers = [user_id for user_id, user_marks in marks.items() if "read_upto" in user_marks]
+    with transaction.atomic():
+        for user_id, user_marks in marks.items():
+            advance_read_state(room_id, user_id, **user_marks)
+        if readers:
+            recount_unread(room_id, readers)
+    return readers
+
+
+async def _publish_receipts(channel_layer, room_id, entries, readers):
+    receipts = [
+        {"status": status, "user": entry["user"], "user_id": user_id, "ids": list(entry["ids"])}
+        for (user_id, status), entry in entries.items()
+    ]
+    await publish_room_event(
+        channel_layer, room_id, {"type": "delivery", "room_id": room_id, "receipts": receipts}
+    )
+    if readers:
+        counts = await timed_db(aunread_counts)(room_id, readers)
+        await publish_unread(channel_layer, room_id, counts)
+
+
+class ReceiptBuffer(RoomBuffer):
+    """
+    Per-worker coalescing buffer for delivered/read frames.
+    Receipts for a room are held for `window` seconds, then written in one
+    transaction and broadcast as a single `delivery` event.
+    """
+
+    label = "receipts"
+
+    def __init__(self, window: float):
+        super().__init__(window, apply_receipts, _publish_receipts)
+
+    async def add(self, channel_layer, room_id, user_id, username, status, ids=(), upto=None):
+        entries = self._batch(channel_layer, str(room_id))
+        entry = entries.setdefault((user_id, status), {"user": username, "ids": {}, "upto": None})
+        entry["ids"].update(dict.fromkeys(_valid_ids(ids)))
+        if upto and (entry["upto"] is None or upto > entry["upto"]):
+            entry["upto"] = upto
+
+
+receipt_buffer = ReceiptBuffer(window=getattr(settings, "CHAT_RECEIPT_FLUSH_MS", 300) / 1000)
@@ -0,0 +1,148 @@
+# ================================================================
+# backend/apps/chat/replay.py
+# Per-room event ids + bounded replay log for resumable sockets
+# - every durable room event gets a monotonically increasing event_id
+# - reconnecting clients send resume_from=<event_id> and receive only
+#   the events they missed, or a fresh snapshot if the gap is too big
+# - lazy fan-out: large rooms get a room_activity hint per new message and
+#   sockets pull the bodies from the same log
+# ================================================================
+from collections import deque
+
+from django.conf import settings
+
+from apps.chat.frames import encode_frame, frame_event
+from apps.chat.layerstore import LayerStore
+
+REPLAY_LOG_SIZE = getattr(settings, "CHAT_REPLAY_LOG_SIZE", 500)
+REPLAY_LOG_TTL = getattr(settings, "CHAT_REPLAY_LOG_TTL", 86400)
+LAZY_FANOUT_MEMBERS = getattr(settings, "CHAT_LAZY_FANOUT_MEMBERS", 500)
+
+
+class LocalReplayLog:
+    """In-process log for the in-memory channel layer (single worker)."""
+
+    def __init__(self, size: int):
+        self.size = size
+        self._seq: dict[str, int] = {}
+        self._logs: dict[str, deque] = {}
+
+    async def next_id(self, room_id) -> int:
+        room_id = str(room_id)
+        self._seq[room_id] = self._seq.get(room_id, 0) + 1
+        return self._seq[room_id]
+
+    async def append(self, room_id, event_id: int, frame: str) -> None:
+        log = self._logs.setdefault(str(room_id), deque(maxlen=self.size))
+        log.append((event_id, frame))
+
+    async def last_id(self, room_id) -> int:
+        return self._seq.get(str(room_id), 0)
+
+    async def since(self, room_id, event_id: int) -> list[str] | None:
+        room_id = str(room_id)
+        log = self._logs.get(room_id) or ()
+        last = self._seq.get(room_id, 0)
+        oldest = log[0][0] if log else last + 1
+        if event_id > last or event_id < oldest - 1:
+            return None
+        return [frame for eid, frame in sorted(log) if eid > event_id]
+
+
+class RedisReplayLog:
+    """
+    Shared log stored next to the channel layer: a counter per room (kept
+    forever) plus a sorted set of encoded frames scored by event id.
+    """
+
+    PREFIX = "tuchati:replay"
+
+    def __init__(self, channel_layer, size: int, ttl: int):
+        self.channel_layer = channel_layer
+        self.size = size
+        self.ttl = ttl
+
+    def _redis(self):
+        return self.channel_layer.connection(0)
+
+    async def next_id(self, room_id) -> int:
+        return int(await self._redis().incr(f"{self.PREFIX}:seq:{room_id}"))
+
+    async def append(self, room_id, event_id: int, frame: str) -> None:
+        key = f"{self.PREFIX}:log:{room_id}"
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.zadd(key, {frame: event_id})
+        pipe.zremrangebyrank(key, 0, -(self.size + 1))
+        # only the frames expire: the counter must never restart, or
+        # resuming clients would skip or repeat events (persist clears a TTL
+        # set by older workers)
+        pipe.expire(key, self.ttl)
+        pipe.persist(f"{self.PREFIX}:seq:{room_id}")
+        await pipe.execute()
+
+    async def last_id(self, room_id) -> int:
+        return int(await self._redis().get(f"{self.PREFIX}:seq:{room_id}") or 0)
+
+    async def since(self, room_id, event_id: int) -> list[str] | None:
+        key = f"{self.PREFIX}:log:{room_id}"
+        pipe = self._redis().pipeline(transaction=True)
+        pipe.get(f"{self.PREFIX}:seq:{room_id}")
+        pipe.zrange(key, 0, 0, withscores=True)
+        pipe.zrangebyscore(key, f"({event_id}", "+inf")
+        last, oldest, frames = await pipe.execute()
+        last = int(last or 0)
+        oldest = int(oldest[0][1]) if oldest else last + 1
+        if event_id > last or event_id < oldest - 1:
+            return None
+        return [f.decode() if isinstance(f, bytes) else f for f in frames]
+
+
+_logs = LayerStore(
+    redis=lambda channel_layer: RedisReplayLog(channel_layer, REPLAY_LOG_SIZE, REPLAY_LOG_TTL),
+    local=lambda: LocalReplayLog(REPLAY_LOG_SIZE),
+)
+
+
+def get_replay_log(channel_layer):
+    """Replay log bound to the given channel layer (Redis when available)."""
+    return _logs.get(channel_layer)
+
+
+async def publish_room_event(channel_layer, room_id, frame: dict, *, hint: dict | None = None, **extra) -> int:
+    """
+    Stamp a durable room frame with the next event id, keep it in the
+    replay log and fan it out to the room group. Returns the event id.
+    With a hint, the group gets the hint (stamped with the same id) and
+    the full frame only goes to the log.
+    Ephemeral frames (typing, presence) go straight to group_send instead.
+    """
+    log = get_replay_log(channel_layer)
+    event_id = await log.next_id(room_id)
+    event = frame_event({**(hint or frame), "event_id": event_id}, **extra)
+    stored = event["frame"] if hint is None else encode_frame({**frame, "event_id": event_id})
+    await log.append(room_id, event_id, stored)
+    await channel_layer.group_send(f"room_{room_id}", event)
+    return event_id
+
+
+def lazy_fanout(membership) -> bool:
+    """True when a room is big enough to fan out hints instead of message bodies."""
+    return bool(LAZY_FANOUT_MEMBERS) and membership is not None and len(membership.members) >= LAZY_FANOUT_MEMBERS
+
+
+async def publish_message(channel_layer, room_id, payload: dict, *, lazy: bool = False) -> int:
+    """
+    Publish a new message. In lazy mode members get a room_activity hint
+    (latest event id, unread delta, sender) and pull the body with a
+    "pull" frame if they have the room open. Returns the event id.
+    """
+    frame = {**payload, "room_id": str(room_id)}
+    if not lazy:
+        return await publish_room_event(channel_layer, room_id, frame)
+    hint = {
+        "type": "room_activity",
+        "room_id": str(room_id),
+        "sender_id": payload.get("sender_id"),
+        "unread_delta": 1,
+    }
+    return await publish_room_event(channel_layer, room_id, frame, hint=hint)
@@ -1,10 +1,12 @@
 # backend/apps/chat/routing.py
 from django.urls import re_path
-from .consumers import ChatConsumer
+from .consumers import ChatConsumer, UserConsumer
 
 # Accept:
 #   /ws/chat/<uuid>/
 #   /ws/chat/<uuid>
+#   /ws/user/            (one multiplexed socket for all rooms)
 websocket_urlpatterns = [
     re_path(r"^ws/chat/(?P<room_id>[0-9a-fA-F-]+)/?$", ChatConsumer.as_asgi()),
+    re_path(r"^ws/user/?$", UserConsumer.as_asgi()),
 ]
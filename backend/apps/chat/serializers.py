@@ -2,11 +2,12 @@
 # ============================================================
 # TuChati Chat serializers (frontend-aligned, no 500s)
 # ============================================================
-from django.db.models import Max
+from django.db import IntegrityError, transaction
 from rest_framework import serializers
 from django.contrib.auth import get_user_model
-from .models import ChatRoom, Message, MessageUserMeta, DirectChatRequest, GroupInvite
+from .models import ChatRoom, Message, MessageUserMeta, DirectChatRequest, GroupInvite, RoomReadState
 from .consumers import _msg_to_dict
+from .ingest import storable_client_id
 
 User = get_user_model()
 
@@ -37,9 +38,16 @@ class ChatRoomSerializer(serializers.ModelSerializer):
             "unread_count",
         ]
 
+    def update(self, instance, validated_data):
+        # save only what was sent: the room-list columns are kept by signals
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        instance.save(update_fields=[*validated_data, "changed_at"])
+        return instance
+
     # ---- helpers used by the UI ----
     def get_member_count(self, obj: ChatRoom) -> int:
-        return obj.participants.count()
+        return obj.member_count
 
     def get_members(self, obj: ChatRoom):
         request = self.context.get("request")
@@ -84,31 +92,21 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         request = self.context.get("request")
         if not request or not request.user or not request.user.is_authenticated:
             return False
+        if hasattr(obj, "my_is_admin"):
+            return obj.my_is_admin
         return obj.admins.filter(id=request.user.id).exists()
 
     def get_admin_ids(self, obj: ChatRoom):
-        return list(obj.admins.values_list("id", flat=True))
+        # .all() so the viewset's admins prefetch is used
+        return [admin.id for admin in obj.admins.all()]
 
     def get_updated_at(self, obj: ChatRoom):
         # “activity” time: last message timestamp or room.created_at
-        last = (
-            Message.objects.filter(room=obj)
-            .aggregate(m=Max("created_at"))
-            .get("m")
-        )
-        if last:
-            return last.isoformat()
-        # fall back to model timestamp if present
-        created_at = getattr(obj, "created_at", None)
-        return created_at.isoformat() if created_at else None
+        last = obj.last_activity_at or obj.created_at
+        return last.isoformat() if last else None
 
     def get_last_message(self, obj: ChatRoom):
-        m = (
-            Message.objects.filter(room=obj)
-            .select_related("sender")
-            .order_by("-created_at")
-            .first()
-        )
+        m = obj.last_message
         if not m:
             return None
         return {
@@ -128,12 +126,15 @@ class ChatRoomSerializer(serializers.ModelSerializer):
         user = getattr(request, "user", None)
         if not user or not user.is_authenticated:
             return 0
-        return (
-            Message.objects.filter(room=obj)
-            .exclude(sender=user)
-            .exclude(read_by=user)
-            .count()
+        if hasattr(obj, "my_unread"):
+            return obj.my_unread or 0
+        # maintained per member by apps.chat.unread
+        unread = (
+            RoomReadState.objects.filter(room=obj, user=user)
+            .values_list("unread_count", flat=True)
+            .first()
         )
+        return unread or 0
 
 
 class MessageSerializer(serializers.ModelSerializer):
@@ -189,13 +190,26 @@ class MessageSerializer(serializers.ModelSerializer):
         forwarded_from_id = validated_data.pop("forwarded_from_id", None)
         starred = validated_data.pop("starred", False)
         note = validated_data.pop("note", "")
-        validated_data.pop("_client_id", None)
-
-        message = Message.objects.create(
-            reply_to_id=reply_to_id,
-            forwarded_from_id=forwarded_from_id,
-            **validated_data,
-        )
+        client_id = storable_client_id(validated_data.pop("_client_id", None))
+
+        # a retried upload returns the message the first attempt created
+        if client_id:
+            original = self._original_message(user, client_id)
+            if original is not None:
+                return original
+        try:
+            with transaction.atomic():
+                message = Message.objects.create(
+                    reply_to_id=reply_to_id,
+                    forwarded_from_id=forwarded_from_id,
+                    client_id=client_id,
+                    **validated_data,
+                )
+        except IntegrityError:
+            original = self._original_message(user, client_id) if client_id else None
+            if original is None:
+                raise
+            return original
 
         meta_obj = None
         if note or starred:
@@ -216,6 +230,14 @@ class MessageSerializer(serializers.ModelSerializer):
 
         return message
 
+    @staticmethod
+    def _original_message(user, client_id):
+        message = Message.objects.filter(sender=user, client_id=client_id).select_related("sender").first()
+        if message is not None:
+            message.meta_for_user = list(MessageUserMeta.objects.filter(message=message, user=user))
+            message.is_retry = True
+        return message
+
     def to_representation(self, instance: Message):
         request = self.context.get("request")
         current_user_id = None
@@ -226,7 +248,11 @@ class MessageSerializer(serializers.ModelSerializer):
                     MessageUserMeta.objects.filter(message=instance, user_id=current_user_id)
                 )
 
-        data = _msg_to_dict(instance, current_user_id=current_user_id)
+        data = _msg_to_dict(
+            instance,
+            current_user_id=current_user_id,
+            read_states=self.context.get("read_states"),
+        )
         data["sender"] = self.get_sender(instance)
         return data
 
@@ -0,0 +1,137 @@
+# ================================================================
+# backend/apps/chat/signals.py
+# Keep the membership cache in step with ChatRoom participants / admins,
+# the WebSocket principal cache in step with users and the room-list
+# columns (last message, activity, member count, unread) in step with both,
+# and log message changes for GET /rooms/<id>/changes/ (changes.py)
+# ================================================================
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import QuerySet
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from apps.accounts.utils import revoke_user_tokens
+from apps.chat.activity import bury_rooms, record_messages, refresh_last_message, refresh_member_count, touch_rooms, unbury_rooms
+from apps.chat.changes import log_changes
+from apps.chat.membership import invalidate_membership
+from apps.chat.middleware import PRINCIPAL_TTL, principal_cache_key, principal_fields
+from apps.chat.models import ChatRoom, Message, MessageUserMeta
+from apps.chat.unread import bump_unread, drop_unread, seed_read_states
+
+
+def _room_cascade(origin) -> bool:
+    """True when a delete started from ChatRoom rows (instance or queryset)."""
+    if isinstance(origin, QuerySet):
+        return origin.model is ChatRoom
+    return isinstance(origin, ChatRoom)
+
+
+def _participants_changed(action, pairs) -> None:
+    """Room-list bookkeeping for (user_id, room_id) pairs that joined or left."""
+    pairs = list(pairs)
+    refresh_member_count(room_id for _, room_id in pairs)
+    if action == "post_add":
+        joined = {}
+        for user_id, room_id in pairs:
+            joined.setdefault(room_id, []).append(user_id)
+        for room_id, user_ids in joined.items():
+            seed_read_states(room_id, user_ids)
+        unbury_rooms(pairs)
+    else:
+        bury_rooms(pairs)
+
+
+@receiver(m2m_changed, sender=ChatRoom.participants.through)
+@receiver(m2m_changed, sender=ChatRoom.admins.through)
+def membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    counted = sender is ChatRoom.participants.through
+    if not reverse:
+        if action == "pre_clear" and counted:
+            instance._cleared_user_ids = list(instance.participants.values_list("pk", flat=True))
+        if action in ("post_add", "post_remove", "post_clear"):
+            invalidate_membership(instance.pk)
+            if counted:
+                user_ids = getattr(instance, "_cleared_user_ids", ()) if action == "post_clear" else pk_set or ()
+                _participants_changed(action, ((user_id, instance.pk) for user_id in user_ids))
+            else:
+                touch_rooms([instance.pk])
+        return
+
+    # user.chat_rooms.add(...) style: instance is the user, pk_set holds rooms
+    if action == "pre_clear":
+        field = "chat_rooms" if sender is ChatRoom.participants.through else "admin_rooms"
+        instance._cleared_room_ids = list(getattr(instance, field).values_list("pk", flat=True))
+    elif action in ("post_add", "post_remove", "post_clear"):
+        room_ids = getattr(instance, "_cleared_room_ids", ()) if action == "post_clear" else pk_set or ()
+        for room_id in room_ids:
+            invalidate_membership(room_id)
+        if counted:
+            _participants_changed(action, ((instance.pk, room_id) for room_id in room_ids))
+        else:
+            touch_rooms(room_ids)
+
+
+@receiver(pre_delete, sender=ChatRoom)
+def room_deleting(sender, instance, **kwargs):
+    # participant rows go with the room without an m2m_changed signal
+    bury_rooms((user_id, instance.pk) for user_id in instance.participants.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=ChatRoom)
+def room_deleted(sender, instance, **kwargs):
+    invalidate_membership(instance.pk)
+
+
+@receiver(post_save, sender=Message)
+def message_saved(sender, instance, created, **kwargs):
+    # socket messages are bulk inserted and recorded by ingest.py
+    if created:
+        record_messages([instance])
+        bump_unread([instance])
+    else:
+        log_changes(instance.room_id, [instance.pk])
+
+
+@receiver(post_delete, sender=Message)
+def message_deleted(sender, instance, origin=None, **kwargs):
+    # the room and its change log are going too
+    if _room_cascade(origin):
+        return
+    # SET_NULL has already cleared last_message if this was it
+    refresh_last_message([instance.room_id])
+    drop_unread(instance)
+    log_changes(instance.room_id, [instance.pk], deleted=True)
+
+
+@receiver(post_save, sender=MessageUserMeta)
+def message_meta_saved(sender, instance, created, **kwargs):
+    # a meta row created with its message is part of the new message
+    if not created:
+        log_changes(
+            instance.message.room_id,
+            [instance.message_id],
+            user_id=instance.user_id,
+            deleted=instance.deleted_for_me,
+        )
+
+
+@receiver(pre_delete, sender=get_user_model())
+def user_deleting(sender, instance, **kwargs):
+    # participant rows go with the user without an m2m_changed signal
+    instance._member_room_ids = list(instance.chat_rooms.values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=get_user_model())
+def user_deleted(sender, instance, **kwargs):
+    refresh_member_count(getattr(instance, "_member_room_ids", ()))
+    for room_id in getattr(instance, "_member_room_ids", ()):
+        invalidate_membership(room_id)
+
+
+@receiver(post_save, sender=get_user_model())
+def user_saved(sender, instance, **kwargs):
+    cache.set(principal_cache_key(instance.pk), principal_fields(instance), PRINCIPAL_TTL)
+    if not instance.is_active:
+        # deactivated users lose their open sockets at the next heartbeat
+        revoke_user_tokens(instance.pk)
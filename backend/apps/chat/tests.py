@@ -1,3 +1,107 @@
-from django.test import TestCase
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.test import TestCase, TransactionTestCase
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
 
-# Create your tests here.
+from apps.accounts.models import DeviceSession
+
+from apps.chat.middleware import TokenAuthMiddleware
+from apps.chat.models import ChatRoom, Message, RoomChange, RoomTombstone
+from apps.chat.outbound import MAX_FRAMES
+from apps.chat.replay import publish_room_event
+from apps.chat.routing import websocket_urlpatterns
+
+User = get_user_model()
+
+
+class RoomDeleteTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.room = ChatRoom.objects.create(name="r", is_group=True)
+        self.room.participants.add(self.alice)
+        message = Message.objects.create(room=self.room, sender=self.alice, content="hi")
+        message.pinned = True
+        message.save(update_fields=["pinned"])
+
+    def assert_room_gone(self, room_id):
+        connection.check_constraints()
+        self.assertFalse(ChatRoom.objects.filter(pk=room_id).exists())
+        self.assertFalse(RoomChange.objects.filter(room_id=room_id).exists())
+        self.assertTrue(RoomTombstone.objects.filter(user=self.alice, room_id=room_id).exists())
+
+    def test_queryset_delete(self):
+        room_id = self.room.pk
+        ChatRoom.objects.filter(pk=room_id).delete()
+        self.assert_room_gone(room_id)
+
+    def test_instance_delete(self):
+        room_id = self.room.pk
+        self.room.delete()
+        self.assert_room_gone(room_id)
+
+
+class ResumeReplayTests(TransactionTestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.room = ChatRoom.objects.create(name="r", is_group=True)
+        self.room.participants.add(self.alice)
+
+    def test_gap_larger_than_outbound_queue(self):
+        async def run():
+            channel_layer = get_channel_layer()
+            room_id = str(self.room.id)
+            for n in range(MAX_FRAMES + 44):
+                await publish_room_event(channel_layer, room_id, {"type": "message_remove", "room_id": room_id, "n": n})
+
+            token = AccessToken.for_user(self.alice)
+            communicator = WebsocketCommunicator(
+                TokenAuthMiddleware(URLRouter(websocket_urlpatterns)),
+                f"/ws/chat/{room_id}/?token={token}&resume_from=1",
+            )
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            frames = []
+            while not frames or frames[-1]["type"] != "resumed":
+                frames.append(await communicator.receive_json_from(timeout=5))
+            resumed = frames.pop()
+            self.assertTrue(resumed["has_more"])
+            self.assertEqual(resumed["replayed"], MAX_FRAMES // 2)
+
+            # the rest of the gap comes in pulls
+            pulled = {"has_more": True}
+            while pulled["has_more"]:
+                await communicator.send_json_to({"type": "pull", "after": frames[-1]["event_id"]})
+                while True:
+                    frame = await communicator.receive_json_from(timeout=5)
+                    if frame["type"] == "pulled":
+                        pulled = frame
+                        break
+                    frames.append(frame)
+            replayed = [f["n"] for f in frames if f["type"] == "message_remove"]
+            self.assertEqual(replayed, list(range(1, MAX_FRAMES + 44)))
+            await communicator.disconnect()
+
+        async_to_sync(run)()
+
+
+class SessionRevokeTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", "alice@example.com", "pw")
+        self.client = APIClient()
+
+    def test_revoke_covers_refreshed_tokens(self):
+        login = self.client.post("/api/token/", {"username": "alice", "password": "pw"}).json()
+        refreshed = self.client.post("/api/token/refresh/", {"refresh": login["refresh"]}).json()["access"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {refreshed}")
+        session = DeviceSession.objects.get(user=self.alice)
+        self.assertEqual(self.client.delete(f"/api/accounts/sessions/{session.id}/").status_code, 204)
+
+        middleware = TokenAuthMiddleware(URLRouter(websocket_urlpatterns))
+        self.assertIsNone(async_to_sync(middleware.get_user)(AccessToken(refreshed)))
+        response = self.client.post("/api/token/refresh/", {"refresh": login["refresh"]})
+        self.assertEqual(response.status_code, 401)
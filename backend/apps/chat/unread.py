@@ -0,0 +1,106 @@
+# ================================================================
+# backend/apps/chat/unread.py
+# Per-(user, room) unread counters on RoomReadState.unread_count
+# - bumped in the message insert transaction, recounted when a member's
+#   read cursor moves, reconciled by `manage.py chat_reconcile_unread`
+# - updates that change a counter outside a read also move updated_at
+#   (room-list sync); message bumps are covered by ChatRoom.changed_at
+# - pushed to user_{id} as {"type": "unread", "room_id", "count"}
+# ================================================================
+from collections import Counter
+from datetime import datetime, timezone as dt_timezone
+
+from django.db.models import Count, DateTimeField, F, OuterRef, Q, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from apps.chat.frames import frame_event
+from apps.chat.models import Message, RoomReadState
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def _unread_subquery():
+    """Messages from others after the row's read cursor, as an UPDATE expression."""
+    unread = (
+        Message.objects.filter(
+            room_id=OuterRef("room_id"),
+            created_at__gt=Coalesce(OuterRef("last_read_at"), Value(EPOCH, output_field=DateTimeField())),
+        )
+        .exclude(sender_id=OuterRef("user_id"))
+        .order_by()
+        .values("room_id")
+        .annotate(n=Count("id"))
+        .values("n")
+    )
+    return Coalesce(Subquery(unread), 0)
+
+
+def bump_unread(messages) -> None:
+    """Count new messages against every other member of their rooms."""
+    by_room: dict = {}
+    for msg in messages:
+        by_room.setdefault(msg.room_id, Counter())[msg.sender_id] += 1
+    for room_id, senders in by_room.items():
+        total = sum(senders.values())
+        RoomReadState.objects.filter(room_id=room_id).exclude(user_id__in=senders).update(
+            unread_count=F("unread_count") + total
+        )
+        for sender_id, own in senders.items():
+            if total > own:
+                RoomReadState.objects.filter(room_id=room_id, user_id=sender_id).update(
+                    unread_count=F("unread_count") + (total - own)
+                )
+
+
+def drop_unread(message) -> None:
+    """Take a deleted message back out of the counters that included it."""
+    RoomReadState.objects.filter(room_id=message.room_id, unread_count__gt=0).filter(
+        Q(last_read_at__isnull=True) | Q(last_read_at__lt=message.created_at)
+    ).exclude(user_id=message.sender_id).update(
+        unread_count=Greatest(F("unread_count") - 1, 0), updated_at=timezone.now()
+    )
+
+
+def recount_unread(room_id=None, user_ids=None) -> int:
+    """Recompute counters from the read cursors; returns the rows corrected."""
+    rows = RoomReadState.objects.all()
+    if room_id is not None:
+        rows = rows.filter(room_id=room_id)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=list(user_ids))
+    # only rows that drift get a new updated_at (room-list sync reads it)
+    stale = rows.annotate(fresh=_unread_subquery()).exclude(unread_count=F("fresh"))
+    return RoomReadState.objects.filter(pk__in=stale.values("pk")).update(
+        unread_count=_unread_subquery(), updated_at=timezone.now()
+    )
+
+
+def seed_read_states(room_id, user_ids) -> None:
+    """Give new members a counter row, counting the history they have not read."""
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    RoomReadState.objects.bulk_create(
+        [RoomReadState(room_id=room_id, user_id=user_id) for user_id in user_ids],
+        ignore_conflicts=True,
+    )
+    recount_unread(room_id, user_ids)
+
+
+async def aunread_counts(room_id, user_ids=None) -> list[tuple]:
+    """(user_id, unread_count) for a room's members, or just the given users."""
+    rows = RoomReadState.objects.filter(room_id=room_id)
+    if user_ids is not None:
+        rows = rows.filter(user_id__in=list(user_ids))
+    return [row async for row in rows.values_list("user_id", "unread_count")]
+
+
+async def publish_unread(channel_layer, room_id, counts) -> None:
+    """Push absolute counts; a newer count for the same room replaces a queued one."""
+    room_id = str(room_id)
+    for user_id, count in counts:
+        await channel_layer.group_send(
+            f"user_{user_id}",
+            frame_event({"type": "unread", "room_id": room_id, "count": count}, coalesce=f"unread:{room_id}"),
+        )
@@ -7,12 +7,14 @@
 #
 # Endpoints:
 #   GET    /api/chat/rooms/                       List user’s rooms
+#   GET    /api/chat/rooms/sync/?since=<token>   Room-list changes since token
 #   POST   /api/chat/rooms/                      Create a new room
 #   GET    /api/chat/rooms/<uuid:pk>/            Retrieve specific room
 #   PUT    /api/chat/rooms/<uuid:pk>/            Update room
 #   DELETE /api/chat/rooms/<uuid:pk>/            Delete room
 #   GET    /api/chat/rooms/<uuid:room_id>/messages/   List messages in room
 #   POST   /api/chat/rooms/<uuid:room_id>/messages/  Send a message
+#   GET    /api/chat/rooms/<uuid:room_id>/changes/?since=<seq>  Message changes since seq
 # ============================================================
 
 from rest_framework.routers import DefaultRouter
@@ -69,4 +71,9 @@ urlpatterns = [
         MessageListCreateViewSet.as_view({"get": "starred"}),
         name="chat_room_messages_starred",
     ),
+    path(
+        "rooms/<uuid:room_id>/changes/",
+        MessageListCreateViewSet.as_view({"get": "changes"}),
+        name="chat_room_changes",
+    ),
 ]
@@ -7,16 +7,25 @@ from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
 from rest_framework.decorators import action
 from rest_framework.exceptions import PermissionDenied, NotFound
+from django.conf import settings
 from django.contrib.auth import get_user_model
-from django.db.models import Prefetch
+from django.db.models import Exists, OuterRef, Prefetch, Subquery
 from asgiref.sync import async_to_sync
 from channels.layers import get_channel_layer
+from django.utils import timezone
+from datetime import timedelta
 from .consumers import _msg_to_dict, _user_display
+from .cursors import InvalidCursor, decode_cursor, decode_sync_token, encode_cursor, encode_sync_token, keyset_q, sort_key
+from .frames import frame_event
+from .membership import get_membership, is_admin, is_member
 
 from django.db import transaction
 from django.db.models import Q
-from .models import ChatRoom, Message, SystemMessage, MessageUserMeta, DirectChatRequest, GroupInvite
+from .models import ChatRoom, Message, MessageReaction, SystemMessage, MessageUserMeta, DirectChatRequest, GroupInvite, RoomChange, RoomReadState, RoomTombstone
+from .receipts import load_read_states, receipt_lists
+from .replay import lazy_fanout, publish_message, publish_room_event
 from .serializers import ChatRoomSerializer, MessageSerializer, DirectChatRequestSerializer, GroupInviteSerializer
+from .unread import publish_unread
 from .utils import get_or_create_direct_room
 
 User = get_user_model()
@@ -40,13 +49,24 @@ def _message_preview(message: Message | None):
 class ChatRoomViewSet(viewsets.ModelViewSet):
     serializer_class = ChatRoomSerializer
     permission_classes = [permissions.IsAuthenticated]
+    # sync windows overlap by this much so changes committed late are not missed
+    SYNC_OVERLAP = getattr(settings, "CHAT_ROOM_SYNC_OVERLAP_SECONDS", 5)
 
     def get_queryset(self):
-        # light prefetch to reduce N+1
+        # member count, activity and last message are columns on ChatRoom;
+        # the per-user bits are annotations, so the list is one query plus
+        # the member / admin prefetches
+        my_unread = RoomReadState.objects.filter(
+            room=OuterRef("pk"),
+            user=self.request.user,
+        ).values("unread_count")[:1]
+        my_admin = ChatRoom.admins.through.objects.filter(chatroom=OuterRef("pk"), user=self.request.user)
         return (
             ChatRoom.objects.filter(participants=self.request.user)
             .distinct()
+            .select_related("last_message__sender")
             .prefetch_related("participants", "admins")
+            .annotate(my_unread=Subquery(my_unread), my_is_admin=Exists(my_admin))
         )
 
     def get_serializer_context(self):
@@ -58,8 +78,48 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         room = serializer.save()
         room.participants.add(self.request.user)
         room.admins.add(self.request.user)
+        # member_count was bumped in the database by the m2m signal
+        room.refresh_from_db(fields=["member_count"])
         return room
 
+    @action(detail=False, methods=["get"], url_path="sync")
+    def sync(self, request):
+        """
+        Room-list delta: rooms whose metadata, members, last message or
+        unread count changed since ?since=<token>, plus the ids of rooms
+        that left the list. Without a token (or with a bad one) this is the
+        full list with reset=true. Clients keep the returned token.
+        """
+        now = timezone.now()
+        since = None
+        if request.query_params.get("since"):
+            try:
+                since = decode_sync_token(request.query_params["since"]) - timedelta(seconds=self.SYNC_OVERLAP)
+            except InvalidCursor:
+                since = None
+
+        rooms = self.get_queryset()
+        removed = []
+        if since is not None:
+            my_state_changed = RoomReadState.objects.filter(
+                room=OuterRef("pk"), user=request.user, updated_at__gt=since
+            )
+            rooms = rooms.filter(Q(changed_at__gt=since) | Exists(my_state_changed))
+            removed = [
+                str(room_id)
+                for room_id in RoomTombstone.objects.filter(user=request.user, removed_at__gt=since)
+                .exclude(room_id__in=ChatRoom.objects.filter(participants=request.user).values("pk"))
+                .values_list("room_id", flat=True)
+            ]
+        return Response(
+            {
+                "rooms": self.get_serializer(rooms, many=True).data,
+                "removed": removed,
+                "reset": since is None,
+                "token": encode_sync_token(now),
+            }
+        )
+
     @action(detail=False, methods=["post"])
     def create_room(self, request):
         name = request.data.get("name")
@@ -69,14 +129,17 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         room = ChatRoom.objects.create(name=name, is_group=is_group)
         room.participants.add(request.user)
         room.admins.add(request.user)
+        room.refresh_from_db(fields=["member_count"])
         return Response(self.get_serializer(room).data, status=201)
 
     @action(detail=True, methods=["post"], url_path="invite")
     def invite(self, request, pk=None):
         room = self.get_object()
 
-        if not room.participants.filter(id=request.user.id).exists():
+        membership = get_membership(room.id)
+        if membership is None or request.user.id not in membership.members:
             raise PermissionDenied("You must be a participant to invite others.")
+        members = set(membership.members)
 
         usernames = request.data.get("usernames", []) or []
         emails = request.data.get("emails", []) or []
@@ -89,10 +152,11 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
         invites_created: list[GroupInvite] = []
 
         def handle_user(user: User):
-            if room.participants.filter(id=user.id).exists():
+            if user.id in members:
                 return
             if user.auto_accept_group_invites:
                 room.participants.add(user)
+                members.add(user.id)
                 added_users.append(user.username)
                 added_instances.append(user)
             else:
@@ -129,50 +193,52 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
                 continue
             handle_user(u)
 
-        room.save()
-
         channel_layer = get_channel_layer()  # define once
 
         if added_users:
             msg_text = f"{request.user.username} added {', '.join(added_users)} to the chat."
             SystemMessage.objects.create(room=room, content=msg_text)
-            async_to_sync(channel_layer.group_send)(
-                f"room_{room.id}",
+            async_to_sync(publish_room_event)(
+                channel_layer,
+                room.id,
                 {
-                    "type": "chat_system_message",
+                    "type": "system_message",
                     "event": "user_invited",
                     "message": msg_text,
                     "room_id": str(room.id),
                     "invited_users": added_users,
+                    "timestamp": str(timezone.now()),
                 },
             )
 
         for u in added_instances:
             async_to_sync(channel_layer.group_send)(
                 f"user_{u.id}",
-                {
-                    "type": "chat_invitation",
+                frame_event({
+                    "type": "invitation",
                     "room_id": str(room.id),
                     "room_name": room.name,
                     "invited_by": request.user.username,
                     "message": f"You’ve been added to the chat {room.name or room.id}",
                     "status": GroupInvite.STATUS_ACCEPTED,
-                },
+                    "timestamp": str(timezone.now()),
+                }),
             )
 
         for invite in invites_created:
             user = invite.invitee
             async_to_sync(channel_layer.group_send)(
                 f"user_{user.id}",
-                {
-                    "type": "chat_group_invite",
+                frame_event({
+                    "type": "group_invite",
                     "invite_id": str(invite.id),
                     "room_id": str(room.id),
                     "room_name": room.name,
                     "invited_by": request.user.username,
                     "message": f"You’ve been invited to join {room.name or room.id}",
                     "status": invite.status,
-                },
+                    "timestamp": str(timezone.now()),
+                }),
             )
 
         payload = {
@@ -186,6 +252,10 @@ class ChatRoomViewSet(viewsets.ModelViewSet):
 class MessageListCreateViewSet(viewsets.ModelViewSet):
     serializer_class = MessageSerializer
     permission_classes = [permissions.IsAuthenticated]
+    PAGE_SIZE = getattr(settings, "CHAT_MESSAGES_PAGE_SIZE", 50)
+    PAGE_MAX = getattr(settings, "CHAT_HISTORY_PAGE_MAX", 100)
+    CHANGES_BATCH = getattr(settings, "CHAT_ROOM_CHANGES_BATCH", 500)
+    SYNC_OVERLAP = getattr(settings, "CHAT_ROOM_SYNC_OVERLAP_SECONDS", 5)
 
     _room_cache = None
 
@@ -193,18 +263,23 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         if self._room_cache is not None:
             return self._room_cache
         room_id = self.kwargs.get("room_id")
-        room = (
-            ChatRoom.objects.filter(id=room_id, participants=self.request.user)
-            .prefetch_related("admins")
-            .first()
-        )
+        room = None
+        if is_member(room_id, self.request.user.id):
+            room = ChatRoom.objects.filter(id=room_id).first()
         if not room:
             raise PermissionDenied("You are not a participant of this room.")
         self._room_cache = room
         return room
 
     def _is_room_admin(self, room: ChatRoom, user) -> bool:
-        return room.admins.filter(id=user.id).exists()
+        return is_admin(room.id, user.id)
+
+    def get_serializer_context(self):
+        ctx = super().get_serializer_context()
+        if self.action in ("list", "starred", "changes"):
+            # receipts are derived from room cursors; load them once per page
+            ctx["read_states"] = load_read_states(self._get_room().id)
+        return ctx
 
     def get_queryset(self):
         room = self._get_room()
@@ -219,14 +294,16 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
                 "pinned_by",
             )
             .prefetch_related(
-                "reactions",
+                Prefetch(
+                    "reactions",
+                    queryset=MessageReaction.objects.filter(user=self.request.user),
+                    to_attr="my_reactions",
+                ),
                 Prefetch(
                     "user_meta",
                     queryset=MessageUserMeta.objects.filter(user=self.request.user),
                     to_attr="meta_for_user",
                 ),
-                "delivered_to",
-                "read_by",
             )
             .order_by("created_at")
         )
@@ -237,23 +314,112 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         ).values_list("message_id", flat=True)
         return queryset.exclude(id__in=deleted_subquery)
 
+    def list(self, request, room_id=None):
+        """
+        One keyset page of messages, oldest-first: ?before=<cursor> for older,
+        ?after=<cursor> for newer, neither for the newest page; ?limit= caps it.
+        Cursors are the opaque (created_at, id) tokens the socket history uses,
+        so pages stay stable while new messages arrive.
+        """
+        before = request.query_params.get("before")
+        after = request.query_params.get("after")
+        if before and after:
+            return Response({"detail": "Pass either before or after, not both."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            limit = int(request.query_params.get("limit") or self.PAGE_SIZE)
+        except ValueError:
+            return Response({"detail": "limit must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+        limit = max(1, min(limit, self.PAGE_MAX))
+
+        direction = "after" if after else "before"
+        cursor = after or before
+        queryset = self.get_queryset()
+        if cursor:
+            try:
+                queryset = queryset.filter(keyset_q(*decode_cursor(cursor), direction=direction))
+            except InvalidCursor:
+                return Response({"detail": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # one extra row tells us whether another page exists
+        ordering = ("created_at", "id") if direction == "after" else ("-created_at", "-id")
+        rows = list(queryset.order_by(*ordering)[: limit + 1])
+        has_more = len(rows) > limit
+        rows = sorted(rows[:limit], key=sort_key)
+        return Response(
+            {
+                "results": self.get_serializer(rows, many=True).data,
+                "before_cursor": encode_cursor(rows[0].created_at, rows[0].id) if rows else cursor,
+                "after_cursor": encode_cursor(rows[-1].created_at, rows[-1].id) if rows else cursor,
+                "has_more": has_more,
+            }
+        )
+
+    @action(detail=False, methods=["get"], url_path="changes")
+    def changes(self, request, room_id=None):
+        """
+        Message changes after ?since=<seq> (0 or missing: the whole log):
+        {"upserts": [payloads], "deleted": [ids], "seq": n, "has_more": bool}.
+        Covers edits, pins, reactions, deletes and the caller's star, note
+        and deleted-for-me; new messages come from ?after= on the list.
+        Changes logged in the last few seconds are sent again, since a
+        lower seq can commit after a higher one.
+        """
+        try:
+            since = max(0, int(request.query_params.get("since") or 0))
+        except ValueError:
+            return Response({"detail": "since must be an integer."}, status=status.HTTP_400_BAD_REQUEST)
+
+        room = self._get_room()
+        visible = RoomChange.objects.filter(room=room).filter(Q(user__isnull=True) | Q(user=request.user))
+        rows = list(visible.filter(id__gt=since).order_by("id")[: self.CHANGES_BATCH + 1])
+        has_more = len(rows) > self.CHANGES_BATCH
+        rows = rows[: self.CHANGES_BATCH]
+        if since:
+            recent = timezone.now() - timedelta(seconds=self.SYNC_OVERLAP)
+            rows = list(visible.filter(id__lte=since, created_at__gte=recent).order_by("id")[: self.CHANGES_BATCH]) + rows
+
+        # latest change per message wins
+        latest = {row.message_id: row for row in rows}
+        deleted = {message_id for message_id, row in latest.items() if row.deleted}
+        wanted = [message_id for message_id in latest if message_id not in deleted]
+        # get_queryset hides messages deleted for this user
+        messages = sorted(self.get_queryset().filter(id__in=wanted), key=sort_key)
+        deleted.update(set(wanted) - {message.id for message in messages})
+        return Response(
+            {
+                "upserts": self.get_serializer(messages, many=True).data,
+                "deleted": [str(message_id) for message_id in deleted],
+                "seq": max([since] + [row.id for row in rows]),
+                "has_more": has_more,
+            }
+        )
+
     def perform_create(self, serializer):
         room = self._get_room()
         message: Message = serializer.save(room=room, sender=self.request.user)
+        if getattr(message, "is_retry", False):
+            # already broadcast when the first attempt was saved
+            return
 
         # broadcast to WS listeners so other clients see uploads/voice notes instantly
         channel_layer = get_channel_layer()
-        public_payload = _msg_to_dict(message)
-        async_to_sync(channel_layer.group_send)(
-            f"room_{room.id}",
-            {"type": "chat_message", "payload": public_payload},
+        public_payload = _msg_to_dict(message, read_states=())
+        lazy = lazy_fanout(get_membership(room.id))
+        async_to_sync(publish_message)(channel_layer, room.id, public_payload, lazy=lazy)
+        # counters were bumped by the post_save signal; lazy rooms need the
+        # push too, since their hint only reaches sockets with the room open
+        counts = (
+            RoomReadState.objects.filter(room=room)
+            .exclude(user=self.request.user)
+            .values_list("user_id", "unread_count")
         )
+        async_to_sync(publish_unread)(channel_layer, room.id, list(counts))
 
         if getattr(message, "meta_for_user", None):
-            own_payload = _msg_to_dict(message, current_user_id=self.request.user.id)
+            own_payload = _msg_to_dict(message, current_user_id=self.request.user.id, read_states=())
             async_to_sync(channel_layer.group_send)(
                 f"user_{self.request.user.id}",
-                {"type": "message_meta", "payload": own_payload},
+                frame_event({"type": "message_meta", "room_id": str(room.id), "payload": own_payload}),
             )
 
     def _get_message(self, pk: str) -> Message:
@@ -282,9 +448,10 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
                 raise PermissionDenied("You cannot delete this message for everyone.")
             message_id = str(message.id)
             message.delete()
-            async_to_sync(channel_layer.group_send)(
-                f"room_{room.id}",
-                {"type": "message_remove", "message_id": message_id},
+            async_to_sync(publish_room_event)(
+                channel_layer,
+                room.id,
+                {"type": "message_remove", "room_id": str(room.id), "message_id": message_id},
             )
             return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -294,7 +461,7 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
             meta.save(update_fields=["deleted_for_me", "updated_at"])
         async_to_sync(channel_layer.group_send)(
             f"user_{request.user.id}",
-            {"type": "message_remove", "message_id": str(message.id)},
+            frame_event({"type": "message_remove", "room_id": str(room.id), "message_id": str(message.id)}),
         )
         return Response(status=status.HTTP_204_NO_CONTENT)
 
@@ -310,17 +477,16 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         channel_layer = get_channel_layer()
 
         if scope == "all":
-            deletable = []
-            for msg in messages:
-                if msg.sender_id == request.user.id or self._is_room_admin(room, request.user):
-                    deletable.append(msg)
+            room_admin = self._is_room_admin(room, request.user)
+            deletable = [msg for msg in messages if room_admin or msg.sender_id == request.user.id]
             deleted_ids = [str(msg.id) for msg in deletable]
             for msg in deletable:
                 msg.delete()
             if deleted_ids:
-                async_to_sync(channel_layer.group_send)(
-                    f"room_{room.id}",
-                    {"type": "message_remove_bulk", "message_ids": deleted_ids},
+                async_to_sync(publish_room_event)(
+                    channel_layer,
+                    room.id,
+                    {"type": "message_remove_bulk", "room_id": str(room.id), "message_ids": deleted_ids},
                 )
             return Response({"deleted": deleted_ids})
 
@@ -336,7 +502,7 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         if removed:
             async_to_sync(channel_layer.group_send)(
                 f"user_{request.user.id}",
-                {"type": "message_remove_bulk", "message_ids": removed},
+                frame_event({"type": "message_remove_bulk", "room_id": str(room.id), "message_ids": removed}),
             )
 
         return Response({"deleted": removed})
@@ -360,9 +526,10 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
 
         payload = _msg_to_dict(message)
         channel_layer = get_channel_layer()
-        async_to_sync(channel_layer.group_send)(
-            f"room_{room.id}",
-            {"type": "message_update", "payload": payload},
+        async_to_sync(publish_room_event)(
+            channel_layer,
+            room.id,
+            {"type": "message_update", "room_id": str(room.id), "payload": payload},
         )
         return Response(payload)
 
@@ -379,7 +546,7 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
             f"user_{request.user.id}",
-            {"type": "message_meta", "payload": payload},
+            frame_event({"type": "message_meta", "room_id": str(message.room_id), "payload": payload}),
         )
         return Response(payload)
 
@@ -393,6 +560,13 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
                 starred=True,
             )
             .select_related("message", "message__sender")
+            .prefetch_related(
+                Prefetch(
+                    "message__reactions",
+                    queryset=MessageReaction.objects.filter(user=request.user),
+                    to_attr="my_reactions",
+                )
+            )
             .order_by("-message__created_at")
         )
 
@@ -418,13 +592,15 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
         channel_layer = get_channel_layer()
         async_to_sync(channel_layer.group_send)(
             f"user_{request.user.id}",
-            {"type": "message_meta", "payload": payload},
+            frame_event({"type": "message_meta", "room_id": str(message.room_id), "payload": payload}),
         )
         return Response(payload)
 
     @action(detail=True, methods=["get"], url_path="info")
     def info(self, request, room_id=None, pk=None):
         message = self._get_message(pk)
+        delivered_ids, read_ids = receipt_lists(message, load_read_states(message.room_id))
+        receipt_users = {str(u.id): u for u in User.objects.filter(id__in=delivered_ids)}
         data = {
             "id": str(message.id),
             "sender": {
@@ -450,17 +626,19 @@ class MessageListCreateViewSet(viewsets.ModelViewSet):
             "forwarded_from": _message_preview(message.forwarded_from) if message.forwarded_from_id else None,
             "delivered_to": [
                 {
-                    "id": user.id,
-                    "name": _user_display(user),
+                    "id": receipt_users[uid].id,
+                    "name": _user_display(receipt_users[uid]),
                 }
-                for user in message.delivered_to.all()
+                for uid in delivered_ids
+                if uid in receipt_users
             ],
             "read_by": [
                 {
-                    "id": user.id,
-                    "name": _user_display(user),
+                    "id": receipt_users[uid].id,
+                    "name": _user_display(receipt_users[uid]),
                 }
-                for user in message.read_by.all()
+                for uid in read_ids
+                if uid in receipt_users
             ],
         }
 
@@ -616,14 +794,16 @@ class GroupInviteViewSet(viewsets.ViewSet):
                 room=invite.room,
                 content=f"{request.user.username} joined the chat via invitation.",
             )
-            async_to_sync(channel_layer.group_send)(
-                f"room_{invite.room_id}",
+            async_to_sync(publish_room_event)(
+                channel_layer,
+                invite.room_id,
                 {
-                    "type": "chat_system_message",
+                    "type": "system_message",
                     "event": "invite_accepted",
                     "message": f"{request.user.username} accepted the invitation.",
                     "room_id": str(invite.room_id),
                     "invited_users": [request.user.username],
+                    "timestamp": str(timezone.now()),
                 },
             )
         else:
@@ -631,15 +811,16 @@ class GroupInviteViewSet(viewsets.ViewSet):
 
         async_to_sync(channel_layer.group_send)(
             f"user_{invite.inviter_id}",
-            {
-                "type": "chat_group_invite",
+            frame_event({
+                "type": "group_invite",
                 "invite_id": str(invite.id),
                 "room_id": str(invite.room_id),
                 "room_name": invite.room.name,
                 "invited_by": invite.inviter.username,
                 "message": f"{request.user.username} {'accepted' if decision == 'accept' else 'declined'} the invitation.",
                 "status": invite.status,
-            },
+                "timestamp": str(timezone.now()),
+            }),
         )
 
         serializer = GroupInviteSerializer(invite, context={"request": request})
@@ -246,6 +246,79 @@ else:
     CHANNEL_LAYERS = {
         "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}
     }
+# Shared cache (membership lookups) so invalidations reach every worker
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+# -------------------------------------------
+# CHAT WEBSOCKET TUNING
+# -------------------------------------------
+# Messages pushed in the initial "history" frame; older pages are fetched
+# lazily with history_before / history_after frames.
+CHAT_HISTORY_WINDOW = int(os.getenv("CHAT_HISTORY_WINDOW", "20"))
+CHAT_HISTORY_PAGE_MAX = int(os.getenv("CHAT_HISTORY_PAGE_MAX", "100"))
+# Default page size of GET /api/chat/rooms/<id>/messages/ (?limit= up to
+# CHAT_HISTORY_PAGE_MAX)
+CHAT_MESSAGES_PAGE_SIZE = int(os.getenv("CHAT_MESSAGES_PAGE_SIZE", "50"))
+# GET /api/chat/rooms/sync/?since= re-checks this many seconds before the
+# token so changes from transactions that committed late are not missed
+CHAT_ROOM_SYNC_OVERLAP_SECONDS = int(os.getenv("CHAT_ROOM_SYNC_OVERLAP_SECONDS", "5"))
+# Most changes one GET /api/chat/rooms/<id>/changes/?since= batch returns
+# (has_more tells the client to ask again); the same overlap applies there
+CHAT_ROOM_CHANGES_BATCH = int(os.getenv("CHAT_ROOM_CHANGES_BATCH", "500"))
+# Delivered/read frames are merged per room over this window (milliseconds)
+CHAT_RECEIPT_FLUSH_MS = int(os.getenv("CHAT_RECEIPT_FLUSH_MS", "300"))
+# Presence lives in the channel layer store (Redis) with a TTL; User /
+# DeviceSession presence columns are written back in batches.
+CHAT_PRESENCE_TTL = int(os.getenv("CHAT_PRESENCE_TTL", "75"))
+CHAT_PRESENCE_FLUSH_SECONDS = int(os.getenv("CHAT_PRESENCE_FLUSH_SECONDS", "60"))
+# Offline is broadcast only if the user stays disconnected this long
+CHAT_PRESENCE_GRACE_SECONDS = int(os.getenv("CHAT_PRESENCE_GRACE_SECONDS", "5"))
+# Room subscriptions allowed on one multiplexed ws/user/ socket
+CHAT_USER_SOCKET_MAX_ROOMS = int(os.getenv("CHAT_USER_SOCKET_MAX_ROOMS", "200"))
+# Offer the compact msgpack subprotocol (tuchati.msgpack.v1); JSON is the default
+CHAT_WS_MSGPACK = os.getenv("CHAT_WS_MSGPACK", "true").lower() == "true"
+# Room member/admin ids are cached per room version; the TTL only bounds
+# staleness if an invalidation is ever lost.
+CHAT_MEMBERSHIP_CACHE_TTL = int(os.getenv("CHAT_MEMBERSHIP_CACHE_TTL", "300"))
+# WebSocket handshakes build the user from token claims; profile fields are
+# cached this long (seconds) and refreshed whenever the user is saved.
+CHAT_WS_PRINCIPAL_TTL = int(os.getenv("CHAT_WS_PRINCIPAL_TTL", "300"))
+# Durable room events kept per room for ?resume_from=<event_id> reconnects
+CHAT_REPLAY_LOG_SIZE = int(os.getenv("CHAT_REPLAY_LOG_SIZE", "500"))
+CHAT_REPLAY_LOG_TTL = int(os.getenv("CHAT_REPLAY_LOG_TTL", "86400"))
+# Per-socket outbound queue caps. On overflow "coalesce" sheds queued typing /
+# presence frames before closing the socket (code 4008); "close" closes at once.
+CHAT_WS_OUTBOUND_MAX_FRAMES = int(os.getenv("CHAT_WS_OUTBOUND_MAX_FRAMES", "256"))
+CHAT_WS_OUTBOUND_MAX_BYTES = int(os.getenv("CHAT_WS_OUTBOUND_MAX_BYTES", str(1024 * 1024)))
+CHAT_WS_OUTBOUND_POLICY = os.getenv("CHAT_WS_OUTBOUND_POLICY", "coalesce")
+# Inbound frame limits per user and frame kind as (tokens per second, burst);
+# see apps.chat.ratelimit.DEFAULT_LIMITS for the kinds. Entries here override.
+CHAT_WS_RATE_LIMITS = {}
+# Socket reaction toggles are coalesced per room for this long, then written
+# in one transaction
+CHAT_REACTION_FLUSH_MS = int(os.getenv("CHAT_REACTION_FLUSH_MS", "200"))
+# Socket messages from all connections on a worker are collected this long
+# (or until the batch is full) and inserted in one transaction
+CHAT_INGEST_FLUSH_MS = int(os.getenv("CHAT_INGEST_FLUSH_MS", "5"))
+CHAT_INGEST_MAX_BATCH = int(os.getenv("CHAT_INGEST_MAX_BATCH", "200"))
+# Payloads of recent sends are cached per (sender, _client_id) so retries are
+# answered without touching the DB; the unique constraint covers the rest.
+CHAT_CLIENT_ID_TTL = int(os.getenv("CHAT_CLIENT_ID_TTL", "600"))
+# Shared secret for scraping /api/admin/metrics/chat.txt without a user
+# session (sent as X-Metrics-Token); empty means admin users only.
+CHAT_METRICS_TOKEN = os.getenv("CHAT_METRICS_TOKEN", "")
+# Rooms with at least this many members get a small room_activity hint per
+# new message instead of the full payload; sockets pull the bodies with
+# {"type": "pull", "after": <event_id>}. 0 disables lazy fan-out.
+CHAT_LAZY_FANOUT_MEMBERS = int(os.getenv("CHAT_LAZY_FANOUT_MEMBERS", "500"))
+# Unread counts for those rooms are pushed to members' user groups at most
+# once per this many milliseconds (the hint only reaches open sockets)
+CHAT_LAZY_UNREAD_PUSH_MS = int(os.getenv("CHAT_LAZY_UNREAD_PUSH_MS", "1000"))
 # -------------------------------------------
 # Jazzmin Admin Customization
 # -------------------------------------------
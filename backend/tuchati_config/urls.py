@@ -11,8 +11,7 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 from django.contrib.staticfiles.urls import staticfiles_urlpatterns
-from rest_framework_simplejwt.views import TokenRefreshView
-from apps.accounts.views_jwt import CustomTokenObtainPairView
+from apps.accounts.views_jwt import CustomTokenObtainPairView, CustomTokenRefreshView
 
 urlpatterns = [
     # -------------------------------
@@ -25,7 +24,7 @@ urlpatterns = [
     # JWT Authentication Endpoints
     # -------------------------------
     path("api/token/", CustomTokenObtainPairView.as_view(), name="token_obtain_pair"),
-    path("api/token/refresh/", TokenRefreshView.as_view(), name="token_refresh"),
+    path("api/token/refresh/", CustomTokenRefreshView.as_view(), name="token_refresh"),
     # -------------------------------
     # Chat system
     # -------------------------------
@@ -1,5 +1,7 @@
 // Single-bind WebSocket with handler ref, typing throttle, heartbeat,
 // and safe reconnects that ALWAYS use a fresh access token.
+// Reconnects pass resume_from (last event_id seen) so the server replays
+// the gap instead of sending a fresh snapshot.
 
 import * as React from 'react'
 import { ensureFreshAccess } from '../shared/api'
@@ -12,7 +14,7 @@ export type ChatSocket = {
   isConnected: boolean
 }
 
-function makeWsUrl(roomId: string, token: string) {
+function makeWsUrl(roomId: string, token: string, resumeFrom = 0) {
   // Accept either VITE_WS_URL or VITE_WS_BASE_URL
   const env: any = import.meta.env
   const base =
@@ -22,6 +24,7 @@ function makeWsUrl(roomId: string, token: string) {
   if (base) {
     const u = new URL(base.replace(/\/+$/, '') + `/ws/chat/${encodeURIComponent(roomId)}/`)
     if (token) u.searchParams.set('token', token)
+    if (resumeFrom > 0) u.searchParams.set('resume_from', String(resumeFrom))
     return u.toString()
   }
 
@@ -30,17 +33,24 @@ function makeWsUrl(roomId: string, token: string) {
   const host = window.location.host
   const u = new URL(`${proto}//${host}/ws/chat/${encodeURIComponent(roomId)}/`)
   if (token) u.searchParams.set('token', token)
+  if (resumeFrom > 0) u.searchParams.set('resume_from', String(resumeFrom))
   return u.toString()
 }
 
 export function useChatSocket(
   roomId: string,
   _tokenIgnored: string,               // we intentionally ignore any prop token
-  onEvent: (data: any) => void
+  onEvent: (data: any) => void,
+  resumeFrom?: () => number            // caller's own cursor; defaults to the last event_id seen
 ): ChatSocket {
   const wsRef = React.useRef<WSLike>(null)
   const cbRef = React.useRef(onEvent)
   cbRef.current = onEvent
+  const resumeRef = React.useRef(resumeFrom)
+  resumeRef.current = resumeFrom
+
+  // last event_id delivered for the current room (hints only announce one)
+  const lastEventRef = React.useRef(0)
 
   const [isConnected, setIsConnected] = React.useState(false)
 
@@ -74,7 +84,8 @@ export function useChatSocket(
     if (!fresh) { setIsConnected(false); return }
 
     try {
-      const ws = new WebSocket(makeWsUrl(roomId, fresh))
+      const after = resumeRef.current ? resumeRef.current() : lastEventRef.current
+      const ws = new WebSocket(makeWsUrl(roomId, fresh, after))
       wsRef.current = ws
 
       ws.onopen = () => {
@@ -108,6 +119,10 @@ export function useChatSocket(
       ws.onmessage = (ev) => {
         let data: any
         try { data = JSON.parse(ev.data) } catch { return }
+        const eventId = data?.type === 'room_activity' ? null : (data?.event_id ?? data?.last_event_id)
+        if (typeof eventId === 'number' && eventId > lastEventRef.current) {
+          lastEventRef.current = eventId
+        }
         cbRef.current?.(data)
       }
     } catch {
@@ -125,6 +140,7 @@ export function useChatSocket(
     wsRef.current = null
     setIsConnected(false)
     retryRef.current = 0
+    lastEventRef.current = 0
     clearTimer(reconnectTimer)
     clearTimer(heartbeatTimer)
 
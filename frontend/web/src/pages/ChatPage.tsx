@@ -88,20 +88,44 @@ export default function ChatPage() {
     }
   }, [isMobile, hasRoomOpen])
 
+  // room-list delta sync: the first call returns every room (reset), later
+  // calls only what changed since the last token plus removed room ids
+  const syncTokenRef = React.useRef<string | null>(null)
+
+  React.useEffect(() => {
+    syncTokenRef.current = null
+  }, [token])
+
   const loadRooms = React.useCallback(async () => {
     if (!token) return
     setLoading(true)
     try {
-      const r = await apiFetch('/api/chat/rooms/', {
+      const since = syncTokenRef.current
+      const r = await apiFetch(`/api/chat/rooms/sync/${since ? `?since=${encodeURIComponent(since)}` : ''}`, {
         headers: { Authorization: `Bearer ${token}` },
       })
-      const data = r.ok ? await r.json() : []
-      const mapped = (Array.isArray(data) ? data : []).map((room: Room) => ({
+      if (!r.ok) return
+      const data = await r.json()
+      const mapped = (Array.isArray(data?.rooms) ? data.rooms : []).map((room: Room) => ({
         ...room,
         is_archived: room.is_archived ?? archivedSet.has(String(room.id)),
         is_muted: room.is_muted ?? mutedSet.has(String(room.id)),
       }))
-      setRooms(mapped)
+      if (data.reset) {
+        setRooms(mapped)
+      } else {
+        const removed = new Set<string>((data.removed || []).map(String))
+        const changed = new Map<string, Room>(mapped.map((room: Room) => [String(room.id), room]))
+        setRooms(prev => {
+          const known = new Set(prev.map(room => String(room.id)))
+          const added = mapped.filter((room: Room) => !known.has(String(room.id)))
+          const kept = prev
+            .filter(room => !removed.has(String(room.id)))
+            .map(room => changed.get(String(room.id)) ?? room)
+          return [...added, ...kept]
+        })
+      }
+      syncTokenRef.current = data.token ?? null
     } finally {
       setLoading(false)
     }
@@ -240,6 +240,13 @@ export default function ChatRoom() {
   const deliveredAckRef = React.useRef<Set<string>>(new Set())
   const readAckRef = React.useRef<Set<string>>(new Set())
   const stickToBottomRef = React.useRef(true)
+  // lazy fan-out: large rooms send room_activity hints and we pull the bodies
+  const lastEventIdRef = React.useRef(0)
+  const pullRef = React.useRef({ inFlight: false, again: false })
+  const socketSendRef = React.useRef<(payload: any) => void>(() => {})
+  // keyset paging: scrolling near the top loads ?before=<cursor>
+  const olderRef = React.useRef({ cursor: null as string | null, hasMore: false, loading: false })
+  const prependHeightRef = React.useRef<number | null>(null)
 
   const selectedSet = React.useMemo(() => new Set(selectedIds), [selectedIds])
 
@@ -478,6 +485,7 @@ export default function ChatRoom() {
     const text = raw.content ?? raw.message ?? raw.text ?? raw.body ?? ''
     const senderId = raw.sender?.id ?? raw.sender_id ?? raw.sender ?? null
     const reactions = raw.reactions ?? {}
+    const reactionCounts = raw.reaction_counts ?? {}
     const attachment = resolveUrl(raw.attachment ?? raw.file ?? null)
     const audio = resolveUrl(raw.audio ?? raw.voice_note ?? raw.voice ?? null)
     const attachmentInfo = raw.attachment_info ?? null
@@ -510,6 +518,7 @@ export default function ChatRoom() {
       created_at: raw.created_at ?? raw.timestamp ?? new Date().toISOString(),
       is_me: !!senderId && senderId === (user?.id as any),
       reactions,
+      reaction_counts: reactionCounts,
       reply_to: mapRef(raw.reply_to ?? raw.reply),
       forwarded_from: mapRef(raw.forwarded_from ?? raw.forwarded),
       pinned: !!raw.pinned,
@@ -984,6 +993,11 @@ export default function ChatRoom() {
           .filter(Boolean)
         setMessages(list as any[])
         setHistoryLoaded(true)
+        olderRef.current = {
+          cursor: data?.before_cursor ?? null,
+          hasMore: !!data?.has_more,
+          loading: false,
+        }
       } catch {
         /* ignore network failure here; websocket history will recover */
       }
@@ -991,6 +1005,37 @@ export default function ChatRoom() {
     return () => { cancelled = true }
   }, [normalizeMsg, roomId, token])
 
+  const loadOlder = React.useCallback(async () => {
+    const page = olderRef.current
+    if (!roomId || !token || page.loading || !page.hasMore || !page.cursor) return
+    page.loading = true
+    try {
+      const res = await apiFetch(
+        `/api/chat/rooms/${roomId}/messages/?before=${encodeURIComponent(page.cursor)}`,
+        { headers: { Authorization: `Bearer ${token}` } },
+      )
+      if (!res.ok) return
+      const data = await res.json().catch(() => null)
+      // the room changed while this page was loading
+      if (!data || olderRef.current !== page) return
+      page.cursor = data.before_cursor ?? null
+      page.hasMore = !!data.has_more
+      const older = (data.results ?? [])
+        .map((item: any) => normalizeMsg(item))
+        .filter(Boolean)
+      if (!older.length) return
+      prependHeightRef.current = listRef.current?.scrollHeight ?? null
+      setMessages(prev => {
+        const seen = new Set(prev.map((m: any) => String(m.id)))
+        return [...older.filter((m: any) => !seen.has(String(m.id))), ...prev]
+      })
+    } catch {
+      /* try again on the next scroll */
+    } finally {
+      page.loading = false
+    }
+  }, [normalizeMsg, roomId, token])
+
   const openMenu = React.useCallback((message: any, event: React.MouseEvent) => {
     event.stopPropagation()
     setMenuState({ open: true, x: event.clientX, y: event.clientY, message })
@@ -1050,11 +1095,60 @@ export default function ChatRoom() {
   }, [handleForward, mergeMessage])
 
   // Socket & incoming events
+  const pullEvents = React.useCallback(() => {
+    pullRef.current = { inFlight: true, again: false }
+    socketSendRef.current({ type: 'pull', after: lastEventIdRef.current })
+  }, [])
+
   const handleIncoming = React.useCallback((data: any) => {
+    // a hint's event_id is what the pull has to fetch, and in a lazy room our
+    // own ack can overtake earlier events, so neither moves the cursor
+    const ownAck = data.type === 'message' && user?.id != null && String(data.sender_id) === String(user.id)
+    const eventId = data.type === 'room_activity' || ownAck ? null : (data.event_id ?? data.last_event_id)
+    if (typeof eventId === 'number' && eventId > lastEventIdRef.current) {
+      lastEventIdRef.current = eventId
+    }
     switch (data.type) {
+      case 'room_activity': {
+        if (typeof data.event_id === 'number' && data.event_id <= lastEventIdRef.current) return
+        if (pullRef.current.inFlight) {
+          pullRef.current.again = true
+        } else {
+          pullEvents()
+        }
+        return
+      }
+      case 'unread': {
+        // pushed for every room the user is in; the open room is being read
+        if (String(data.room_id) !== String(roomId)) {
+          updateRoomUnread?.(data.room_id, Number(data.count) || 0)
+        }
+        return
+      }
+      case 'resumed': {
+        // the replay is capped; fetch the rest of the gap
+        if (data.has_more) pullEvents()
+        return
+      }
+      case 'pulled': {
+        if (data.has_more || pullRef.current.again) {
+          pullEvents()
+        } else {
+          pullRef.current = { inFlight: false, again: false }
+        }
+        return
+      }
       case 'history': {
+        if (!historyLoaded && data.before_cursor) {
+          olderRef.current = { cursor: data.before_cursor, hasMore: !!data.has_more, loading: false }
+        }
+        if (historyLoaded) {
+          // reconnect the server could not resume: fold the fresh snapshot in
+          ;(data.messages || []).forEach((item: any) => mergeMessage(item))
+          return
+        }
         setMessages(prev => {
-          if (historyLoaded || prev.length) return prev
+          if (prev.length) return prev
           const list = (data.messages || [])
             .map((item: any) => normalizeMsg(item))
             .filter(Boolean)
@@ -1067,7 +1161,7 @@ export default function ChatRoom() {
         setTypingUser(data.typing ? (data.from_user || t('chatRoom.header.someone')) : null)
         return
       case 'reaction': {
-        const { message_id, emoji, user_id, op } = data
+        const { message_id, emoji, user_id, op, count } = data
         const uid = String(user_id)
         setMessages(prev => prev.map((m: any) => {
           if ((m.id ?? m._client_id) !== message_id) return m
@@ -1085,6 +1179,9 @@ export default function ChatRoom() {
             next[emoji] = Array.from(set)
           }
           const updated = { ...m, reactions: next }
+          if (typeof count === 'number') {
+            updated.reaction_counts = { ...(m.reaction_counts || {}), [emoji]: count }
+          }
           if (updated.is_me) {
             updated.status = computeStatus(updated)
           }
@@ -1093,23 +1190,26 @@ export default function ChatRoom() {
         return
       }
       case 'delivery': {
-        const { status: deliveryStatus, ids, user_id } = data
-        const actorId = user_id ? String(user_id) : null
-        if (!Array.isArray(ids) || ids.length === 0 || !actorId) return
+        // Server coalesces receipts per room: { receipts: [{ status, user_id, ids }] }
+        const receipts = (Array.isArray(data.receipts) ? data.receipts : [data])
+          .filter((r: any) => r && r.user_id && Array.isArray(r.ids) && r.ids.length > 0)
+        if (receipts.length === 0) return
         setMessages(prev => prev.map((m: any) => {
           const messageId = m.id ?? m._client_id
-          if (!ids.includes(messageId)) return m
+          const matching = receipts.filter((r: any) => r.ids.includes(messageId))
+          if (matching.length === 0) return m
           const next = { ...m }
           const deliveredSet = new Set<string>(Array.isArray(next.delivered_to) ? next.delivered_to : [])
           const readSet = new Set<string>(Array.isArray(next.read_by) ? next.read_by : [])
-          if (deliveryStatus === 'delivered' || deliveryStatus === 'read') {
-            deliveredSet.add(actorId)
-            next.delivered_to = Array.from(deliveredSet)
-            if (deliveryStatus === 'read') {
-              readSet.add(actorId)
-              next.read_by = Array.from(readSet)
+          matching.forEach((r: any) => {
+            const actorId = String(r.user_id)
+            if (r.status === 'delivered' || r.status === 'read') {
+              deliveredSet.add(actorId)
+              if (r.status === 'read') readSet.add(actorId)
             }
-          }
+          })
+          next.delivered_to = Array.from(deliveredSet)
+          next.read_by = Array.from(readSet)
           next.status = computeStatus(next)
           return next
         }))
@@ -1142,9 +1242,15 @@ export default function ChatRoom() {
         return
       }
     }
-  }, [computeStatus, historyLoaded, mergeMessage, normalizeMsg, playReceive, removeMessagesLocal, t, user?.id])
+  }, [computeStatus, historyLoaded, mergeMessage, normalizeMsg, playReceive, pullEvents, removeMessagesLocal, roomId, t, updateRoomUnread, user?.id])
 
-  const { sendMessage, sendTyping } = useChatSocket(roomId || '', token || '', handleIncoming)
+  const { sendMessage, sendTyping } = useChatSocket(
+    roomId || '',
+    token || '',
+    handleIncoming,
+    () => lastEventIdRef.current,
+  )
+  socketSendRef.current = sendMessage
 
   const scrollToBottom = React.useCallback((behavior: ScrollBehavior = 'auto') => {
     const el = listRef.current
@@ -1158,8 +1264,21 @@ export default function ChatRoom() {
 
   React.useEffect(() => {
     stickToBottomRef.current = true
+    lastEventIdRef.current = 0
+    pullRef.current = { inFlight: false, again: false }
+    olderRef.current = { cursor: null, hasMore: false, loading: false }
+    prependHeightRef.current = null
   }, [roomId])
 
+  React.useLayoutEffect(() => {
+    // keep the viewport on the same message after older ones are prepended
+    const el = listRef.current
+    const previousHeight = prependHeightRef.current
+    if (!el || previousHeight === null) return
+    prependHeightRef.current = null
+    el.scrollTop += el.scrollHeight - previousHeight
+  }, [messages])
+
   React.useEffect(() => {
     const last = messages[messages.length - 1]
     const lastIsMine = !!last && (last.is_me || last.sender_id === user?.id)
@@ -1175,11 +1294,12 @@ export default function ChatRoom() {
       const threshold = 120
       const distance = el.scrollHeight - el.scrollTop - el.clientHeight
       stickToBottomRef.current = distance <= threshold
+      if (el.scrollTop <= threshold) loadOlder()
     }
     handleScroll()
     el.addEventListener('scroll', handleScroll)
     return () => el.removeEventListener('scroll', handleScroll)
-  }, [roomId])
+  }, [loadOlder, roomId])
 
   // send text
   const mkClientId = () => `cid-${Date.now()}-${Math.random().toString(36).slice(2)}`
@@ -2179,7 +2299,7 @@ export default function ChatRoom() {
                 {reactionPairs.length > 0 && (
                   <div className="rxn-chips">
                     {reactionPairs.map(([emoji, arr]: any) => (
-                      <span key={`${emoji}`} className="rxn-chip">{emoji} {arr.length}</span>
+                      <span key={`${emoji}`} className="rxn-chip">{emoji} {m.reaction_counts?.[emoji] ?? arr.length}</span>
                     ))}
                   </div>
                 )}